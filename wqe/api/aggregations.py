@@ -0,0 +1,359 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+# Наборы данных для агрегаций: индекс, поле времени и имена полей для группировки
+DATASETS = {
+    # Пишет наш API (BulkWriter), поля замаплены как keyword
+    "security": {
+        "index": "security-logs-*",
+        "time_field": "timestamp",
+        "fields": {
+            "bert_class": "bert_class",
+            "source": "source",
+            "log_type": "log_type",
+            "severity": "severity"
+        },
+        "anomaly_field": "is_anomaly"
+    },
+    # Пишет Vector (динамический маппинг — строки доступны через .keyword)
+    "app": {
+        "index": "app-logs-*",
+        "time_field": "timestamp",
+        "fields": {
+            "source": "source.keyword",
+            "level": "level.keyword",
+            "host": "host.keyword"
+        },
+        "anomaly_field": None
+    }
+}
+
+# Поддерживаемые интервалы timeseries
+INTERVALS = {"1m", "5m", "15m", "1h", "6h", "1d"}
+
+# Закрытый бакет для кэша — UTC сутки (все интервалы выше делят их нацело)
+CLOSED_BUCKET_SECONDS = 86400
+
+# Сутки считаются закрытыми не сразу после полуночи: события с временем прошлых суток
+# еще доезжают (очереди агентов, bulk-запись, refresh индекса)
+CLOSED_BUCKET_GRACE_SECONDS = int(os.getenv("AGGREGATION_CLOSE_GRACE_SECONDS", 3600))
+
+
+class AggregationCache:
+    """LRU кэш результатов агрегаций с TTL"""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: int = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self.misses += 1
+            if entry is not None:
+                del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: str, value: Any):
+        self.entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+class AggregationService:
+    """
+    Статистика за произвольный период через terms/date_histogram агрегации в OpenSearch/Elasticsearch.
+
+    Диапазон делится на закрытые UTC сутки (их результат уже не меняется, кэшируется по ключу
+    (запрос, сутки) и переиспользуется скользящими диапазонами вроде "последние 30 дней")
+    и неполные края, которые всегда считаются заново.
+
+    terms по суткам — это топ top_size каждых суток; сумма таких топов точна, только если
+    ни в одних сутках список не обрезан (sum_other_doc_count == 0). Иначе поле пересчитывается
+    одним terms запросом за весь диапазон.
+    """
+
+    def __init__(self, clients: Dict[str, Any], cache: Optional[AggregationCache] = None, top_size: int = 50):
+        self.clients = clients
+        self.cache = cache or AggregationCache()
+        self.top_size = top_size
+
+    async def stats(
+        self,
+        dataset: str,
+        start: datetime,
+        end: datetime,
+        group_by: List[str],
+        filters: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Счетчики по полям group_by за период"""
+        config = self._dataset(dataset)
+        aggs = self._terms_aggs(config, group_by)
+        if config["anomaly_field"]:
+            aggs["anomalies"] = {"filter": {"term": {config["anomaly_field"]: True}}}
+
+        parts, cached = await self._run_split(dataset, config, start, end, aggs, filters)
+
+        result = {"total": 0, "cached": cached}
+        for group in group_by:
+            result[f"by_{group}"] = {}
+        if config["anomaly_field"]:
+            result["anomalies"] = 0
+
+        truncated = set()
+        for part in parts:
+            result["total"] += part["total"]
+            for group in group_by:
+                counts = result[f"by_{group}"]
+                terms = part["aggs"][f"by_{group}"]
+                for bucket in terms["buckets"]:
+                    counts[bucket["key"]] = counts.get(bucket["key"], 0) + bucket["doc_count"]
+                if terms.get("sum_other_doc_count"):
+                    truncated.add(group)
+            if config["anomaly_field"]:
+                result["anomalies"] += part["aggs"]["anomalies"]["doc_count"]
+
+        if truncated:
+            # Значение вне топа одних суток потеряло бы там свои события — считаем поле целиком
+            groups = [group for group in group_by if group in truncated]
+            whole = await self._search(dataset, config, start, min(end, datetime.utcnow()), self._terms_aggs(config, groups), filters)
+            result["truncated"] = {}
+            for group in groups:
+                terms = whole["aggs"][f"by_{group}"]
+                result[f"by_{group}"] = {bucket["key"]: bucket["doc_count"] for bucket in terms["buckets"]}
+                result["truncated"][group] = {
+                    "sum_other_doc_count": terms.get("sum_other_doc_count", 0),
+                    "doc_count_error_upper_bound": terms.get("doc_count_error_upper_bound", 0)
+                }
+            result["cached"] = False
+        return result
+
+    async def timeseries(
+        self,
+        dataset: str,
+        start: datetime,
+        end: datetime,
+        interval: str,
+        group_by: Optional[str] = None,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Количество событий по интервалам времени (опционально с разбивкой по полю)"""
+        config = self._dataset(dataset)
+        if interval not in INTERVALS:
+            raise ValueError(f"Unsupported interval: {interval}")
+
+        histogram = {
+            "date_histogram": {
+                "field": config["time_field"],
+                "fixed_interval": interval,
+                "min_doc_count": 0
+            }
+        }
+        if group_by:
+            histogram["aggs"] = self._terms_aggs(config, [group_by])
+        aggs = {"timeline": histogram}
+
+        parts, cached = await self._run_split(dataset, config, start, end, aggs, filters)
+
+        # Части не пересекаются по времени; бакет на стыке частей просто суммируем
+        points: Dict[str, Dict[str, Any]] = {}
+        for part in parts:
+            for bucket in part["aggs"]["timeline"]["buckets"]:
+                point = points.setdefault(bucket["key_as_string"], {"timestamp": bucket["key_as_string"], "count": 0})
+                point["count"] += bucket["doc_count"]
+                if group_by:
+                    by_group = point.setdefault(f"by_{group_by}", {})
+                    for sub in bucket[f"by_{group_by}"]["buckets"]:
+                        by_group[sub["key"]] = by_group.get(sub["key"], 0) + sub["doc_count"]
+
+        return {
+            "interval": interval,
+            "points": sorted(points.values(), key=lambda p: p["timestamp"]),
+            "cached": cached
+        }
+
+    def _dataset(self, dataset: str) -> Dict[str, Any]:
+        if dataset not in DATASETS:
+            raise ValueError(f"Unknown dataset: {dataset}")
+        return DATASETS[dataset]
+
+    def _terms_aggs(self, config: Dict[str, Any], group_by: List[str]) -> Dict[str, Any]:
+        aggs = {}
+        for group in group_by:
+            if group not in config["fields"]:
+                raise ValueError(f"Unsupported group_by field: {group}")
+            aggs[f"by_{group}"] = {"terms": {"field": config["fields"][group], "size": self.top_size}}
+        return aggs
+
+    async def _run_split(
+        self,
+        dataset: str,
+        config: Dict[str, Any],
+        start: datetime,
+        end: datetime,
+        aggs: Dict[str, Any],
+        filters: Optional[Dict[str, Any]]
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Полные сутки внутри диапазона, закончившиеся больше CLOSED_BUCKET_GRACE_SECONDS назад,
+        уже закрыты — берем их из кэша, а недостающие достаем одним запросом с разбивкой по
+        суткам. Неполные края и еще не закрытые сутки считаем заново.
+        """
+        now = datetime.utcnow()
+        end = min(end, now)
+        first_full = _ceil(start, CLOSED_BUCKET_SECONDS)
+        last_full = min(
+            _floor(end, CLOSED_BUCKET_SECONDS),
+            _floor(now - timedelta(seconds=CLOSED_BUCKET_GRACE_SECONDS), CLOSED_BUCKET_SECONDS)
+        )
+
+        if first_full >= last_full:
+            return [await self._search(dataset, config, start, end, aggs, filters)], False
+
+        fresh_ranges = []
+        if start < first_full:
+            fresh_ranges.append((start, first_full))
+        if last_full < end:
+            fresh_ranges.append((last_full, end))
+        fresh = [self._search(dataset, config, lo, hi, aggs, filters) for lo, hi in fresh_ranges]
+
+        days = []
+        day = first_full
+        while day < last_full:
+            days.append(day)
+            day += timedelta(seconds=CLOSED_BUCKET_SECONDS)
+
+        parts = []
+        missing = []
+        for day in days:
+            part = self.cache.get(self._cache_key(dataset, day, aggs, filters))
+            if part is None:
+                missing.append(day)
+            else:
+                parts.append(part)
+
+        tasks = list(fresh)
+        if missing:
+            tasks.append(self._search_days(dataset, config, missing[0], missing[-1], aggs, filters))
+        results = await asyncio.gather(*tasks)
+
+        if missing:
+            by_day = results.pop()
+            missing_set = set(missing)
+            for day, part in by_day.items():
+                # Повторный запрос мог захватить и уже закэшированные сутки между пропусками
+                self.cache.set(self._cache_key(dataset, day, aggs, filters), part)
+                if day in missing_set:
+                    parts.append(part)
+        parts.extend(results)
+        return parts, not missing
+
+    async def _search_days(
+        self,
+        dataset: str,
+        config: Dict[str, Any],
+        first_day: datetime,
+        last_day: datetime,
+        aggs: Dict[str, Any],
+        filters: Optional[Dict[str, Any]]
+    ) -> Dict[datetime, Dict[str, Any]]:
+        """Один запрос за несколько закрытых суток: те же агрегации внутри date_histogram по дням"""
+        end = last_day + timedelta(seconds=CLOSED_BUCKET_SECONDS)
+        by_day_aggs = {
+            "closed_days": {
+                "date_histogram": {
+                    "field": config["time_field"],
+                    "fixed_interval": "1d",
+                    "min_doc_count": 0,
+                    "extended_bounds": {"min": first_day.isoformat(), "max": last_day.isoformat()}
+                },
+                "aggs": aggs
+            }
+        }
+        response = await self._search(dataset, config, first_day, end, by_day_aggs, filters)
+
+        parts = {}
+        day = first_day
+        while day < end:
+            parts[day] = {"total": 0, "aggs": _empty_aggs(aggs)}
+            day += timedelta(seconds=CLOSED_BUCKET_SECONDS)
+        for bucket in response["aggs"].get("closed_days", {}).get("buckets", []):
+            day = datetime.utcfromtimestamp(bucket["key"] / 1000)
+            parts[day] = {"total": bucket["doc_count"], "aggs": {name: bucket[name] for name in aggs}}
+        return parts
+
+    async def _search(
+        self,
+        dataset: str,
+        config: Dict[str, Any],
+        start: datetime,
+        end: datetime,
+        aggs: Dict[str, Any],
+        filters: Optional[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        query_filters = [{
+            "range": {config["time_field"]: {"gte": start.isoformat(), "lt": end.isoformat()}}
+        }]
+        for field, value in (filters or {}).items():
+            if value is not None:
+                query_filters.append({"term": {config["fields"].get(field, field): value}})
+
+        body = {
+            "size": 0,
+            "track_total_hits": True,
+            "query": {"bool": {"filter": query_filters}},
+            "aggs": aggs
+        }
+        response = await self.clients[dataset].search(index=config["index"], body=body, ignore_unavailable=True)
+        return {
+            "total": response["hits"]["total"]["value"],
+            "aggs": response.get("aggregations", {})
+        }
+
+    @staticmethod
+    def _cache_key(dataset: str, day: datetime, aggs: Dict, filters: Optional[Dict]) -> str:
+        """Ключ кэша: (запрос, закрытый бакет)"""
+        raw = json.dumps([dataset, day.isoformat(), aggs, filters or {}], sort_keys=True)
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _epoch(dt: datetime) -> int:
+    return int(dt.replace(tzinfo=timezone.utc).timestamp())
+
+
+def _floor(dt: datetime, seconds: int) -> datetime:
+    return datetime.utcfromtimestamp(_epoch(dt) // seconds * seconds)
+
+
+def _ceil(dt: datetime, seconds: int) -> datetime:
+    return datetime.utcfromtimestamp(-(-_epoch(dt) // seconds) * seconds)
+
+
+def _empty_aggs(aggs: Dict[str, Any]) -> Dict[str, Any]:
+    """Пустой ответ агрегаций той же формы — для суток без событий"""
+    empty = {}
+    for name, agg in aggs.items():
+        empty[name] = {"doc_count": 0} if "filter" in agg else {"buckets": []}
+    return empty
@@ -0,0 +1,71 @@
+"""Классы BERT классификатора логов (rahulm-selector/log-classifier-BERT-v1)"""
+
+# Классы аномалий
+ANOMALY_CLASSES = {
+    "0": "ALERT_IFD_CHANGE",
+    "1": "ASIC_ALARM",
+    "2": "BGP_INFO",
+    "3": "INTERFACE_FLAP",
+    "4": "InterfaceEvent",
+    "5": "LLDP_NBR_DOWN",
+    "6": "MPLS_CONFIG_CHANGE",
+    "7": "MPLS_INTF_MAX_LABELS_ERROR",
+    "8": "MPLS_PATH_STATUS",
+    "9": "OAM_ADJACENCY_CFM",
+    "10": "OAM_CFM",
+    "11": "OAM_GENERAL",
+    "12": "OSPF_NBRDOWN",
+    "13": "RPD_RSVP_BYPASS_DOWN",
+    "14": "RPD_RSVP_BYPASS_UP",
+    "15": "RSVP_NBRDOWN",
+    "16": "SMIC_SFPP_FAILED",
+    "17": "SNMPD_AUTH_FAILURE",
+    "18": "VRRPD_MISSING_VIP",
+    "19": "aaa",
+    "20": "bfd_change",
+    "21": "bfd_down",
+    "22": "bfd_flap",
+    "23": "bfd_sess_create",
+    "24": "bfd_sess_destroy",
+    "25": "bfd_state_change",
+    "26": "bgp_nbr_down",
+    "27": "bgp_nbr_reset",
+    "28": "bgp_state_change",
+    "29": "bgp_updown",
+    "30": "cli_cmd_executed",
+    "31": "config_event",
+    "32": "critical_log_event",
+    "33": "demon_timeouts",
+    "34": "eigrp",
+    "35": "firewall_critical",
+    "36": "firewall_high",
+    "37": "firewall_low",
+    "38": "firewall_medium",
+    "39": "if_down",
+    "40": "if_flap",
+    "41": "if_lag",
+    "42": "if_security",
+    "43": "if_updown",
+    "44": "neighbor_updown",
+    "45": "ospf_neigh_state_flap",
+    "46": "port_link_updown",
+    "47": "power_change",
+    "48": "ptp",
+    "49": "rt_entry_add_msg_proc",
+    "50": "rt_entry_failed",
+    "51": "sfp_link_power",
+    "52": "ssh",
+    "53": "stp",
+    "54": "stp_change",
+    "55": "system_reboot",
+    "56": "ui_commit_progress",
+    "57": "ui_config_audit",
+    "58": "vrrp_vlan"
+}
+
+# Критические классы, которые считаются аномалиями
+CRITICAL_ANOMALY_CLASSES = {
+    "1", "2", "3", "5", "6", "7", "8", "12", "13", "15", "16", "17",
+    "20", "21", "22", "25", "26", "27", "28", "29", "32", "35", "36",
+    "39", "40", "42", "45", "50", "52", "54", "55"
+}
@@ -0,0 +1,211 @@
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+from elastic import es_client
+
+
+class BulkWriter:
+    """
+    Буферизованная запись в Elasticsearch через _bulk API.
+
+    Ingest только кладет документ в очередь (O(1), без ожидания сети),
+    фоновая задача сбрасывает пачки по размеру или по таймеру
+    и повторяет частично неуспешные документы.
+    """
+
+    # Статусы, при которых документ имеет смысл отправить повторно (и 404 у update — см. _flush)
+    RETRYABLE_STATUSES = {429, 502, 503, 504}
+
+    def __init__(
+        self,
+        client: Any,
+        batch_size: int = 5000,
+        flush_interval: float = 1.0,
+        max_queue: int = 200000,
+        max_retries: int = 3,
+        concurrency: int = 2
+    ):
+        self.client = client
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+
+        self.queue: deque = deque()
+        self._wakeup = asyncio.Event()
+        self._inflight = asyncio.Semaphore(concurrency)
+        self._flushes: set = set()
+        self._task: Optional[asyncio.Task] = None
+        self._running = False
+
+        self.stats_counters = {
+            "enqueued": 0,
+            "indexed": 0,
+            "failed": 0,
+            "dropped": 0,
+            "retried": 0,
+            "flushes": 0
+        }
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def enqueue(self, index: str, doc_id: str, document: Dict[str, Any]) -> bool:
+        """Положить документ в буфер. Не блокирует; при переполнении документ отбрасывается"""
+        if len(self.queue) >= self.max_queue:
+            self.stats_counters["dropped"] += 1
+            return False
+
+        self.queue.append((index, doc_id, document, 0, "index"))
+        self.stats_counters["enqueued"] += 1
+        if len(self.queue) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def enqueue_update(self, index: str, doc_id: str, fields: Dict[str, Any]) -> bool:
+        """Частичное обновление уже записанного документа (bulk update, без переиндексации)"""
+        if len(self.queue) >= self.max_queue:
+            self.stats_counters["dropped"] += 1
+            return False
+
+        self.queue.append((index, doc_id, {"doc": fields}, 0, "update"))
+        self.stats_counters["enqueued"] += 1
+        return True
+
+    def start(self):
+        if self._task is None:
+            self._running = True
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановка с финальным сбросом буфера"""
+        self._running = False
+        self._wakeup.set()
+        if self._task:
+            await self._task
+            self._task = None
+        while self.queue:
+            await self._flush(self._take_batch())
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        flushes = self.stats_counters["flushes"]
+        return {
+            **self.stats_counters,
+            "queue_depth": len(self.queue),
+            "inflight_flushes": len(self._flushes),
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "avg_flush_ms": round(self._total_flush_ms / flushes, 2) if flushes else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 2)
+        }
+
+    async def _run(self):
+        while self._running:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            while self.queue and self._running:
+                # Ждем свободный слот, чтобы не плодить бесконечно параллельных запросов
+                await self._inflight.acquire()
+                task = asyncio.create_task(self._flush_and_release(self._take_batch()))
+                self._flushes.add(task)
+                task.add_done_callback(self._flushes.discard)
+                if len(self.queue) < self.batch_size:
+                    break
+
+    def _take_batch(self) -> List[Tuple]:
+        batch = []
+        queue = self.queue
+        while queue and len(batch) < self.batch_size:
+            batch.append(queue.popleft())
+        return batch
+
+    async def _flush_and_release(self, batch: List[Tuple]):
+        try:
+            await self._flush(batch)
+        finally:
+            self._inflight.release()
+
+    async def _flush(self, batch: List[Tuple]):
+        if not batch:
+            return
+
+        # Сериализация пачки до batch_size документов — миллисекунды CPU, не в цикле событий
+        body = await asyncio.to_thread(_ndjson, batch)
+
+        started = time.perf_counter()
+        try:
+            response = await self.client.bulk(operations=body)
+        except Exception as e:
+            print(f"Elasticsearch bulk error: {e}")
+            self._record_flush(started)
+            await self._backoff(batch)
+            self._requeue(batch)
+            return
+        self._record_flush(started)
+
+        if not response.get("errors"):
+            self.stats_counters["indexed"] += len(batch)
+            return
+
+        retry: List[Tuple] = []
+        for item, entry in zip(response["items"], batch):
+            result = item.get(entry[4], {})
+            status = result.get("status", 500)
+            if status < 300:
+                self.stats_counters["indexed"] += 1
+            elif status in self.RETRYABLE_STATUSES or (status == 404 and entry[4] == "update"):
+                # update мог обогнать свой index: тот в параллельном сбросе или повторяется после 429
+                retry.append(entry)
+            else:
+                self.stats_counters["failed"] += 1
+                print(f"Elasticsearch bulk item rejected: {result.get('error')}")
+        if retry:
+            await self._backoff(retry)
+            self._requeue(retry)
+
+    async def _backoff(self, batch: List[Tuple]):
+        """Экспоненциальная пауза перед повтором — держим слот, это и есть backpressure"""
+        attempt = max(entry[3] for entry in batch)
+        await asyncio.sleep(min(0.1 * 2 ** attempt, 5.0))
+
+    def _requeue(self, batch: List[Tuple]):
+        """Повтор документов с ограничением попыток (в начало очереди, чтобы сохранить порядок)"""
+        for index, doc_id, document, attempt, action in reversed(batch):
+            if attempt + 1 > self.max_retries:
+                self.stats_counters["failed"] += 1
+                continue
+            self.queue.appendleft((index, doc_id, document, attempt + 1, action))
+            self.stats_counters["retried"] += 1
+
+    def _record_flush(self, started: float):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self._total_flush_ms += elapsed_ms
+        self.stats_counters["flushes"] += 1
+
+
+def _ndjson(batch: List[Tuple]) -> str:
+    """NDJSON собираем сами — так дешевле, чем сериализация клиентом по одному dict"""
+    lines = []
+    for index, doc_id, document, _, action in batch:
+        lines.append(json.dumps({action: {"_index": index, "_id": doc_id}}))
+        lines.append(json.dumps(document, default=str))
+    return "\n".join(lines) + "\n"
+
+
+# Глобальный инстанс writer'а для ingest
+bulk_writer = BulkWriter(
+    es_client,
+    batch_size=int(os.getenv("ES_BULK_BATCH_SIZE", 5000)),
+    flush_interval=float(os.getenv("ES_BULK_FLUSH_SECONDS", 1.0)),
+    max_queue=int(os.getenv("ES_BULK_MAX_QUEUE", 200000))
+)
@@ -0,0 +1,286 @@
+"""
+Каскад классификации: быстрая линейная модель перед BERT.
+
+Большая часть трафика — частые безопасные классы (cli_cmd_executed, ui_commit_progress,
+rt_entry_add_msg_proc), для которых 110M параметров BERT не нужны. Первая ступень —
+мультиклассовая логистическая регрессия по хэшированным словам и биграммам, обученная на
+метках самого BERT (cascade_tool.py train). Ее ответ принимается, только если модель уверена
+(порог по классу подобран на валидации под нужное согласие с BERT) и суммарная вероятность
+критичных классов мала; все неуверенное и потенциально критичное уходит в BERT.
+
+Модель — два numpy массива в .npz (веса признаков и смещения) плюс пороги; инференс — сумма
+строк весов по индексам признаков, без sklearn и torch. Небольшая доля принятых ответов
+(CASCADE_AUDIT_RATE) все равно проверяется BERT — так видно согласие на живом трафике.
+"""
+import os
+import random
+import re
+import tempfile
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from metrics import CASCADE_AUDIT_TOTAL, CLASSIFICATIONS_TOTAL
+
+CASCADE_ENABLED = os.getenv("CASCADE_ENABLED", "true").lower() == "true"
+CASCADE_MODEL_PATH = os.getenv("CASCADE_MODEL_PATH", "/app/models/cascade/fast_classifier.npz")
+# Суммарная вероятность критичных классов, начиная с которой лог всегда идет в BERT
+CASCADE_CRITICAL_PROB = float(os.getenv("CASCADE_CRITICAL_PROB", 0.05))
+CASCADE_AUDIT_RATE = float(os.getenv("CASCADE_AUDIT_RATE", 0.01))
+CASCADE_RELOAD_SECONDS = float(os.getenv("CASCADE_RELOAD_SECONDS", 30))
+
+# 2^16 хэшей x 59 классов float32 — около 15 МБ
+HASH_FEATURES = 1 << 16
+# Класс без порога (мало примеров на валидации) первая ступень не принимает никогда
+NEVER_ACCEPT = 2.0
+BIAS_LEARNING_RATE = 0.05
+
+_TOKEN = re.compile(r"[a-z][a-z0-9_\-]*")
+
+
+def hashed_features(text: str, n_features: int = HASH_FEATURES) -> Tuple[List[int], float]:
+    """
+    Индексы признаков (слова и соседние пары слов, числа и IP отброшены) и вес одного признака:
+    1/sqrt(число признаков), чтобы длинные и короткие сообщения давали сравнимые logits
+    """
+    tokens = _TOKEN.findall(text.lower())
+    if not tokens:
+        return [zlib.crc32(b"<empty>") % n_features], 1.0
+    features = [zlib.crc32(token.encode()) % n_features for token in tokens]
+    features += [zlib.crc32(f"{a} {b}".encode()) % n_features for a, b in zip(tokens, tokens[1:])]
+    return features, 1.0 / len(features) ** 0.5
+
+
+def _csr(texts: Sequence[str], n_features: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Пачка текстов -> (indices, values, starts) разреженной матрицы; у каждой строки есть признаки"""
+    indices: List[int] = []
+    values: List[float] = []
+    starts: List[int] = []
+    for text in texts:
+        features, weight = hashed_features(text, n_features)
+        starts.append(len(indices))
+        indices += features
+        values += [weight] * len(features)
+    return np.asarray(indices, dtype=np.int64), np.asarray(values, dtype=np.float32), np.asarray(starts, dtype=np.int64)
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    logits = logits - logits.max(axis=1, keepdims=True)
+    np.exp(logits, out=logits)
+    logits /= logits.sum(axis=1, keepdims=True)
+    return logits
+
+
+class FastTextClassifier:
+    """Линейная модель по хэшированным признакам: weights[n_features, n_classes] + bias[n_classes]"""
+
+    def __init__(self, weights: np.ndarray, bias: np.ndarray, class_ids: np.ndarray, thresholds: np.ndarray):
+        self.weights = weights
+        self.bias = bias
+        self.class_ids = class_ids
+        self.thresholds = thresholds
+
+    @property
+    def n_features(self) -> int:
+        return self.weights.shape[0]
+
+    def predict_proba(self, texts: Sequence[str]) -> np.ndarray:
+        return self._proba(*_csr(texts, self.n_features))
+
+    def _proba(self, indices: np.ndarray, values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+        # Признаки строки идут подряд — сумма строк весов по отрезкам одним reduceat
+        logits = np.add.reduceat(self.weights[indices] * values[:, None], starts, axis=0)
+        logits += self.bias
+        return _softmax(logits)
+
+    @classmethod
+    def train(
+        cls,
+        texts: Sequence[str],
+        labels: Sequence[int],
+        n_features: int = HASH_FEATURES,
+        epochs: int = 5,
+        batch_size: int = 256,
+        learning_rate: float = 0.5,
+        l2: float = 1e-6,
+        seed: int = 42
+    ) -> "FastTextClassifier":
+        """Мини-батч SGD по кросс-энтропии (Adagrad по строкам весов); labels — id классов BERT"""
+        class_ids = np.array(sorted(set(labels)), dtype=np.int64)
+        position = {class_id: index for index, class_id in enumerate(class_ids)}
+        y = np.array([position[label] for label in labels], dtype=np.int64)
+        weights = np.zeros((n_features, len(class_ids)), dtype=np.float32)
+        bias = np.zeros(len(class_ids), dtype=np.float32)
+        accumulated = np.full(n_features, 1e-8, dtype=np.float32)
+        rng = np.random.default_rng(seed)
+
+        model = cls(weights, bias, class_ids, np.full(len(class_ids), NEVER_ACCEPT, dtype=np.float32))
+        texts = list(texts)
+        for _ in range(epochs):
+            order = rng.permutation(len(texts))
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                indices, values, starts = _csr([texts[i] for i in batch], n_features)
+                probabilities = model._proba(indices, values, starts)
+                probabilities[np.arange(len(batch)), y[batch]] -= 1.0
+                probabilities /= len(batch)
+
+                rows = np.repeat(np.arange(len(batch)), np.diff(np.append(starts, len(indices))))
+                gradient = probabilities[rows] * values[:, None]
+                unique, inverse = np.unique(indices, return_inverse=True)
+                row_gradient = np.zeros((len(unique), len(class_ids)), dtype=np.float32)
+                np.add.at(row_gradient, inverse, gradient)
+                row_gradient += l2 * weights[unique]
+                accumulated[unique] += (row_gradient ** 2).sum(axis=1)
+                weights[unique] -= learning_rate * row_gradient / np.sqrt(accumulated[unique])[:, None]
+                bias -= BIAS_LEARNING_RATE * probabilities.sum(axis=0)
+        return model
+
+    def calibrate(self, texts: Sequence[str], labels: Sequence[int], target_agreement: float, min_support: int = 20):
+        """
+        Порог уверенности по каждому классу: самый низкий, при котором среди принятых
+        с этим предсказанием согласие с BERT на валидации не ниже target_agreement
+        """
+        probabilities = self.predict_proba(texts)
+        predicted = probabilities.argmax(axis=1)
+        confidence = probabilities.max(axis=1)
+        correct = self.class_ids[predicted] == np.asarray(labels)
+        thresholds = np.full(len(self.class_ids), NEVER_ACCEPT, dtype=np.float32)
+        for index in range(len(self.class_ids)):
+            mask = predicted == index
+            if mask.sum() < min_support:
+                continue
+            order = np.argsort(-confidence[mask])
+            agreement = np.cumsum(correct[mask][order]) / np.arange(1, mask.sum() + 1)
+            passing = np.nonzero(agreement >= target_agreement)[0]
+            if len(passing):
+                # Берем самый длинный префикс (по убыванию уверенности), где согласие держится
+                thresholds[index] = confidence[mask][order][passing[-1]]
+        self.thresholds = thresholds
+
+    def save(self, path: str):
+        """Атомарно: пишем во временный файл рядом и переименовываем"""
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".cascade-", suffix=".npz", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, weights=self.weights, bias=self.bias, class_ids=self.class_ids, thresholds=self.thresholds)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> "FastTextClassifier":
+        with np.load(path) as data:
+            return cls(data["weights"], data["bias"], data["class_ids"], data["thresholds"])
+
+
+class CascadeClassifier:
+    """Первая ступень перед BERT: принимает уверенные некритичные ответы, остальное пропускает дальше"""
+
+    def __init__(
+        self,
+        classes: Dict[str, str],
+        critical_classes: Set[str],
+        path: str = CASCADE_MODEL_PATH,
+        critical_prob: float = CASCADE_CRITICAL_PROB,
+        audit_rate: float = CASCADE_AUDIT_RATE
+    ):
+        self.classes = classes
+        self.critical_classes = critical_classes
+        self.path = path
+        self.critical_prob = critical_prob
+        self.audit_rate = audit_rate
+        self.model: Optional[FastTextClassifier] = None
+        self._critical_mask: Optional[np.ndarray] = None
+        self._mtime = 0.0
+        self._checked_at = 0.0
+        self.counters = {"accepted": 0, "forwarded_uncertain": 0, "forwarded_critical": 0, "audited": 0, "audit_agreed": 0}
+
+    def set_model(self, model: FastTextClassifier):
+        self._critical_mask = np.array([str(class_id) in self.critical_classes for class_id in model.class_ids])
+        self.model = model
+
+    def reload(self) -> bool:
+        """Подхватываем новую версию файла модели (после cascade_tool.py train) без рестарта"""
+        self._checked_at = time.monotonic()
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        try:
+            self.set_model(FastTextClassifier.load(self.path))
+        except Exception as e:
+            print(f"Cascade model load error: {e}")
+            return False
+        self._mtime = mtime
+        print(f"Cascade model loaded from {self.path}")
+        return True
+
+    def classify_batch(self, texts: List[str]) -> Tuple[List[Optional[Dict[str, Any]]], List[int]]:
+        """
+        (результаты первой ступени или None, индексы аудита): None — лог нужно отдать в BERT.
+        Для индексов аудита результат есть, но его тоже нужно сверить с BERT (record_audit)
+        """
+        if time.monotonic() - self._checked_at > CASCADE_RELOAD_SECONDS:
+            self.reload()
+        model = self.model
+        if model is None or not texts:
+            return [None] * len(texts), []
+
+        probabilities = model.predict_proba(texts)
+        predicted = probabilities.argmax(axis=1)
+        confidence = probabilities[np.arange(len(texts)), predicted]
+        critical = probabilities[:, self._critical_mask].sum(axis=1)
+
+        results: List[Optional[Dict[str, Any]]] = []
+        audit = []
+        for index in range(len(texts)):
+            if critical[index] >= self.critical_prob:
+                self.counters["forwarded_critical"] += 1
+                results.append(None)
+            elif confidence[index] < model.thresholds[predicted[index]]:
+                self.counters["forwarded_uncertain"] += 1
+                results.append(None)
+            else:
+                self.counters["accepted"] += 1
+                class_id = int(model.class_ids[predicted[index]])
+                class_name = self.classes.get(str(class_id), "UNKNOWN")
+                CLASSIFICATIONS_TOTAL.inc(class_name)
+                results.append({
+                    "class_id": class_id,
+                    "class_name": class_name,
+                    "confidence": float(confidence[index]),
+                    "is_anomaly": False,
+                    "degraded": False,
+                    "method": "cascade"
+                })
+                if self.audit_rate and random.random() < self.audit_rate:
+                    audit.append(index)
+        return results, audit
+
+    def record_audit(self, fast_result: Dict[str, Any], bert_result: Dict[str, Any]):
+        if bert_result.get("class_id", -1) < 0:
+            return
+        agreed = fast_result["class_id"] == bert_result["class_id"]
+        self.counters["audited"] += 1
+        self.counters["audit_agreed"] += int(agreed)
+        CASCADE_AUDIT_TOTAL.inc("agree" if agreed else "disagree")
+
+    def status(self) -> Dict[str, Any]:
+        total = self.counters["accepted"] + self.counters["forwarded_uncertain"] + self.counters["forwarded_critical"]
+        audited = self.counters["audited"]
+        return {
+            "enabled": self.model is not None,
+            "path": self.path,
+            "classes": len(self.model.class_ids) if self.model is not None else 0,
+            "accepted_ratio": round(self.counters["accepted"] / total, 4) if total else None,
+            "audit_agreement": round(self.counters["audit_agreed"] / audited, 4) if audited else None,
+            **self.counters
+        }
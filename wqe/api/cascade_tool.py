@@ -0,0 +1,173 @@
+"""
+Обучение и офлайн-оценка первой ступени каскада (cascade.py).
+
+    python cascade_tool.py export --time-range 7d --output labeled.jsonl
+    python cascade_tool.py train --data labeled.jsonl [--target-agreement 0.98]
+    python cascade_tool.py evaluate --data holdout.jsonl [--model path.npz]
+
+Данные — JSONL с полями message и bert_class_id: сообщения, которые классифицировал сам
+BERT (export берет их из security-logs-* и пропускает ответы каскада, кэша шаблонов и
+эвристики). train откладывает часть данных под валидацию, подбирает по ней пороги классов
+и печатает тот же отчет, что evaluate: согласие с BERT и доли трафика по ступеням.
+"""
+import argparse
+import asyncio
+import json
+import random
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+from bert_classes import ANOMALY_CLASSES, CRITICAL_ANOMALY_CLASSES
+from cascade import CASCADE_MODEL_PATH, CASCADE_CRITICAL_PROB, CascadeClassifier, FastTextClassifier
+
+TIME_RANGE_ES = {"1h": "now-1h", "6h": "now-6h", "24h": "now-24h", "3d": "now-3d", "7d": "now-7d", "30d": "now-30d"}
+
+
+def read_labeled(path: str) -> Tuple[List[str], List[int]]:
+    texts, labels = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            label = int(record.get("bert_class_id", -1))
+            if label >= 0 and record.get("message"):
+                texts.append(record["message"])
+                labels.append(label)
+    return texts, labels
+
+
+async def export_from_elasticsearch(output: str, time_range: str, limit: int) -> int:
+    from elasticsearch.helpers import async_scan
+    from elastic import es_client, LOGS_INDEX_PREFIX
+
+    query = {
+        "query": {
+            "bool": {
+                "filter": [{"range": {"timestamp": {"gte": TIME_RANGE_ES.get(time_range, "now-7d")}}}],
+                # Только ответы самого BERT: без каскада, кэша шаблонов, эвристики и ошибок
+                "must_not": [
+                    {"terms": {"bert_method": ["cascade", "template", "heuristic"]}},
+                    {"term": {"bert_class_id": -1}}
+                ]
+            }
+        }
+    }
+    written = 0
+    try:
+        with open(output, "w", encoding="utf-8") as f:
+            async for hit in async_scan(
+                es_client, index=f"{LOGS_INDEX_PREFIX}-*", query=query,
+                _source=["message", "bert_class_id"], size=5000
+            ):
+                f.write(json.dumps(hit["_source"], ensure_ascii=False) + "\n")
+                written += 1
+                if written >= limit:
+                    break
+    finally:
+        await es_client.close()
+    return written
+
+
+def evaluate(model: FastTextClassifier, texts: List[str], labels: List[int], critical_prob: float) -> Dict[str, Any]:
+    """Доли трафика по ступеням и согласие с BERT — как если бы каскад стоял перед BERT"""
+    classes, critical_classes = ANOMALY_CLASSES, CRITICAL_ANOMALY_CLASSES
+    cascade = CascadeClassifier(classes, critical_classes, path="", critical_prob=critical_prob, audit_rate=0.0)
+    cascade.set_model(model)
+
+    results, _ = cascade.classify_batch(texts)
+    accepted = [(result, label) for result, label in zip(results, labels) if result is not None]
+    agreed = sum(result["class_id"] == label for result, label in accepted)
+    critical_total = sum(str(label) in critical_classes for label in labels)
+    # Критичный по BERT лог, принятый первой ступенью, — пропущенная аномалия
+    critical_missed = sum(str(label) in critical_classes for _, label in accepted)
+
+    per_class: Dict[str, Counter] = {}
+    for result, label in zip(results, labels):
+        counter = per_class.setdefault(classes.get(str(label), str(label)), Counter())
+        counter["total"] += 1
+        if result is not None:
+            counter["accepted"] += 1
+            counter["agreed"] += int(result["class_id"] == label)
+
+    total = len(texts)
+    return {
+        "samples": total,
+        "accepted_ratio": round(len(accepted) / total, 4) if total else 0.0,
+        "forwarded_uncertain_ratio": round(cascade.counters["forwarded_uncertain"] / total, 4) if total else 0.0,
+        "forwarded_critical_ratio": round(cascade.counters["forwarded_critical"] / total, 4) if total else 0.0,
+        "agreement_on_accepted": round(agreed / len(accepted), 4) if accepted else None,
+        # Ответ каскада целиком: принятое первой ступенью + BERT для остального
+        "overall_agreement": round((agreed + total - len(accepted)) / total, 4) if total else None,
+        "critical_total": critical_total,
+        "critical_missed": critical_missed,
+        "per_class": {
+            name: {
+                "total": counter["total"],
+                "accepted_ratio": round(counter["accepted"] / counter["total"], 3),
+                "agreement": round(counter["agreed"] / counter["accepted"], 3) if counter["accepted"] else None
+            }
+            for name, counter in sorted(per_class.items(), key=lambda item: -item[1]["total"])
+        }
+    }
+
+
+def _print_report(report: Dict[str, Any]):
+    per_class = report.pop("per_class")
+    print(json.dumps(report, indent=2))
+    print(f"{'class':32} {'total':>8} {'accepted':>9} {'agreement':>10}")
+    for name, row in per_class.items():
+        agreement = "-" if row["agreement"] is None else f"{row['agreement']:.3f}"
+        print(f"{name:32} {row['total']:>8} {row['accepted_ratio']:>9.3f} {agreement:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cascade first-stage classifier: export, train, evaluate")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="Выгрузить сообщения с метками BERT из Elasticsearch в JSONL")
+    export.add_argument("--output", required=True)
+    export.add_argument("--time-range", default="7d")
+    export.add_argument("--limit", type=int, default=500000)
+
+    train = commands.add_parser("train", help="Обучить модель и подобрать пороги по валидации")
+    train.add_argument("--data", required=True)
+    train.add_argument("--model", default=CASCADE_MODEL_PATH)
+    train.add_argument("--validation", type=float, default=0.2, help="Доля данных под валидацию")
+    train.add_argument("--target-agreement", type=float, default=0.98, help="Согласие с BERT на принятых ответах")
+    train.add_argument("--epochs", type=int, default=5)
+    train.add_argument("--critical-prob", type=float, default=CASCADE_CRITICAL_PROB)
+
+    evaluate_parser = commands.add_parser("evaluate", help="Оценить модель на размеченных BERT данных")
+    evaluate_parser.add_argument("--data", required=True)
+    evaluate_parser.add_argument("--model", default=CASCADE_MODEL_PATH)
+    evaluate_parser.add_argument("--critical-prob", type=float, default=CASCADE_CRITICAL_PROB)
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        written = asyncio.run(export_from_elasticsearch(args.output, args.time_range, args.limit))
+        print(f"Exported {written} labeled messages to {args.output}")
+        return
+
+    texts, labels = read_labeled(args.data)
+    if args.command == "evaluate":
+        _print_report(evaluate(FastTextClassifier.load(args.model), texts, labels, args.critical_prob))
+        return
+
+    order = list(range(len(texts)))
+    random.Random(42).shuffle(order)
+    split = int(len(order) * (1 - args.validation))
+    train_texts = [texts[i] for i in order[:split]]
+    train_labels = [labels[i] for i in order[:split]]
+    validation_texts = [texts[i] for i in order[split:]]
+    validation_labels = [labels[i] for i in order[split:]]
+
+    model = FastTextClassifier.train(train_texts, train_labels, epochs=args.epochs)
+    model.calibrate(validation_texts, validation_labels, args.target_agreement)
+    model.save(args.model)
+    accepted_classes = int((model.thresholds <= 1.0).sum())
+    print(f"Saved cascade model to {args.model}: {len(model.class_ids)} classes, {accepted_classes} with thresholds")
+    _print_report(evaluate(model, validation_texts, validation_labels, args.critical_prob))
+
+
+if __name__ == "__main__":
+    main()
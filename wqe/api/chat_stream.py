@@ -0,0 +1,73 @@
+import asyncio
+import json
+import os
+from typing import Any, AsyncIterator, Dict, Optional
+
+import aiohttp
+
+# Где живет LLM агент (сервис llm-agent в docker-compose)
+LLM_AGENT_URL = os.getenv("LLM_AGENT_URL", "http://llm-agent:8001").rstrip("/")
+
+# Между токенами модель может думать долго (вызов функции), но не бесконечно
+STREAM_READ_TIMEOUT = float(os.getenv("LLM_STREAM_READ_TIMEOUT", 120))
+
+# Формат SSE общий с llm_agent/server.py (SSE_HEADERS, sse_event) и должен совпадать: прокси
+# отдает клиенту события агента и свои (ошибка, обрыв) в одном потоке. Общий модуль не вынести —
+# api и llm_agent собираются из разных docker контекстов (build: ./api и ./llm_agent).
+# Content-Type здесь не нужен: его ставит StreamingResponse(media_type="text/event-stream")
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no"
+}
+
+
+def sse_event(event: Dict[str, Any]) -> bytes:
+    data = json.dumps(event, ensure_ascii=False, default=str)
+    return f"event: {event['type']}\ndata: {data}\n\n".encode()
+
+
+class AgentStreamProxy:
+    """
+    Проксирование SSE потока ответа от LLM агента клиенту без буферизации.
+
+    Чанки отдаются по мере прихода. Если клиент отключился, Starlette отменяет генератор,
+    выход из async with закрывает соединение к агенту, и агент прекращает генерацию.
+    """
+
+    def __init__(self, agent_url: str = LLM_AGENT_URL):
+        self.agent_url = agent_url
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=5, sock_read=STREAM_READ_TIMEOUT)
+            )
+        return self._session
+
+    async def relay(self, payload: Dict[str, Any], fallback: Optional[Dict[str, Any]] = None) -> AsyncIterator[bytes]:
+        """Поток байт SSE от агента; если агент недоступен — готовый ответ fallback одним событием"""
+        started = False
+        try:
+            session = await self._get_session()
+            async with session.post(f"{self.agent_url}/chat/stream", json=payload) as upstream:
+                upstream.raise_for_status()
+                async for chunk in upstream.content.iter_any():
+                    started = True
+                    yield chunk
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"LLM агент недоступен для стриминга: {e}")
+            # Часть ответа уже ушла клиенту — подменять его целиком поздно
+            if started or fallback is None:
+                yield sse_event({"type": "error", "error": str(e)})
+                return
+            yield sse_event({"type": "token", "content": fallback.get("response", "")})
+            yield sse_event({"type": "done", **fallback, "fallback": True})
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+agent_stream_proxy = AgentStreamProxy()
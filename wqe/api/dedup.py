@@ -0,0 +1,139 @@
+"""
+Подавление повторов на приеме.
+
+Флапающие интерфейсы и BFD сессии шлют одно и то же сообщение сотни раз в минуту, и каждое
+становилось отдельным log:*, записью logs_list, классификацией BERT и, возможно, аномалией
+с алертом. DedupWindow схлопывает повторы по ключу (source, сообщение без времени) внутри
+окна DEDUP_WINDOW_SECONDS от первого появления: сохраняется и классифицируется только первый
+лог, у него в Redis обновляются repeat_count, first_seen и last_seen (и у его аномалии, если
+она была), а в Elasticsearch итог пишется, когда окно закрывается.
+
+Окно фиксированное, а не скользящее: при непрерывном флапе получается одна запись в окно,
+а не одна на весь шторм. Пока первая запись окна еще классифицируется и пишется своим
+запросом (owner), повторы из других запросов не схлопываются, а сохраняются отдельно:
+ссылаться им еще не на что. Состояние у каждого воркера свое — повторы, попавшие в разные
+воркеры, дадут по записи на воркер.
+"""
+import json
+import os
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set
+
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+DEDUP_WINDOW_SECONDS = float(os.getenv("DEDUP_WINDOW_SECONDS", 60))
+DEDUP_MAX_KEYS = int(os.getenv("DEDUP_MAX_KEYS", 100000))
+# Honeypot и firewall события не схлопываем: детекторы брутфорса и сканов считают каждое
+DEDUP_LOG_TYPES = set(filter(None, os.getenv("DEDUP_LOG_TYPES", "generic_syslog,generic,cef,leef").split(",")))
+
+# Поля, которые меняются у повторов одного и того же события
+IGNORED_FIELDS = frozenset((
+    "timestamp", "@timestamp", "syslog_timestamp", "raw_line", "event_id",
+    "rt", "start", "end", "devTime", "time", "date"
+))
+
+
+class DedupEntry:
+    __slots__ = ("key", "log_id", "timestamp", "first_seen", "last_seen", "count", "expires_at", "bert_result",
+                 "anomaly_id", "anomaly_timestamp", "owner")
+
+    def __init__(self, key: str, log_id: str, timestamp: str, expires_at: float, owner: Any = None):
+        self.key = key
+        self.log_id = log_id
+        self.timestamp = timestamp
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.count = 1
+        self.expires_at = expires_at
+        self.bert_result: Optional[Dict[str, Any]] = None
+        self.anomaly_id: Optional[str] = None
+        self.anomaly_timestamp: Optional[str] = None
+        # Запрос, который еще сохраняет первую запись окна; None — запись в Redis уже есть
+        self.owner = owner
+
+    def fields(self) -> Dict[str, Any]:
+        return {"repeat_count": self.count, "first_seen": self.first_seen, "last_seen": self.last_seen}
+
+
+class DedupWindow:
+    """Окна повторов по ключу; OrderedDict в порядке открытия окон — истекшие всегда в начале"""
+
+    def __init__(
+        self,
+        window_seconds: float = DEDUP_WINDOW_SECONDS,
+        max_keys: int = DEDUP_MAX_KEYS,
+        log_types: Set[str] = DEDUP_LOG_TYPES
+    ):
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self.log_types = log_types
+        self.entries: "OrderedDict[str, DedupEntry]" = OrderedDict()
+        self.counters = {"unique": 0, "suppressed": 0, "in_flight": 0, "windows_closed": 0}
+
+    def key(self, log_type: str, source: str, raw_data: Any) -> Optional[str]:
+        """Ключ повтора или None, если лог этого типа не схлопывается"""
+        if log_type not in self.log_types:
+            return None
+        if isinstance(raw_data, dict):
+            content = {key: value for key, value in raw_data.items() if key not in IGNORED_FIELDS}
+            message = json.dumps(content, sort_keys=True, default=str)
+        else:
+            message = " ".join(str(raw_data).split())
+        return f"{source}\x00{message}"
+
+    def observe(self, key: str, log_id: str, timestamp: str, now: float, owner: Any = None) -> Optional[DedupEntry]:
+        """
+        Запись окна для ключа: новая (count == 1, owner — ее запрос) или существующая с учтенным
+        повтором; None — первая запись окна еще сохраняется другим запросом
+        """
+        entry = self.entries.get(key)
+        if entry is not None and entry.expires_at > now:
+            if entry.owner is not None and entry.owner is not owner:
+                self.counters["in_flight"] += 1
+                return None
+            entry.count += 1
+            if timestamp > entry.last_seen:
+                entry.last_seen = timestamp
+            if timestamp < entry.first_seen:
+                entry.first_seen = timestamp
+            self.counters["suppressed"] += 1
+            return entry
+
+        if entry is not None:
+            # Окно истекло, но еще не закрыто expire() — новое окно открывается в конце очереди
+            del self.entries[key]
+        entry = DedupEntry(key, log_id, timestamp, now + self.window_seconds, owner)
+        self.entries[key] = entry
+        self.counters["unique"] += 1
+        return entry
+
+    def discard(self, entry: DedupEntry):
+        """Окно, первая запись которого не сохранилась: следующий такой лог откроет новое"""
+        if self.entries.get(entry.key) is entry:
+            del self.entries[entry.key]
+
+    def expire(self, now: float) -> List[DedupEntry]:
+        """Закрывает истекшие окна (и самые старые сверх max_keys); возвращает закрытые с повторами"""
+        closed = []
+        entries = self.entries
+        while entries:
+            key, entry = next(iter(entries.items()))
+            if entry.expires_at > now and len(entries) <= self.max_keys:
+                break
+            del entries[key]
+            self.counters["windows_closed"] += 1
+            if entry.count > 1:
+                closed.append(entry)
+        return closed
+
+    def close_all(self) -> List[DedupEntry]:
+        closed = [entry for entry in self.entries.values() if entry.count > 1]
+        self.entries.clear()
+        return closed
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_seconds": self.window_seconds,
+            "open_windows": len(self.entries),
+            "log_types": sorted(self.log_types),
+            **self.counters
+        }
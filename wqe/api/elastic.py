@@ -0,0 +1,117 @@
+import os
+import re
+from datetime import datetime
+from elasticsearch import AsyncElasticsearch
+
+ELASTICSEARCH_HOST = os.getenv("ELASTICSEARCH_HOST", "http://elasticsearch:9200")
+
+es_client = AsyncElasticsearch([ELASTICSEARCH_HOST])
+
+# Кластер OpenSearch, куда Vector пишет app-logs-* (если не задан — тот же Elasticsearch)
+OPENSEARCH_HOST = os.getenv("OPENSEARCH_HOST")
+
+
+def _make_app_logs_client():
+    if not OPENSEARCH_HOST:
+        return es_client
+    from opensearchpy import AsyncOpenSearch
+    return AsyncOpenSearch(
+        hosts=[OPENSEARCH_HOST],
+        http_auth=(os.getenv("OPENSEARCH_USER", "admin"), os.getenv("OPENSEARCH_PASSWORD", "")),
+        verify_certs=False,
+        ssl_show_warn=False
+    )
+
+
+app_logs_client = _make_app_logs_client()
+
+# Долгосрочное хранилище — помесячные индексы
+LOGS_INDEX_PREFIX = "security-logs"
+ANOMALIES_INDEX_PREFIX = "security-anomalies"
+
+_MONTH_RE = re.compile(r"^\d{4}-\d{2}")
+
+# Явный маппинг: поля, по которым фильтруем и агрегируем, — keyword, время — date
+LOGS_INDEX_TEMPLATE = {
+    "index_patterns": [f"{LOGS_INDEX_PREFIX}-*"],
+    "template": {
+        "settings": {"refresh_interval": "5s"},
+        "mappings": {
+            "properties": {
+                "event_id": {"type": "keyword"},
+                "source": {"type": "keyword"},
+                "log_type": {"type": "keyword"},
+                "severity": {"type": "keyword"},
+                "timestamp": {"type": "date"},
+                "message": {"type": "text"},
+                "bert_class": {"type": "keyword"},
+                "bert_class_id": {"type": "integer"},
+                "bert_confidence": {"type": "float"},
+                "bert_method": {"type": "keyword"},
+                "bert_degraded": {"type": "boolean"},
+                "template_id": {"type": "keyword"},
+                "ioc_matches": {"type": "keyword"},
+                "is_anomaly": {"type": "boolean"},
+                # Повторы того же сообщения, схлопнутые в эту запись (dedup.py)
+                "repeat_count": {"type": "integer"},
+                "first_seen": {"type": "date"},
+                "last_seen": {"type": "date"},
+                # Нормализованные поля (normalizer.py) — по ним фильтруют детекторы и поиск
+                "event_type": {"type": "keyword"},
+                "src_ip": {"type": "ip", "ignore_malformed": True},
+                "dst_ip": {"type": "ip", "ignore_malformed": True},
+                "src_port": {"type": "integer", "ignore_malformed": True},
+                "dst_port": {"type": "integer", "ignore_malformed": True},
+                "action": {"type": "keyword"},
+                "username": {"type": "keyword"},
+                "honeypot": {"type": "keyword"},
+                "md5": {"type": "keyword"},
+                # Сырые данные у разных источников разные — храним, но не индексируем
+                "raw_data": {"type": "object", "enabled": False}
+            }
+        }
+    }
+}
+
+ANOMALIES_INDEX_TEMPLATE = {
+    "index_patterns": [f"{ANOMALIES_INDEX_PREFIX}-*"],
+    "template": {
+        "mappings": {
+            "properties": {
+                "id": {"type": "keyword"},
+                "log_id": {"type": "keyword"},
+                "source": {"type": "keyword"},
+                "log_type": {"type": "keyword"},
+                "timestamp": {"type": "date"},
+                "bert_class": {"type": "keyword"},
+                "bert_class_id": {"type": "integer"},
+                "classification_method": {"type": "keyword"},
+                "incident_id": {"type": "keyword"},
+                "ioc_matches": {"type": "text", "index": False},
+                "confidence": {"type": "float"},
+                "severity": {"type": "keyword"},
+                "status": {"type": "keyword"},
+                "repeat_count": {"type": "integer"},
+                "last_seen": {"type": "date"},
+                "description": {"type": "text"},
+                "raw_log": {"type": "text", "index": False}
+            }
+        }
+    }
+}
+
+
+def monthly_index(prefix: str, timestamp: str) -> str:
+    """Имя помесячного индекса по ISO timestamp события"""
+    if isinstance(timestamp, str) and _MONTH_RE.match(timestamp):
+        return f"{prefix}-{timestamp[:7]}"
+    return f"{prefix}-{datetime.utcnow().strftime('%Y-%m')}"
+
+
+async def ensure_index_templates():
+    """Создаем index template (идемпотентно, ошибки не критичны)"""
+    try:
+        await es_client.indices.put_index_template(name=LOGS_INDEX_PREFIX, **LOGS_INDEX_TEMPLATE)
+        await es_client.indices.put_index_template(name=ANOMALIES_INDEX_PREFIX, **ANOMALIES_INDEX_TEMPLATE)
+    except Exception as e:
+        print(f"Elasticsearch index template error: {e}")
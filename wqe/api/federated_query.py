@@ -0,0 +1,261 @@
+import asyncio
+import heapq
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+# Сколько данных живет в Redis (горячий слой) — все, что старше, ищем в Elasticsearch
+HOT_LOGS_HOURS = int(os.getenv("REDIS_LOGS_TTL_HOURS", 72))
+HOT_ANOMALIES_HOURS = int(os.getenv("REDIS_ANOMALIES_TTL_HOURS", 168))
+
+# Сколько ключей Redis читаем за один проход при фильтрации
+REDIS_SCAN_BATCH = 500
+
+
+def parse_time_range(time_range: str) -> timedelta:
+    """'24h' / '7d' / '30m' -> timedelta (по умолчанию часы, как в остальных эндпоинтах)"""
+    units = {"m": "minutes", "h": "hours", "d": "days"}
+    if time_range and time_range[-1] in units:
+        return timedelta(**{units[time_range[-1]]: int(time_range[:-1])})
+    return timedelta(hours=int(time_range))
+
+
+def event_score(timestamp: Any, default: Optional[float] = None) -> float:
+    """
+    Score в sorted set горячего слоя — время события (поле timestamp), как сортирует холодный
+    слой; иначе слияние слоев и курсор (score, id) расходятся для логов со временем устройства
+    """
+    try:
+        parsed = datetime.fromisoformat(str(timestamp).replace("Z", "+00:00"))
+        if parsed.tzinfo:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed.timestamp()
+    except ValueError:
+        return datetime.utcnow().timestamp() if default is None else default
+
+
+def parse_cursor(cursor: Optional[str]) -> Optional[Tuple[float, str]]:
+    """Курсор пагинации: '<epoch seconds>:<id>' последнего отданного элемента"""
+    if not cursor:
+        return None
+    ts, _, item_id = cursor.partition(":")
+    return float(ts), item_id
+
+
+class TieredQuery:
+    """
+    Поиск по временному диапазону поверх двух слоев хранения.
+
+    Свежая часть диапазона (моложе hot_hours) читается из Redis, старая — из Elasticsearch,
+    оба слоя опрашиваются параллельно и каждый только за свой кусок времени.
+    Результаты сливаются по времени (новые первыми), дедуплицируются по id
+    и режутся на страницы курсором.
+    """
+
+    def __init__(
+        self,
+        redis_client: Any,
+        es_client: Any,
+        zset_key: str,
+        index_prefix: str,
+        id_field: str,
+        hot_hours: int,
+        redis_decoder,
+        es_decoder
+    ):
+        self.redis = redis_client
+        self.es = es_client
+        self.zset_key = zset_key
+        self.index_prefix = index_prefix
+        self.id_field = id_field
+        self.hot_hours = hot_hours
+        self.redis_decoder = redis_decoder
+        self.es_decoder = es_decoder
+
+    async def search(
+        self,
+        start: datetime,
+        end: datetime,
+        filters: Dict[str, Any],
+        limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        filters = {k: v for k, v in filters.items() if v is not None}
+        after = parse_cursor(cursor)
+        boundary = datetime.utcnow() - timedelta(hours=self.hot_hours)
+
+        # Верхняя граница с учетом курсора — все, что уже отдали, не запрашиваем
+        upper = end.timestamp() if after is None else min(end.timestamp(), after[0])
+
+        tasks = []
+        tiers = []
+        if upper >= boundary.timestamp():
+            hot_from = max(start.timestamp(), boundary.timestamp())
+            tasks.append(asyncio.to_thread(self._search_redis, hot_from, upper, filters, limit, after))
+            tiers.append("redis")
+        if start < boundary:
+            cold_to = min(upper, boundary.timestamp())
+            tasks.append(self._search_elasticsearch(start.timestamp(), cold_to, filters, limit, after))
+            tiers.append("elasticsearch")
+
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        streams = []
+        errors = {}
+        has_more = False
+        for tier, result in zip(tiers, results):
+            if isinstance(result, Exception):
+                errors[tier] = str(result)
+                continue
+            items, tier_has_more = result
+            has_more = has_more or tier_has_more
+            streams.append(items)
+
+        # Каждый поток уже отсортирован по (time, id) по убыванию — сливаем за O(n log k)
+        merged = []
+        seen = set()
+        for ts, item_id, item in heapq.merge(*streams, key=lambda x: (x[0], x[1]), reverse=True):
+            if item_id in seen:
+                continue
+            seen.add(item_id)
+            merged.append((ts, item_id, item))
+            if len(merged) > limit:
+                break
+
+        has_more = has_more or len(merged) > limit
+        page = merged[:limit]
+        next_cursor = f"{page[-1][0]}:{page[-1][1]}" if page and has_more else None
+
+        return {
+            "results": [item for _, _, item in page],
+            "count": len(page),
+            "next_cursor": next_cursor,
+            "tiers": tiers,
+            "hot_boundary": boundary.isoformat(),
+            "errors": errors
+        }
+
+    def _search_redis(
+        self,
+        min_score: float,
+        max_score: float,
+        filters: Dict[str, Any],
+        limit: int,
+        after: Optional[Tuple[float, str]]
+    ) -> Tuple[List[Tuple[float, str, Dict]], bool]:
+        """Горячий слой: sorted set по времени + hash на каждый элемент"""
+        found = []
+        offset = 0
+        while len(found) <= limit:
+            keys = self.redis.zrevrangebyscore(
+                self.zset_key, max_score, min_score,
+                start=offset, num=REDIS_SCAN_BATCH, withscores=True
+            )
+            if not keys:
+                return found, False
+            offset += len(keys)
+
+            pipeline = self.redis.pipeline()
+            for key, _ in keys:
+                pipeline.hgetall(key)
+            hashes = pipeline.execute()
+
+            for (key, score), data in zip(keys, hashes):
+                if not data:
+                    continue  # ключ уже истек, а запись в sorted set осталась
+                item = self.redis_decoder(data)
+                item_id = item.get("id") or key.split(":", 1)[-1]
+                if after and (score, item_id) >= after:
+                    continue
+                if not _matches(item, filters):
+                    continue
+                found.append((score, item_id, item))
+        return found[:limit], True
+
+    async def _search_elasticsearch(
+        self,
+        start_ts: float,
+        end_ts: float,
+        filters: Dict[str, Any],
+        limit: int,
+        after: Optional[Tuple[float, str]]
+    ) -> Tuple[List[Tuple[float, str, Dict]], bool]:
+        """Холодный слой: range по timestamp + term-фильтры, сортировка как у горячего слоя"""
+        query_filters = [{
+            "range": {"timestamp": {
+                "gte": datetime.utcfromtimestamp(start_ts).isoformat(),
+                "lte": datetime.utcfromtimestamp(end_ts).isoformat()
+            }}
+        }]
+        for field, value in filters.items():
+            query_filters.append({"term": {field: value}})
+
+        kwargs = {
+            "index": f"{self.index_prefix}-*",
+            "query": {"bool": {"filter": query_filters}},
+            "sort": [{"timestamp": {"order": "desc", "unmapped_type": "date"}}, {self.id_field: "desc"}],
+            "size": limit + 1,
+            "ignore_unavailable": True
+        }
+        if after:
+            kwargs["search_after"] = [int(after[0] * 1000), after[1]]
+
+        response = await self.es.search(**kwargs)
+        hits = response["hits"]["hits"]
+
+        found = []
+        for hit in hits[:limit]:
+            item = self.es_decoder(hit["_source"])
+            found.append((hit["sort"][0] / 1000, hit["sort"][1], item))
+        return found, len(hits) > limit
+
+
+def _matches(item: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+    for field, value in filters.items():
+        if str(item.get(field)).lower() != str(value).lower():
+            return False
+    return True
+
+
+def decode_redis_log(data: Dict[str, str]) -> Dict[str, Any]:
+    """Hash лога из Redis -> тот же вид, что и документ в Elasticsearch"""
+    try:
+        raw_data = json.loads(data.get("raw_data", "{}"))
+    except Exception:
+        raw_data = {}
+    return {
+        "event_id": data.get("id"),
+        "id": data.get("id"),
+        "source": data.get("source"),
+        "log_type": data.get("log_type"),
+        "timestamp": data.get("timestamp"),
+        "raw_data": raw_data,
+        "bert_class": data.get("bert_class"),
+        "bert_class_id": int(data.get("bert_class_id", -1)),
+        "bert_confidence": float(data.get("bert_confidence", 0.0)),
+        "is_anomaly": data.get("is_anomaly") == "True",
+        "template_id": data.get("template_id"),
+        "repeat_count": int(data.get("repeat_count", 1)),
+        "first_seen": data.get("first_seen", data.get("timestamp")),
+        "last_seen": data.get("last_seen", data.get("timestamp")),
+        "tier": "redis"
+    }
+
+
+def decode_es_log(source: Dict[str, Any]) -> Dict[str, Any]:
+    return {**source, "id": source.get("event_id"), "tier": "elasticsearch"}
+
+
+def decode_redis_anomaly(data: Dict[str, str]) -> Dict[str, Any]:
+    item = dict(data)
+    try:
+        item["confidence"] = float(item.get("confidence", 0))
+    except Exception:
+        item["confidence"] = 0.0
+    item["tier"] = "redis"
+    return item
+
+
+def decode_es_anomaly(source: Dict[str, Any]) -> Dict[str, Any]:
+    return {**source, "tier": "elasticsearch"}
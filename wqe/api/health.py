@@ -0,0 +1,121 @@
+import asyncio
+import inspect
+import os
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+# Как часто фоновые проверки обновляют кэш и сколько ждем одну проверку
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", 10))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", 3))
+
+
+class HealthCheck:
+    """Одна проверка компонента и ее последний результат"""
+
+    def __init__(self, name: str, check: Callable, critical: bool, interval: float, timeout: float):
+        self.name = name
+        self.check = check
+        self.critical = critical
+        self.interval = interval
+        # Результат старше трех интервалов (плюс таймаут самой проверки) считаем устаревшим
+        self.max_age = interval * 3 + timeout
+        self.result: Dict[str, Any] = {"ok": False, "status": "pending", "checked_at": None}
+        self.checked_monotonic = 0.0
+
+    def is_stale(self) -> bool:
+        return time.monotonic() - self.checked_monotonic > self.max_age
+
+
+class HealthMonitor:
+    """
+    Фоновые проверки компонентов (Redis, модель, Elasticsearch, Telegram).
+
+    Каждая проверка выполняется по своему интервалу в фоне (синхронные — в отдельном потоке,
+    с таймаутом), а эндпоинты отдают закэшированный результат без обращения к компонентам.
+    """
+
+    def __init__(self, interval: float = HEALTH_CHECK_INTERVAL, timeout: float = HEALTH_CHECK_TIMEOUT):
+        self.interval = interval
+        self.timeout = timeout
+        self.checks: Dict[str, HealthCheck] = {}
+        self.started_at = time.time()
+        self.last_cycle = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, name: str, check: Callable, critical: bool = True, interval: Optional[float] = None):
+        """check — функция или корутина, возвращающая bool либо dict с ключом ok"""
+        self.checks[name] = HealthCheck(name, check, critical, interval or self.interval, self.timeout)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def component(self, name: str) -> Dict[str, Any]:
+        return self.checks[name].result
+
+    def live(self) -> Dict[str, Any]:
+        """Liveness: процесс отвечает и фоновый цикл проверок не завис"""
+        max_age = self.interval * 3 + self.timeout
+        loop_ok = self._task is not None and time.monotonic() - self.last_cycle < max_age
+        return {
+            "status": "alive" if loop_ok else "stalled",
+            "uptime_seconds": round(time.time() - self.started_at, 1)
+        }
+
+    def ready(self) -> bool:
+        """Readiness: все критичные компоненты прошли последнюю проверку и она не устарела"""
+        return all(
+            check.result["ok"] and not check.is_stale()
+            for check in self.checks.values() if check.critical
+        )
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "status": "healthy" if self.ready() else "degraded",
+            "components": {
+                name: {**check.result, "critical": check.critical, "stale": check.is_stale()}
+                for name, check in self.checks.items()
+            }
+        }
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            due = [check for check in self.checks.values() if now - check.checked_monotonic >= check.interval]
+            await asyncio.gather(*(self._run_check(check) for check in due))
+            self.last_cycle = time.monotonic()
+            await asyncio.sleep(min([check.interval for check in self.checks.values()] + [self.interval]))
+
+    @staticmethod
+    async def _call(check: Callable):
+        if asyncio.iscoroutinefunction(check):
+            return await check()
+        value = await asyncio.to_thread(check)
+        # Методы async клиентов под декораторами (AsyncElasticsearch.ping) не видны как
+        # корутинные функции, но возвращают корутину — ее нужно дождаться, а не считать True
+        if inspect.isawaitable(value):
+            value = await value
+        return value
+
+    async def _run_check(self, check: HealthCheck):
+        started = time.perf_counter()
+        try:
+            value = await asyncio.wait_for(self._call(check.check), timeout=self.timeout)
+            result = value if isinstance(value, dict) else {"ok": bool(value)}
+            result.setdefault("status", "up" if result["ok"] else "down")
+        except asyncio.TimeoutError:
+            result = {"ok": False, "status": "timeout"}
+        except Exception as e:
+            result = {"ok": False, "status": "error", "error": str(e)}
+
+        result["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        result["checked_at"] = datetime.utcnow().isoformat()
+        check.result = result
+        check.checked_monotonic = time.monotonic()
@@ -0,0 +1,263 @@
+"""
+Топ значений (источники, IP, пользователи, порты, классы) за период без сканирования логов.
+
+На каждое измерение и окно времени — Count-Min Sketch (Cormode, Muthukrishnan, 2005) фиксированного
+размера и Space-Saving (Metwally et al., 2005) на TOP_CAPACITY кандидатов. Оба обновляются на
+приеме пачкой и сливаются сложением, поэтому каждый воркер пишет в Redis только свои окна
+(top:{уровень}:{начало окна}:{воркер}), а запрос складывает окна всех воркеров за период.
+Кандидаты — объединение Space-Saving, счет — оценка CMS по сумме окон (верхняя граница),
+нижняя граница — сумма счетчиков Space-Saving за вычетом их ошибок.
+
+Два уровня окон: 5 минут (хранятся TOP_FINE_RETENTION_HOURS) и час (TOP_COARSE_RETENTION_HOURS);
+длинные периоды читаются часовыми окнами — число читаемых окон ограничено независимо от объема
+логов. Граница периода округляется до окна.
+"""
+import base64
+import hashlib
+import heapq
+import json
+import os
+import socket
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+TOP_DIMENSIONS = tuple(filter(None, os.getenv(
+    "TOP_DIMENSIONS", "source,src_ip,username,dst_port,bert_class,anomaly_source"
+).split(",")))
+TOP_CMS_WIDTH = int(os.getenv("TOP_CMS_WIDTH", 1024))
+TOP_CMS_DEPTH = int(os.getenv("TOP_CMS_DEPTH", 4))
+TOP_CAPACITY = int(os.getenv("TOP_CAPACITY", 200))
+TOP_FLUSH_SECONDS = float(os.getenv("TOP_FLUSH_SECONDS", 5))
+TOP_FINE_RETENTION_HOURS = float(os.getenv("TOP_FINE_RETENTION_HOURS", 6))
+TOP_COARSE_RETENTION_HOURS = float(os.getenv("TOP_COARSE_RETENTION_HOURS", 7 * 24))
+
+# Уровень окон: (имя, длина окна в секундах, сколько хранить в Redis)
+LEVELS = (
+    ("5m", 300, TOP_FINE_RETENTION_HOURS * 3600),
+    ("1h", 3600, TOP_COARSE_RETENTION_HOURS * 3600),
+)
+WINDOWS_KEY = "top:windows"
+KEY_PREFIX = "top:"
+
+
+def _hashes(value: str, depth: int, width: int) -> List[int]:
+    """Индексы в строках CMS: двойное хэширование (Kirsch, Mitzenmacher) одного blake2b"""
+    digest = hashlib.blake2b(value.encode(), digest_size=8).digest()
+    h1 = int.from_bytes(digest[:4], "little")
+    h2 = int.from_bytes(digest[4:], "little") | 1
+    return [(h1 + row * h2) % width for row in range(depth)]
+
+
+class SpaceSaving:
+    """capacity самых частых элементов: счетчик (верхняя граница) и ошибка для каждого"""
+
+    __slots__ = ("capacity", "counts", "errors", "_heap")
+
+    def __init__(self, capacity: int = TOP_CAPACITY):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        # Одна запись на элемент; счетчик в куче может отставать — сверяется при вытеснении
+        self._heap: List[Tuple[int, str]] = []
+
+    def add(self, item: str, count: int = 1):
+        counts = self.counts
+        if item in counts:
+            counts[item] += count
+            return
+        if len(counts) < self.capacity:
+            counts[item] = count
+            self.errors[item] = 0
+            heapq.heappush(self._heap, (count, item))
+            return
+
+        heap = self._heap
+        while True:
+            minimum, victim = heap[0]
+            actual = counts[victim]
+            if actual == minimum:
+                break
+            heapq.heapreplace(heap, (actual, victim))
+        del counts[victim]
+        del self.errors[victim]
+        counts[item] = minimum + count
+        self.errors[item] = minimum
+        heapq.heapreplace(heap, (minimum + count, item))
+
+    def dump(self) -> str:
+        return json.dumps({"c": self.counts, "e": self.errors}, separators=(",", ":"))
+
+
+class WindowSketch:
+    """CMS, Space-Saving и общий счетчик по каждому измерению для одного окна"""
+
+    def __init__(self, dimensions: Tuple[str, ...], depth: int, width: int, capacity: int):
+        self.cms = {dimension: np.zeros((depth, width), dtype=np.uint32) for dimension in dimensions}
+        self.top = {dimension: SpaceSaving(capacity) for dimension in dimensions}
+        self.totals = {dimension: 0 for dimension in dimensions}
+        self.dirty = False
+
+
+class HeavyHitters:
+    """Окна текущего процесса по уровням и их запись в Redis"""
+
+    def __init__(
+        self,
+        dimensions: Tuple[str, ...] = TOP_DIMENSIONS,
+        width: int = TOP_CMS_WIDTH,
+        depth: int = TOP_CMS_DEPTH,
+        capacity: int = TOP_CAPACITY,
+        flush_seconds: float = TOP_FLUSH_SECONDS,
+        worker_id: Optional[str] = None
+    ):
+        self.dimensions = dimensions
+        self.width = width
+        self.depth = depth
+        self.capacity = capacity
+        self.flush_seconds = flush_seconds
+        # pid задается лениво: воркеры serve.py форкаются после импорта модуля
+        self._worker_id = worker_id
+        self._hash_cache: Dict[str, List[int]] = {}
+        # Открытое окно каждого уровня: (начало, скетч); закрытые ждут записи в Redis
+        self.current: Dict[str, Tuple[int, WindowSketch]] = {}
+        self._closed: List[Tuple[str, int, WindowSketch]] = []
+        self._flushed_at = 0.0
+        self.counters = {"events": 0, "flushes": 0}
+
+    @property
+    def worker_id(self) -> str:
+        return self._worker_id or f"{socket.gethostname()}-{os.getpid()}"
+
+    def _indexes(self, value: str) -> List[int]:
+        indexes = self._hash_cache.get(value)
+        if indexes is None:
+            if len(self._hash_cache) >= 100000:
+                self._hash_cache.clear()
+            indexes = self._hash_cache[value] = _hashes(value, self.depth, self.width)
+        return indexes
+
+    def _window(self, level: str, window_seconds: int, now: float) -> WindowSketch:
+        start = int(now // window_seconds) * window_seconds
+        current = self.current.get(level)
+        if current is not None and current[0] == start:
+            return current[1]
+        if current is not None and current[1].dirty:
+            self._closed.append((level, current[0], current[1]))
+        sketch = WindowSketch(self.dimensions, self.depth, self.width, self.capacity)
+        self.current[level] = (start, sketch)
+        return sketch
+
+    def add_batch(self, columns: Dict[str, Iterable[Any]], now: Optional[float] = None):
+        """columns: измерение -> значения по логам пачки (None и пустые пропускаются)"""
+        now = time.time() if now is None else now
+        sketches = [self._window(level, window_seconds, now) for level, window_seconds, _ in LEVELS]
+        for dimension in self.dimensions:
+            counter = Counter(str(value) for value in columns.get(dimension, ()) if value not in (None, ""))
+            if not counter:
+                continue
+            # Все ячейки пачки одним np.add.at: строка CMS x значение
+            columns_index = np.array([self._indexes(value) for value in counter], dtype=np.int64).T.ravel()
+            row_index = np.arange(self.depth).repeat(len(counter))
+            amounts = np.tile(np.fromiter(counter.values(), dtype=np.uint32, count=len(counter)), self.depth)
+            total = sum(counter.values())
+            for sketch in sketches:
+                np.add.at(sketch.cms[dimension], (row_index, columns_index), amounts)
+                top = sketch.top[dimension]
+                for value, count in counter.items():
+                    top.add(value, count)
+                sketch.totals[dimension] += total
+                sketch.dirty = True
+        self.counters["events"] += len(next(iter(columns.values()), ()))
+
+    def flush(self, pipeline, force: bool = False):
+        """Добавляет в Redis pipeline закрытые окна и (раз в flush_seconds) открытые"""
+        now = time.time()
+        if not force and not self._closed and now - self._flushed_at < self.flush_seconds:
+            return
+        windows = self._closed
+        self._closed = []
+        windows += [(level, start, sketch) for level, (start, sketch) in self.current.items() if sketch.dirty]
+        retention = {level: seconds for level, _, seconds in LEVELS}
+        for level, start, sketch in windows:
+            member = f"{level}:{start}:{self.worker_id}"
+            key = KEY_PREFIX + member
+            fields = {}
+            for dimension in self.dimensions:
+                if sketch.totals[dimension]:
+                    fields[f"{dimension}:cms"] = base64.b64encode(sketch.cms[dimension].tobytes()).decode()
+                    fields[f"{dimension}:top"] = sketch.top[dimension].dump()
+                    fields[f"{dimension}:total"] = sketch.totals[dimension]
+            fields["shape"] = f"{self.depth}x{self.width}"
+            pipeline.hset(key, mapping=fields)
+            pipeline.expire(key, int(retention[level]))
+            pipeline.zadd(WINDOWS_KEY, {member: start})
+            sketch.dirty = False
+        # Индекс окон чистим по самому долгому хранению; короткие окна отсеиваются по уровню
+        pipeline.zremrangebyscore(WINDOWS_KEY, "-inf", now - max(retention.values()))
+        self._flushed_at = now
+        self.counters["flushes"] += 1
+
+    def top(self, redis_client, dimension: str, seconds: float, limit: int = 10) -> Dict[str, Any]:
+        """Топ значений измерения за последние seconds по окнам всех воркеров"""
+        pipeline = redis_client.pipeline(transaction=False)
+        self.flush(pipeline, force=True)
+        pipeline.execute()
+
+        now = time.time()
+        level, window_seconds = next(
+            ((name, size) for name, size, retention in LEVELS if seconds <= retention), LEVELS[-1][:2]
+        )
+        since = int((now - seconds) // window_seconds) * window_seconds
+        members = [
+            member for member in redis_client.zrangebyscore(WINDOWS_KEY, since, "+inf")
+            if member.startswith(level + ":")
+        ]
+        pipeline = redis_client.pipeline(transaction=False)
+        for member in members:
+            pipeline.hmget(KEY_PREFIX + member, "shape", f"{dimension}:cms", f"{dimension}:top", f"{dimension}:total")
+        replies = pipeline.execute() if members else []
+
+        cms = np.zeros((self.depth, self.width), dtype=np.uint64)
+        counts: Counter = Counter()
+        errors: Counter = Counter()
+        total = windows = 0
+        for shape, encoded_cms, encoded_top, window_total in replies:
+            if not encoded_cms or shape != f"{self.depth}x{self.width}":
+                continue
+            cms += np.frombuffer(base64.b64decode(encoded_cms), dtype=np.uint32).reshape(self.depth, self.width)
+            summary = json.loads(encoded_top)
+            counts.update(summary["c"])
+            errors.update(summary["e"])
+            total += int(window_total)
+            windows += 1
+
+        rows = np.arange(self.depth)
+        items = []
+        for value, count in counts.items():
+            estimate = int(cms[rows, self._indexes(value)].min())
+            items.append({"value": value, "count": estimate, "min_count": max(count - errors[value], 0)})
+        items.sort(key=lambda item: -item["count"])
+        return {
+            "dimension": dimension,
+            "level": level,
+            "since": since,
+            "windows": windows,
+            "total": total,
+            "top": items[:limit]
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "worker": self.worker_id,
+            "dimensions": list(self.dimensions),
+            "cms": f"{self.depth}x{self.width}",
+            "capacity": self.capacity,
+            "pending_closed_windows": len(self._closed),
+            **self.counters
+        }
+
+
+heavy_hitters = HeavyHitters()
@@ -0,0 +1,311 @@
+"""
+Корреляция аномалий в инциденты.
+
+Одно падение линка дает десятки аномалий (if_down, bfd_down, OSPF_NBRDOWN, bgp_nbr_down)
+на обоих концах и соседях. IncidentCorrelator относит каждую аномалию к инциденту:
+  - класс аномалии -> группа связанных классов (INCIDENT_RELATIONS_FILE или DEFAULT_RELATIONS),
+    класс вне групп — сам себе группа;
+  - ключ корреляции — группа и source; для групп с cross_source (сетевые протоколы,
+    которые падают по цепочке на соседях) — только группа;
+  - аномалия присоединяется к открытому инциденту своего ключа, если с последней аномалии
+    прошло меньше INCIDENT_WINDOW_SECONDS и инцидент не длиннее INCIDENT_MAX_DURATION_SECONDS,
+    иначе открывается новый.
+
+В памяти — только открытые инциденты (id, время, severity) по ключу. Сам инцидент живет
+в Redis: incident:{id} (hash), :sources (set), :classes (hash класс -> число), :anomalies
+(list), incidents:timestamps (zset по first_seen) и incident_open:{ключ} -> id с TTL окна.
+Последний ключ открывается SET NX, поэтому воркеры и перезапущенный процесс продолжают тот
+же инцидент, а "новый инцидент" случается ровно один раз; первый алерт по нему — HSETNX
+alerted_at (claim_alert).
+"""
+import json
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+INCIDENT_WINDOW_SECONDS = float(os.getenv("INCIDENT_WINDOW_SECONDS", 300))
+INCIDENT_MAX_DURATION_SECONDS = float(os.getenv("INCIDENT_MAX_DURATION_SECONDS", 6 * 3600))
+INCIDENT_RELATIONS_FILE = os.getenv("INCIDENT_RELATIONS_FILE", "")
+# Сколько id аномалий хранить в списке инцидента (счетчики считают все)
+INCIDENT_MAX_ANOMALIES = int(os.getenv("INCIDENT_MAX_ANOMALIES", 500))
+
+INCIDENTS_KEY = "incidents:timestamps"
+INCIDENT_KEY_PREFIX = "incident:"
+OPEN_KEY_PREFIX = "incident_open:"
+
+SEVERITY_ORDER = {"low": 0, "medium": 1, "high": 2}
+
+# Группы связанных классов; cross_source — аномалии разных устройств идут в один инцидент
+DEFAULT_RELATIONS: Dict[str, Dict[str, Any]] = {
+    "link_failure": {
+        "cross_source": True,
+        "classes": [
+            "INTERFACE_FLAP", "if_down", "if_flap", "LLDP_NBR_DOWN", "SMIC_SFPP_FAILED",
+            "bfd_change", "bfd_down", "bfd_flap", "bfd_state_change",
+            "OSPF_NBRDOWN", "ospf_neigh_state_flap",
+            "BGP_INFO", "bgp_nbr_down", "bgp_nbr_reset", "bgp_state_change", "bgp_updown",
+            "RSVP_NBRDOWN", "RPD_RSVP_BYPASS_DOWN", "MPLS_PATH_STATUS", "rt_entry_failed", "stp_change"
+        ]
+    },
+    "hardware": {
+        "cross_source": False,
+        "classes": ["ASIC_ALARM", "system_reboot", "critical_log_event"]
+    },
+    "configuration": {
+        "cross_source": False,
+        "classes": ["MPLS_CONFIG_CHANGE", "MPLS_INTF_MAX_LABELS_ERROR"]
+    },
+    "access": {
+        "cross_source": False,
+        "classes": ["ssh", "SNMPD_AUTH_FAILURE", "if_security"]
+    },
+    "firewall": {
+        "cross_source": False,
+        "classes": ["firewall_critical", "firewall_high"]
+    }
+}
+
+
+def load_relations(path: str = INCIDENT_RELATIONS_FILE) -> Dict[str, Dict[str, Any]]:
+    """Группы классов из JSON файла ({"группа": {"classes": [...], "cross_source": bool}})"""
+    if not path:
+        return DEFAULT_RELATIONS
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Incident relations not loaded from {path}, using defaults: {e}")
+        return DEFAULT_RELATIONS
+
+
+class OpenIncident:
+    __slots__ = ("id", "first_seen", "last_seen", "severity")
+
+    def __init__(self, incident_id: str, first_seen: float, last_seen: float, severity: str):
+        self.id = incident_id
+        self.first_seen = first_seen
+        self.last_seen = last_seen
+        self.severity = severity
+
+
+class IncidentCorrelator:
+    """Открытые инциденты по ключу корреляции; запись в Redis — одним pipeline на аномалию"""
+
+    def __init__(
+        self,
+        redis_client,
+        relations: Optional[Dict[str, Dict[str, Any]]] = None,
+        window_seconds: float = INCIDENT_WINDOW_SECONDS,
+        max_duration_seconds: float = INCIDENT_MAX_DURATION_SECONDS
+    ):
+        self.redis_client = redis_client
+        self.window_seconds = window_seconds
+        self.max_duration_seconds = max_duration_seconds
+        self.groups: Dict[str, Tuple[str, bool]] = {}
+        for group, relation in (relations if relations is not None else load_relations()).items():
+            for class_name in relation.get("classes", []):
+                self.groups[class_name] = (group, bool(relation.get("cross_source", False)))
+        self.open: Dict[str, OpenIncident] = {}
+        self.counters = {"opened": 0, "joined": 0, "escalated": 0}
+
+    def correlation_key(self, class_name: str, source: str) -> Tuple[str, str]:
+        """(группа, ключ корреляции) для класса аномалии и источника"""
+        group, cross_source = self.groups.get(class_name, (class_name, False))
+        return group, group if cross_source else f"{group}|{source}"
+
+    def correlate(self, anomaly: Dict[str, Any]) -> Tuple[str, str]:
+        """
+        Относит сохраняемую аномалию к инциденту и записывает его в Redis.
+        Возвращает (incident_id, событие): opened, escalated (severity выросла) или joined
+        """
+        class_name = anomaly.get('bert_class', 'unknown')
+        source = anomaly.get('source', 'unknown')
+        severity = anomaly.get('severity', 'low')
+        group, key = self.correlation_key(class_name, source)
+        now = time.time()
+        self._expire(now)
+
+        incident = self.open.get(key)
+        if incident is not None and self._resolved(incident.id):
+            # Закрыт аналитиком (в том числе через другой воркер) — не присоединяем
+            del self.open[key]
+            incident = None
+        if incident is not None and now - incident.first_seen > self.max_duration_seconds:
+            # Слишком длинный инцидент закрываем — следующая аномалия откроет новый
+            self.redis_client.delete(OPEN_KEY_PREFIX + key)
+            del self.open[key]
+            incident = None
+
+        opened = False
+        if incident is None:
+            incident, opened = self._open_or_adopt(key, now, severity)
+            self.open[key] = incident
+
+        escalated = SEVERITY_ORDER.get(severity, 0) > SEVERITY_ORDER.get(incident.severity, 0)
+        if escalated:
+            incident.severity = severity
+        incident.last_seen = now
+
+        incident_key = INCIDENT_KEY_PREFIX + incident.id
+        pipeline = self.redis_client.pipeline(transaction=False)
+        if opened:
+            pipeline.hset(incident_key, mapping={
+                'id': incident.id,
+                'group': group,
+                'title': f"{group}: {class_name} on {source}",
+                'status': 'open',
+                'correlation_key': key,
+                'first_seen': anomaly.get('timestamp', datetime.utcnow().isoformat()),
+                'first_seen_ts': str(now),
+                'severity': severity
+            })
+            pipeline.zadd(INCIDENTS_KEY, {incident.id: now})
+        elif escalated:
+            pipeline.hset(incident_key, 'severity', severity)
+        pipeline.hset(incident_key, mapping={
+            'last_seen': anomaly.get('timestamp', datetime.utcnow().isoformat()),
+            'last_seen_ts': str(now)
+        })
+        pipeline.hincrby(incident_key, 'anomaly_count', 1)
+        pipeline.sadd(incident_key + ":sources", source)
+        pipeline.hincrby(incident_key + ":classes", class_name, 1)
+        pipeline.lpush(incident_key + ":anomalies", anomaly.get('id', ''))
+        pipeline.ltrim(incident_key + ":anomalies", 0, INCIDENT_MAX_ANOMALIES - 1)
+        pipeline.expire(OPEN_KEY_PREFIX + key, int(self.window_seconds))
+        pipeline.execute()
+
+        event = "opened" if opened else "escalated" if escalated else "joined"
+        self.counters[event] += 1
+        return incident.id, event
+
+    def claim_alert(self, incident_id: str) -> bool:
+        """
+        Первый алерт по инциденту — HSETNX alerted_at: ровно один на инцидент среди воркеров,
+        в том числе когда порог прошла не открывшая инцидент аномалия, а присоединившаяся позже
+        """
+        return bool(self.redis_client.hsetnx(INCIDENT_KEY_PREFIX + incident_id, 'alerted_at', datetime.utcnow().isoformat()))
+
+    def _open_or_adopt(self, key: str, now: float, severity: str) -> Tuple[OpenIncident, bool]:
+        """Новый инцидент или открытый другим воркером (до рестарта) — по incident_open:{ключ}"""
+        open_key = OPEN_KEY_PREFIX + key
+        incident_id = str(uuid.uuid4())
+        if self.redis_client.set(open_key, incident_id, nx=True, ex=int(self.window_seconds)):
+            return OpenIncident(incident_id, now, now, severity), True
+
+        existing = self.redis_client.get(open_key)
+        if not existing:
+            # Ключ истек между SET и GET — открываем свой
+            self.redis_client.set(open_key, incident_id, ex=int(self.window_seconds))
+            return OpenIncident(incident_id, now, now, severity), True
+        first_seen, current_severity, status = self.redis_client.hmget(
+            INCIDENT_KEY_PREFIX + existing, 'first_seen_ts', 'severity', 'status'
+        )
+        if status == 'resolved':
+            # Ключ пережил закрытие (resolve до рестарта или гонка с другим воркером)
+            self.redis_client.set(open_key, incident_id, ex=int(self.window_seconds))
+            return OpenIncident(incident_id, now, now, severity), True
+        return OpenIncident(existing, float(first_seen or now), now, current_severity or severity), False
+
+    def _resolved(self, incident_id: str) -> bool:
+        return self.redis_client.hget(INCIDENT_KEY_PREFIX + incident_id, 'status') == 'resolved'
+
+    def _expire(self, now: float):
+        """Инциденты без аномалий дольше окна закрыты — выбрасываем из памяти"""
+        stale = [key for key, incident in self.open.items() if now - incident.last_seen > self.window_seconds]
+        for key in stale:
+            del self.open[key]
+
+    def get(self, incident_id: str, anomalies_limit: int = 50) -> Optional[Dict[str, Any]]:
+        """Инцидент из Redis с источниками, классами и последними id аномалий"""
+        incident_key = INCIDENT_KEY_PREFIX + incident_id
+        pipeline = self.redis_client.pipeline(transaction=False)
+        pipeline.hgetall(incident_key)
+        pipeline.smembers(incident_key + ":sources")
+        pipeline.hgetall(incident_key + ":classes")
+        pipeline.lrange(incident_key + ":anomalies", 0, anomalies_limit - 1)
+        data, sources, classes, anomaly_ids = pipeline.execute()
+        if not data:
+            return None
+        return self._decode(data, sources, classes, anomaly_ids)
+
+    def search(
+        self,
+        status: Optional[str] = None,
+        hours: float = 24,
+        limit: int = 50,
+        offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        """Инциденты за последние hours часов, новые первыми (status: open/closed/resolved)"""
+        incident_ids = self.redis_client.zrevrangebyscore(INCIDENTS_KEY, "+inf", time.time() - hours * 3600)
+        incidents = []
+        # Статус вычисляется по last_seen, поэтому фильтр — после чтения; читаем пачками
+        for start in range(0, len(incident_ids), 200):
+            chunk = incident_ids[start:start + 200]
+            pipeline = self.redis_client.pipeline(transaction=False)
+            for incident_id in chunk:
+                incident_key = INCIDENT_KEY_PREFIX + incident_id
+                pipeline.hgetall(incident_key)
+                pipeline.smembers(incident_key + ":sources")
+                pipeline.hgetall(incident_key + ":classes")
+            replies = pipeline.execute()
+            for index in range(len(chunk)):
+                data, sources, classes = replies[index * 3:index * 3 + 3]
+                if not data:
+                    continue
+                incident = self._decode(data, sources, classes)
+                if status and incident["status"] != status:
+                    continue
+                incidents.append(incident)
+            if len(incidents) >= offset + limit:
+                break
+        return incidents[offset:offset + limit]
+
+    def resolve(self, incident_id: str) -> bool:
+        """Ручное закрытие аналитиком: новые аномалии того же ключа откроют новый инцидент"""
+        incident_key = INCIDENT_KEY_PREFIX + incident_id
+        if not self.redis_client.exists(incident_key):
+            return False
+        self.redis_client.hset(incident_key, mapping={'status': 'resolved', 'resolved_at': datetime.utcnow().isoformat()})
+        # Ключ открытого инцидента снимаем независимо от того, какой воркер его держит в памяти,
+        # но только если он еще указывает на этот инцидент
+        key = self.redis_client.hget(incident_key, 'correlation_key')
+        if key and self.redis_client.get(OPEN_KEY_PREFIX + key) == incident_id:
+            self.redis_client.delete(OPEN_KEY_PREFIX + key)
+        for key, incident in list(self.open.items()):
+            if incident.id == incident_id:
+                del self.open[key]
+        return True
+
+    def _decode(self, data: Dict[str, str], sources, classes: Dict[str, str], anomaly_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        status = data.get('status', 'open')
+        if status == 'open' and time.time() - float(data.get('last_seen_ts', 0)) > self.window_seconds:
+            status = 'closed'
+        incident = {
+            "id": data.get('id'),
+            "title": data.get('title'),
+            "group": data.get('group'),
+            "status": status,
+            "severity": data.get('severity'),
+            "anomaly_count": int(data.get('anomaly_count', 0)),
+            "first_seen": data.get('first_seen'),
+            "last_seen": data.get('last_seen'),
+            "sources": sorted(sources),
+            "classes": dict(sorted(((name, int(count)) for name, count in classes.items()), key=lambda item: -item[1]))
+        }
+        if data.get('resolved_at'):
+            incident["resolved_at"] = data['resolved_at']
+        if data.get('alerted_at'):
+            incident["alerted_at"] = data['alerted_at']
+        if anomaly_ids is not None:
+            incident["anomaly_ids"] = anomaly_ids
+        return incident
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "open_in_memory": len(self.open),
+            "window_seconds": self.window_seconds,
+            "groups": len(set(group for group, _ in self.groups.values())),
+            **self.counters
+        }
@@ -0,0 +1,257 @@
+"""
+Сверка событий с индикаторами компрометации (threat intel) на приеме.
+
+Списки — локальные файлы IOC_DIR/{вид}*.txt (ip, username, command), по значению в строке,
+# — комментарий; списки на миллионы записей. Проверять каждое поле каждого события через
+SISMEMBER в Redis — лишний сетевой запрос на событие, поэтому на каждый вид в памяти держится
+Bloom filter (~1.8 байта на запись при IOC_FP_RATE 0.001), проверяемый для всей пачки сразу
+в numpy. Только попадания фильтра (настоящие и ложные, доля ~IOC_FP_RATE) подтверждаются
+точно — одним Redis pipeline SISMEMBER по множеству ioc:{вид}:{версия}.
+
+Файлы проверяются раз в IOC_RELOAD_SECONDS; изменившиеся списки пересобираются в фоновом
+потоке (фильтр и множество в Redis под новой версией) и подменяют старые целиком —
+прием в это время работает со старыми.
+"""
+import glob
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+IOC_ENABLED = os.getenv("IOC_ENABLED", "true").lower() == "true"
+IOC_DIR = os.getenv("IOC_DIR", "/app/ioc")
+IOC_FP_RATE = float(os.getenv("IOC_FP_RATE", 0.001))
+IOC_RELOAD_SECONDS = float(os.getenv("IOC_RELOAD_SECONDS", 30))
+# Сколько живет множество прошлой версии списка после перехода на новую (для других воркеров)
+IOC_OLD_VERSION_TTL = int(os.getenv("IOC_OLD_VERSION_TTL", 600))
+
+# Вид списка -> нормализованные поля события, которые с ним сверяются
+IOC_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "ip": ("src_ip", "dst_ip"),
+    "username": ("username",),
+    "command": ("command",),
+}
+IOC_KEY_PREFIX = "ioc:"
+SADD_CHUNK = 10000
+
+
+def _normalize(kind: str, value: Any) -> str:
+    value = str(value).strip()
+    return value if kind == "command" else value.lower()
+
+
+def _hash_pairs(values: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Два 64-битных хэша значения (blake2b) — для двойного хэширования Bloom filter"""
+    digests = b"".join(hashlib.blake2b(value.encode(), digest_size=16).digest() for value in values)
+    pairs = np.frombuffer(digests, dtype=np.uint64).reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1] | np.uint64(1)
+
+
+class BloomFilter:
+    """Bloom filter на numpy: добавление и проверка пачками"""
+
+    def __init__(self, capacity: int, fp_rate: float = IOC_FP_RATE):
+        capacity = max(capacity, 1)
+        self.size = max(int(-capacity * np.log(fp_rate) / np.log(2) ** 2), 64)
+        self.hashes = max(int(round(self.size / capacity * np.log(2))), 1)
+        self.bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    def _positions(self, values: List[str]) -> np.ndarray:
+        h1, h2 = _hash_pairs(values)
+        steps = np.arange(self.hashes, dtype=np.uint64)
+        with np.errstate(over="ignore"):
+            return (h1[:, None] + steps[None, :] * h2[:, None]) % np.uint64(self.size)
+
+    def add_many(self, values: List[str]):
+        for start in range(0, len(values), 100000):
+            positions = self._positions(values[start:start + 100000]).ravel()
+            np.bitwise_or.at(self.bits, positions >> np.uint64(3), (1 << (positions & np.uint64(7))).astype(np.uint8))
+        self.count += len(values)
+
+    def contains_many(self, values: List[str]) -> np.ndarray:
+        if not values:
+            return np.zeros(0, dtype=bool)
+        positions = self._positions(values)
+        bits = (self.bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+        return bits.all(axis=1)
+
+    @property
+    def memory_bytes(self) -> int:
+        return int(self.bits.nbytes)
+
+
+class IOCList:
+    __slots__ = ("kind", "version", "redis_key", "bloom", "files")
+
+    def __init__(self, kind: str, version: str, bloom: BloomFilter, files: List[str]):
+        self.kind = kind
+        self.version = version
+        self.redis_key = f"{IOC_KEY_PREFIX}{kind}:{version}"
+        self.bloom = bloom
+        self.files = files
+
+
+class IOCMatcher:
+    """Фильтры по видам списков, точная проверка попаданий в Redis и фоновая перезагрузка"""
+
+    def __init__(self, redis_client, directory: str = IOC_DIR, fp_rate: float = IOC_FP_RATE):
+        self.redis_client = redis_client
+        self.directory = directory
+        self.fp_rate = fp_rate
+        self.lists: Dict[str, IOCList] = {}
+        self._signatures: Dict[str, str] = {}
+        self._checked_at = 0.0
+        self._reload_thread: Optional[threading.Thread] = None
+        self.error: Optional[str] = None
+        self.counters = {"checked": 0, "filter_hits": 0, "confirmed": 0, "reloads": 0}
+
+    def _scan(self) -> Dict[str, Tuple[str, List[str]]]:
+        """Вид -> (версия по именам, размерам и mtime файлов, файлы)"""
+        found = {}
+        for kind in IOC_FIELDS:
+            files = sorted(glob.glob(os.path.join(self.directory, f"{kind}*.txt")))
+            if not files:
+                continue
+            signature = "|".join(f"{path}:{os.path.getsize(path)}:{os.path.getmtime(path)}" for path in files)
+            found[kind] = (hashlib.sha1(signature.encode()).hexdigest()[:12], files)
+        return found
+
+    def check_reload(self):
+        """Раз в IOC_RELOAD_SECONDS: изменились списки — пересборка в фоновом потоке"""
+        self._checked_at = time.monotonic()
+        if self._reload_thread is not None and self._reload_thread.is_alive():
+            return
+        try:
+            found = self._scan()
+        except OSError as e:
+            self.error = str(e)
+            return
+        changed = {kind: item for kind, item in found.items() if self._signatures.get(kind) != item[0]}
+        if any(kind not in found for kind in self.lists):
+            # Словарь подменяется целиком: прием читает его без блокировок
+            self.lists = {kind: ioc_list for kind, ioc_list in self.lists.items() if kind in found}
+            self._signatures = {kind: version for kind, version in self._signatures.items() if kind in found}
+        if changed:
+            self._reload_thread = threading.Thread(target=self._reload, args=(changed,), name="ioc-reload", daemon=True)
+            self._reload_thread.start()
+
+    def _reload(self, changed: Dict[str, Tuple[str, List[str]]]):
+        for kind, (version, files) in changed.items():
+            started = time.perf_counter()
+            try:
+                ioc_list = self._build(kind, version, files)
+            except Exception as e:
+                self.error = f"{kind}: {e}"
+                print(f"IOC list {kind} not loaded: {e}")
+                continue
+            previous = self.lists.get(kind)
+            self.lists = {**self.lists, kind: ioc_list}
+            self._signatures[kind] = version
+            self.counters["reloads"] += 1
+            if previous is not None and previous.redis_key != ioc_list.redis_key:
+                self.redis_client.expire(previous.redis_key, IOC_OLD_VERSION_TTL)
+            print(
+                f"IOC list {kind} loaded: {ioc_list.bloom.count} entries, "
+                f"{ioc_list.bloom.memory_bytes / 1e6:.1f} MB filter, {time.perf_counter() - started:.1f}s"
+            )
+
+    def _build(self, kind: str, version: str, files: List[str]) -> IOCList:
+        values = set()
+        for path in files:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        values.add(_normalize(kind, line))
+        values = list(values)
+        bloom = BloomFilter(len(values), self.fp_rate)
+        bloom.add_many(values)
+        ioc_list = IOCList(kind, version, bloom, files)
+
+        # Множество для точной проверки: другой воркер мог уже записать эту версию; новую
+        # пишем во временный ключ и переименовываем, чтобы не читать наполовину заполненную
+        if not self.redis_client.exists(ioc_list.redis_key):
+            temporary = f"{ioc_list.redis_key}:loading:{os.getpid()}"
+            self.redis_client.delete(temporary)
+            for start in range(0, len(values), SADD_CHUNK):
+                self.redis_client.sadd(temporary, *values[start:start + SADD_CHUNK])
+            if values:
+                self.redis_client.rename(temporary, ioc_list.redis_key)
+        return ioc_list
+
+    def match_batch(self, events: List[Dict[str, Any]]) -> List[Optional[List[Dict[str, str]]]]:
+        """Совпадения по каждому событию (нормализованные поля) или None"""
+        if time.monotonic() - self._checked_at > IOC_RELOAD_SECONDS:
+            self.check_reload()
+        matches: List[Optional[List[Dict[str, str]]]] = [None] * len(events)
+        lists = self.lists
+        if not lists or not events:
+            return matches
+
+        candidates = []
+        for kind, ioc_list in lists.items():
+            fields = IOC_FIELDS[kind]
+            positions, values = [], []
+            for index, event in enumerate(events):
+                for field in fields:
+                    value = event.get(field)
+                    if value not in (None, ""):
+                        positions.append((index, field))
+                        values.append(_normalize(kind, value))
+            if not values:
+                continue
+            self.counters["checked"] += len(values)
+            for (index, field), value, hit in zip(positions, values, ioc_list.bloom.contains_many(values)):
+                if hit:
+                    candidates.append((index, field, kind, value, ioc_list.redis_key))
+        if not candidates:
+            return matches
+
+        self.counters["filter_hits"] += len(candidates)
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for _, _, _, value, redis_key in candidates:
+            pipeline.sismember(redis_key, value)
+        for (index, field, kind, value, _), confirmed in zip(candidates, pipeline.execute()):
+            if not confirmed:
+                continue
+            self.counters["confirmed"] += 1
+            if matches[index] is None:
+                matches[index] = []
+            matches[index].append({"field": field, "list": kind, "value": value})
+        return matches
+
+    @staticmethod
+    def anomaly_result(matches: List[Dict[str, str]]) -> Dict[str, Any]:
+        """Результат в формате классификации — аномалия сохраняется обычным detect_anomaly"""
+        described = ", ".join(f"{match['field']}={match['value']}" for match in matches)
+        return {
+            "class_id": -2,
+            "class_name": "ioc_match",
+            "confidence": 1.0,
+            "is_anomaly": True,
+            "method": "ioc",
+            "ioc_matches": matches,
+            "description": f"Threat intel match: {described}"
+        }
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "directory": self.directory,
+            "lists": {
+                kind: {
+                    "version": ioc_list.version,
+                    "entries": ioc_list.bloom.count,
+                    "filter_bytes": ioc_list.bloom.memory_bytes,
+                    "hashes": ioc_list.bloom.hashes,
+                    "files": [os.path.basename(path) for path in ioc_list.files]
+                }
+                for kind, ioc_list in self.lists.items()
+            },
+            "reloading": self._reload_thread is not None and self._reload_thread.is_alive(),
+            "error": self.error,
+            **self.counters
+        }
@@ -0,0 +1,163 @@
+import asyncio
+import json
+import os
+from typing import Any, AsyncIterator, Dict, Set
+
+import redis.asyncio as aioredis
+
+from chat_stream import sse_event
+
+# Канал Redis, в который публикуется каждая сохраненная аномалия
+ANOMALY_CHANNEL = os.getenv("LIVE_ANOMALY_CHANNEL", "anomalies:live")
+
+# Как часто рассылаем изменения статистики и как часто шлем keep-alive в пустой поток
+STATS_INTERVAL_SECONDS = float(os.getenv("LIVE_STATS_INTERVAL", 5))
+HEARTBEAT_SECONDS = float(os.getenv("LIVE_HEARTBEAT_SECONDS", 15))
+
+# Очередь на подписчика: медленный клиент теряет старые события, а не тормозит остальных
+SUBSCRIBER_QUEUE_SIZE = 256
+
+
+def read_stats_snapshot(redis_client) -> Dict[str, Any]:
+    """Дешевый снимок статистики: O(1) команды одним pipeline, без KEYS"""
+    pipeline = redis_client.pipeline()
+    pipeline.zcard("logs:timestamps")
+    pipeline.llen("logs_list")
+    pipeline.zcard("anomalies:timestamps")
+    pipeline.info("memory")
+    pipeline.info("clients")
+    logs_total, logs_list, anomalies_total, memory, clients = pipeline.execute()
+    return {
+        "logs_total": logs_total,
+        "logs_list": logs_list,
+        "anomalies_total": anomalies_total,
+        "used_memory": memory.get("used_memory_human", "N/A"),
+        "connected_clients": clients.get("connected_clients", 0)
+    }
+
+
+class LiveFeed:
+    """
+    Push-лента для дашбордов.
+
+    Процесс API держит одну подписку на канал аномалий в Redis и одну периодическую задачу
+    статистики, а результат раздает всем подписчикам через их очереди. Нагрузка на Redis
+    не зависит от числа открытых дашбордов.
+    """
+
+    def __init__(self, redis_client, redis_host: str = "redis", redis_port: int = 6379, channel: str = ANOMALY_CHANNEL):
+        self.redis_client = redis_client
+        self.redis_host = redis_host
+        self.redis_port = redis_port
+        self.channel = channel
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.snapshot: Dict[str, Any] = {}
+        self.anomalies_since_stats = 0
+        self.dropped = 0
+        self._tasks = []
+
+    def publish_anomaly(self, anomaly: Dict[str, Any]):
+        """Публикация из пути записи (синхронный клиент, одна команда PUBLISH)"""
+        try:
+            self.redis_client.publish(self.channel, json.dumps(anomaly, ensure_ascii=False, default=str))
+        except Exception as e:
+            print(f"Не удалось опубликовать аномалию в live-ленту: {e}")
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._listen()),
+                asyncio.create_task(self._stats_loop())
+            ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        """SSE поток для одного клиента: сначала текущий снимок, дальше аномалии и изменения статистики"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.subscribers.add(queue)
+        try:
+            yield sse_event({"type": "snapshot", "stats": self.snapshot})
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Комментарий SSE: держит соединение через прокси и выявляет отключившихся
+                    yield b": keep-alive\n\n"
+                    continue
+                yield event
+        finally:
+            self.subscribers.discard(queue)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": len(self.subscribers),
+            "dropped_events": self.dropped,
+            "channel": self.channel,
+            "running": bool(self._tasks)
+        }
+
+    def _broadcast(self, event: Dict[str, Any]):
+        # Сериализуем один раз на всех подписчиков
+        payload = sse_event(event)
+        for queue in self.subscribers:
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(payload)
+
+    async def _listen(self):
+        """Единственная подписка процесса на канал аномалий; переподключается при обрыве"""
+        while True:
+            client = aioredis.Redis(host=self.redis_host, port=self.redis_port, decode_responses=True)
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    try:
+                        anomaly = json.loads(message["data"])
+                    except Exception:
+                        continue
+                    self.anomalies_since_stats += 1
+                    self._broadcast({"type": "anomaly", "anomaly": anomaly})
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Live-лента: потеряна подписка на {self.channel}: {e}")
+                await asyncio.sleep(2)
+            finally:
+                await pubsub.close()
+                await client.close()
+
+    async def _stats_loop(self):
+        """Раз в интервал считаем статистику один раз и рассылаем только изменившиеся поля"""
+        while True:
+            try:
+                current = await asyncio.to_thread(read_stats_snapshot, self.redis_client)
+                changed = {k: v for k, v in current.items() if self.snapshot.get(k) != v}
+                if changed:
+                    delta = {
+                        k: v - self.snapshot[k]
+                        for k, v in changed.items()
+                        if isinstance(v, int) and isinstance(self.snapshot.get(k), int)
+                    }
+                    self._broadcast({
+                        "type": "stats",
+                        "changed": changed,
+                        "delta": delta,
+                        "new_anomalies": self.anomalies_since_stats
+                    })
+                self.snapshot = current
+                self.anomalies_since_stats = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Live-лента: ошибка чтения статистики: {e}")
+            await asyncio.sleep(STATS_INTERVAL_SECONDS)
+
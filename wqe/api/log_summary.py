@@ -0,0 +1,75 @@
+import re
+from collections import Counter, defaultdict
+from typing import Any, Dict, List
+
+# Маскируем изменчивые части сообщения, чтобы одинаковые по смыслу логи схлопывались в один шаблон
+_MASKS = [
+    (re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b"), "<IP>"),
+    (re.compile(r"\b(?:[0-9a-fA-F]{2}:){5}[0-9a-fA-F]{2}\b"), "<MAC>"),
+    (re.compile(r"\b0x[0-9a-fA-F]+\b|\b[0-9a-fA-F]{12,}\b"), "<HEX>"),
+    (re.compile(r"\d+"), "<NUM>"),
+]
+
+MAX_SAMPLE_LENGTH = 300
+
+
+def message_template(text: str) -> str:
+    """Шаблон сообщения: IP, MAC, hex и числа заменены плейсхолдерами"""
+    for pattern, placeholder in _MASKS:
+        text = pattern.sub(placeholder, text)
+    return " ".join(text.split())
+
+
+def summarize_logs(logs: List[Dict[str, Any]], top_templates: int = 20, samples_per_class: int = 3) -> Dict[str, Any]:
+    """
+    Компактная сводка по логам для LLM: счетчики по классам/источникам,
+    самые частые шаблоны сообщений и несколько примеров на каждый класс аномалий
+    """
+    by_class = Counter()
+    by_source = Counter()
+    by_type = Counter()
+    templates = Counter()
+    template_class: Dict[str, Counter] = defaultdict(Counter)
+    samples: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    anomalies = 0
+
+    for log in logs:
+        message = log.get("message", "")
+        bert_class = log.get("bert_class", "unknown")
+        source = log.get("source", "unknown")
+
+        by_class[bert_class] += 1
+        by_source[source] += 1
+        by_type[log.get("log_type", "unknown")] += 1
+
+        template = message_template(message)
+        templates[template] += 1
+        template_class[template][bert_class] += 1
+
+        if log.get("is_anomaly"):
+            anomalies += 1
+            if len(samples[bert_class]) < samples_per_class:
+                samples[bert_class].append({
+                    "source": source,
+                    "timestamp": log.get("timestamp"),
+                    "confidence": round(log.get("bert_confidence", 0.0), 3),
+                    "message": message[:MAX_SAMPLE_LENGTH]
+                })
+
+    return {
+        "total": len(logs),
+        "anomalies": anomalies,
+        "by_bert_class": dict(by_class.most_common()),
+        "by_source": dict(by_source.most_common(20)),
+        "by_log_type": dict(by_type.most_common()),
+        "unique_templates": len(templates),
+        "top_templates": [
+            {
+                "template": template[:MAX_SAMPLE_LENGTH],
+                "count": count,
+                "bert_class": template_class[template].most_common(1)[0][0]
+            }
+            for template, count in templates.most_common(top_templates)
+        ],
+        "anomaly_samples": dict(samples)
+    }
@@ -1,10 +1,12 @@
 from fastapi import FastAPI, HTTPException, APIRouter
-from transformers import BertForSequenceClassification, BertTokenizer
-import torch
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import asyncio
+import os
 import uuid
-from typing import Dict, Any, List, Optional
+import time
+from typing import Dict, Any, List, Optional, Union
 import redis
 import json
 from collections import defaultdict
@@ -12,81 +14,40 @@ from collections import defaultdict
 import numpy as np
 
 from telegram_notifier import telegram_notifier
+from elastic import es_client, app_logs_client, LOGS_INDEX_PREFIX, ANOMALIES_INDEX_PREFIX, monthly_index, ensure_index_templates
+from bulk_writer import bulk_writer
+from model_loader import bert_model, MODEL_WARMUP
+from bert_classes import ANOMALY_CLASSES, CRITICAL_ANOMALY_CLASSES
+from pipeline import IngestPipeline
+from overload import OverloadController
+from cascade import CascadeClassifier, CASCADE_ENABLED
+from template_miner import template_miner, decode_template, TEMPLATES_KEY, TEMPLATE_KEY_PREFIX
+from dedup import DedupWindow, DEDUP_ENABLED
+from incidents import IncidentCorrelator
+from heavy_hitters import heavy_hitters, TOP_DIMENSIONS
+from ioc import IOCMatcher, IOC_ENABLED
+from search_index import SearchIndex, SEARCH_INDEX_ENABLED
+from syslog_server import SyslogServer, SYSLOG_ENABLED
+from chat_stream import agent_stream_proxy, SSE_HEADERS
+from live_feed import LiveFeed
+from health import HealthMonitor
+from profiling import request_profiler, ProfilingMiddleware
+from metrics import (
+    metrics_registry, INGEST_STAGE_SECONDS, INGEST_REQUEST_SECONDS, REDIS_OPERATION_SECONDS,
+    CLASSIFICATIONS_TOTAL, ANOMALIES_TOTAL, TELEGRAM_ALERTS_TOTAL, INCIDENT_EVENTS_TOTAL
+)
+from aggregations import AggregationService
+from log_summary import summarize_logs
+from federated_query import (
+    TieredQuery, HOT_LOGS_HOURS, HOT_ANOMALIES_HOURS, parse_time_range, event_score,
+    decode_redis_log, decode_es_log, decode_redis_anomaly, decode_es_anomaly
+)
 app = FastAPI(title="Security Log API", version="1.0.0")
 
-# Step 1: Load the model and tokenizer from Hugging Face
-model = BertForSequenceClassification.from_pretrained("rahulm-selector/log-classifier-BERT-v1")
-tokenizer = BertTokenizer.from_pretrained("rahulm-selector/log-classifier-BERT-v1")
-
-# Классы аномалий
-ANOMALY_CLASSES = {
-    "0": "ALERT_IFD_CHANGE",
-    "1": "ASIC_ALARM",
-    "2": "BGP_INFO",
-    "3": "INTERFACE_FLAP",
-    "4": "InterfaceEvent",
-    "5": "LLDP_NBR_DOWN",
-    "6": "MPLS_CONFIG_CHANGE",
-    "7": "MPLS_INTF_MAX_LABELS_ERROR",
-    "8": "MPLS_PATH_STATUS",
-    "9": "OAM_ADJACENCY_CFM",
-    "10": "OAM_CFM",
-    "11": "OAM_GENERAL",
-    "12": "OSPF_NBRDOWN",
-    "13": "RPD_RSVP_BYPASS_DOWN",
-    "14": "RPD_RSVP_BYPASS_UP",
-    "15": "RSVP_NBRDOWN",
-    "16": "SMIC_SFPP_FAILED",
-    "17": "SNMPD_AUTH_FAILURE",
-    "18": "VRRPD_MISSING_VIP",
-    "19": "aaa",
-    "20": "bfd_change",
-    "21": "bfd_down",
-    "22": "bfd_flap",
-    "23": "bfd_sess_create",
-    "24": "bfd_sess_destroy",
-    "25": "bfd_state_change",
-    "26": "bgp_nbr_down",
-    "27": "bgp_nbr_reset",
-    "28": "bgp_state_change",
-    "29": "bgp_updown",
-    "30": "cli_cmd_executed",
-    "31": "config_event",
-    "32": "critical_log_event",
-    "33": "demon_timeouts",
-    "34": "eigrp",
-    "35": "firewall_critical",
-    "36": "firewall_high",
-    "37": "firewall_low",
-    "38": "firewall_medium",
-    "39": "if_down",
-    "40": "if_flap",
-    "41": "if_lag",
-    "42": "if_security",
-    "43": "if_updown",
-    "44": "neighbor_updown",
-    "45": "ospf_neigh_state_flap",
-    "46": "port_link_updown",
-    "47": "power_change",
-    "48": "ptp",
-    "49": "rt_entry_add_msg_proc",
-    "50": "rt_entry_failed",
-    "51": "sfp_link_power",
-    "52": "ssh",
-    "53": "stp",
-    "54": "stp_change",
-    "55": "system_reboot",
-    "56": "ui_commit_progress",
-    "57": "ui_config_audit",
-    "58": "vrrp_vlan"
-}
-
-# Критические классы, которые считаются аномалиями
-CRITICAL_ANOMALY_CLASSES = {
-    "1", "2", "3", "5", "6", "7", "8", "12", "13", "15", "16", "17",
-    "20", "21", "22", "25", "26", "27", "28", "29", "32", "35", "36",
-    "39", "40", "42", "45", "50", "52", "54", "55"
-}
+# BERT модель грузится лениво (model_loader): при первой классификации или прогреве на старте
+
+# Максимум логов в одном запросе /api/v1/logs/bulk
+BULK_MAX_LOGS = int(os.getenv("BULK_MAX_LOGS", 5000))
 
 # CORS
 app.add_middleware(
@@ -95,6 +56,10 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Профилирование запросов (по умолчанию выключено — одна проверка флага на запрос)
+app.add_middleware(ProfilingMiddleware, profiler=request_profiler)
+# Операции Redis идут внутри стадий (redis, anomaly), telegram — внутри anomaly
+request_profiler.watch(INGEST_STAGE_SECONDS, details=(REDIS_OPERATION_SECONDS,), nested_stages=("telegram",))
 
 # Инициализация Redis
 redis_client = redis.Redis(host='redis', port=6379, db=0, decode_responses=True)
@@ -102,20 +67,181 @@ redis_client = redis.Redis(host='redis', port=6379, db=0, decode_responses=True)
 # Создаем router для дополнительных эндпоинтов
 router = APIRouter()
 
+# Поиск по диапазону времени: свежее из Redis, старое из Elasticsearch
+logs_history = TieredQuery(
+    redis_client, es_client, "logs:timestamps", LOGS_INDEX_PREFIX, "event_id",
+    HOT_LOGS_HOURS, decode_redis_log, decode_es_log
+)
+anomalies_history = TieredQuery(
+    redis_client, es_client, "anomalies:timestamps", ANOMALIES_INDEX_PREFIX, "id",
+    HOT_ANOMALIES_HOURS, decode_redis_anomaly, decode_es_anomaly
+)
+
+# Push-лента для дашбордов: одна подписка на Redis pub/sub на процесс
+live_feed = LiveFeed(redis_client, redis_host='redis')
+
+# Проверки компонентов в фоне; /health и пробы отдают закэшированный результат
+health_monitor = HealthMonitor()
+health_monitor.register("redis", redis_client.ping)
+# Модель проверяем по состоянию загрузки и прогрева, без прогона инференса
+health_monitor.register("bert_model", bert_model.status)
+health_monitor.register("elasticsearch", es_client.ping, critical=False)
+# Telegram — внешний сервис: проверяем редко и не считаем критичным для приема логов
+health_monitor.register(
+    "telegram",
+    lambda: telegram_notifier.test_connection() if telegram_notifier.enabled else {"ok": False, "status": "disabled"},
+    critical=False,
+    interval=300
+)
+
+# Аномалии группируются в инциденты; алерт — на открытие и рост severity инцидента
+incident_correlator = IncidentCorrelator(redis_client)
+
+# Историческая статистика — агрегациями на стороне OpenSearch/Elasticsearch
+aggregations = AggregationService({"security": es_client, "app": app_logs_client})
+
+# Метрики, которые считаются в момент сбора /metrics
+metrics_registry.gauge(
+    "wqe_queue_depth", "Items waiting in internal queues",
+    lambda: {
+        ("es_bulk",): bulk_writer.stats()["queue_depth"],
+        ("es_bulk_inflight",): bulk_writer.stats()["inflight_flushes"],
+        ("syslog",): len(syslog_server.queue)
+    },
+    ("queue",)
+)
+metrics_registry.gauge(
+    "wqe_overload_degraded", "1 while classification runs in degraded mode",
+    lambda: {(): int(overload_controller.degraded)}
+)
+metrics_registry.gauge(
+    "wqe_bert_demand_ratio", "Seconds of BERT time requested per second",
+    lambda: {(): overload_controller.demand}
+)
+metrics_registry.gauge(
+    "wqe_live_subscribers", "Connected live feed subscribers",
+    lambda: {(): len(live_feed.subscribers)}
+)
+metrics_registry.gauge(
+    "wqe_cache_hit_ratio", "Cache hit ratio",
+    lambda: {("aggregations",): aggregations.cache.stats()["hit_rate"]},
+    ("cache",)
+)
+metrics_registry.gauge(
+    "wqe_component_up", "Result of the last background health check",
+    lambda: {(name,): int(result["ok"]) for name, result in health_monitor.snapshot()["components"].items()},
+    ("component",)
+)
+
+@app.on_event("startup")
+async def startup():
+    await ensure_index_templates()
+    # Таблица шаблонов логов — чтобы id шаблонов не менялись после рестарта
+    try:
+        print(f"Loaded {template_miner.load(redis_client)} log templates")
+    except Exception as e:
+        print(f"Log templates not loaded: {e}")
+    # Фоновая запись логов в долгосрочное хранилище пачками
+    bulk_writer.start()
+    live_feed.start()
+    health_monitor.start()
+    if MODEL_WARMUP:
+        bert_model.start_warm_up()
+    # Списки IOC собираются в фоне; до этого события проходят без сверки
+    if ioc_matcher is not None:
+        ioc_matcher.check_reload()
+    if SYSLOG_ENABLED:
+        await syslog_server.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Сначала syslog — он дописывает очередь через bulk_writer
+    await syslog_server.stop()
+    ingest_pipeline.close_dedup_windows()
+    # Открытые окна топов — в Redis, иначе последние секунды пропадут из /api/v1/top
+    try:
+        pipeline = redis_client.pipeline(transaction=False)
+        heavy_hitters.flush(pipeline, force=True)
+        pipeline.execute()
+    except Exception as e:
+        print(f"Heavy hitters flush error: {e}")
+    await bulk_writer.stop()
+    await live_feed.stop()
+    await health_monitor.stop()
+    await agent_stream_proxy.close()
+
+def store_log_long_term(
+    log_id: str,
+    log_data: Dict[str, Any],
+    log_text: str,
+    timestamp: str,
+    bert_result: Dict[str, Any],
+    normalized_fields: Optional[Dict[str, Any]] = None
+):
+    """Ставим лог в очередь на bulk-запись в Elasticsearch (не ждем сеть); normalized_fields — с типами"""
+    bulk_writer.enqueue(monthly_index(LOGS_INDEX_PREFIX, timestamp), log_id, {
+        **(normalized_fields or {}),
+        'event_id': log_id,
+        'source': log_data.get('source', 'unknown'),
+        'log_type': log_data.get('log_type', 'unknown'),
+        # Severity из разобранной сырой строки (syslog 'err', CEF '8') не затираем пустым
+        'severity': log_data.get('severity') or (normalized_fields or {}).get('severity'),
+        'timestamp': timestamp,
+        'message': log_text,
+        'raw_data': log_data.get('raw_data', {}),
+        'bert_class': bert_result['class_name'],
+        'bert_class_id': bert_result['class_id'],
+        'bert_confidence': bert_result['confidence'],
+        'bert_method': bert_result.get('method', 'bert'),
+        'bert_degraded': bert_result.get('degraded', False),
+        'is_anomaly': bert_result['is_anomaly']
+    })
+
+def update_long_term(kind: str, doc_id: str, timestamp: str, fields: Dict[str, Any]):
+    """Частичное обновление лога или аномалии в Elasticsearch (итог окна повторов)"""
+    prefix = LOGS_INDEX_PREFIX if kind == "log" else ANOMALIES_INDEX_PREFIX
+    bulk_writer.enqueue_update(monthly_index(prefix, timestamp), doc_id, fields)
+
+def _parse_utc(value: str) -> datetime:
+    """ISO строка -> naive datetime в UTC"""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def _history_window(time_range: str, start: Optional[str], end: Optional[str]):
+    """Диапазон времени: явные start/end (ISO) или time_range от текущего момента"""
+    end_dt = _parse_utc(end) if end else datetime.utcnow()
+    if start:
+        start_dt = _parse_utc(start)
+    else:
+        start_dt = end_dt - parse_time_range(time_range)
+    return start_dt, end_dt
+
+def extract_log_text(raw_data: Any) -> str:
+    """Текст лога для анализа: поле msg, исходная строка (raw_parsers) или весь raw_data строкой"""
+    if isinstance(raw_data, dict):
+        return raw_data.get('msg', '') or raw_data.get('raw_line', '') or str(raw_data)
+    return str(raw_data)
+
 def classify_log_with_bert(log_text: str) -> Dict[str, Any]:
     """Классификация лога с помощью BERT модели"""
     try:
+        import torch
+
+        model, tokenizer = bert_model.get()
         # Токенизация текста
-        inputs = tokenizer(
-            log_text,
-            return_tensors="pt",
-            truncation=True,
-            padding=True,
-            max_length=512
-        )
+        with INGEST_STAGE_SECONDS.time("tokenize"):
+            inputs = tokenizer(
+                log_text,
+                return_tensors="pt",
+                truncation=True,
+                padding=True,
+                max_length=512
+            )
         
         # Предсказание
-        with torch.no_grad():
+        with INGEST_STAGE_SECONDS.time("forward"), torch.no_grad():
             outputs = model(**inputs)
         
         # Получаем предсказания
@@ -124,6 +250,7 @@ def classify_log_with_bert(log_text: str) -> Dict[str, Any]:
         confidence = predictions[0][predicted_class].item()
         
         class_name = ANOMALY_CLASSES.get(str(predicted_class), "UNKNOWN")
+        CLASSIFICATIONS_TOTAL.inc(class_name)
         
         return {
             "class_id": predicted_class,
@@ -133,6 +260,7 @@ def classify_log_with_bert(log_text: str) -> Dict[str, Any]:
         }
     
     except Exception as e:
+        CLASSIFICATIONS_TOTAL.inc("ERROR")
         return {
             "class_id": -1,
             "class_name": "ERROR",
@@ -166,37 +294,142 @@ async def detect_and_store_anomaly(log_data: Dict[str, Any], bert_result: Dict[s
             'bert_class_id': bert_result['class_id'],
             'confidence': confidence,
             'severity': severity,
-            'description': f"BERT detected anomaly: {bert_result['class_name']} (confidence: {confidence:.3f})",
+            'description': bert_result.get('description') or f"BERT detected anomaly: {bert_result['class_name']} (confidence: {confidence:.3f})",
             'raw_log': json.dumps(log_data.get('raw_data', {})),
+            'classification_method': bert_result.get('method', 'bert'),
             'status': 'new'
         }
+        if bert_result.get('ioc_matches'):
+            anomaly_data['ioc_matches'] = json.dumps(bert_result['ioc_matches'])
+
+        # Инцидент — до записи, чтобы incident_id попал и в Redis, и в Elasticsearch
+        incident_event = None
+        try:
+            with REDIS_OPERATION_SECONDS.time("incident_correlate"):
+                anomaly_data['incident_id'], incident_event = incident_correlator.correlate(anomaly_data)
+            INCIDENT_EVENTS_TOTAL.inc(incident_event)
+        except Exception as e:
+            print(f"Incident correlation error: {e}")
         
         # Сохраняем аномалию в Redis
         anomaly_key = f"anomaly:{anomaly_id}"
-        redis_client.hset(anomaly_key, mapping=anomaly_data)
+        with REDIS_OPERATION_SECONDS.time("anomaly_hset"):
+            redis_client.hset(anomaly_key, mapping=anomaly_data)
         
         # Добавляем в отсортированный набор по времени
-        redis_client.zadd("anomalies:timestamps", {anomaly_key: datetime.utcnow().timestamp()})
+        with REDIS_OPERATION_SECONDS.time("anomaly_zadd"):
+            redis_client.zadd("anomalies:timestamps", {anomaly_key: event_score(timestamp)})
         
         # Добавляем в список всех аномалий
-        redis_client.lpush("anomalies_list", anomaly_id)
+        with REDIS_OPERATION_SECONDS.time("anomaly_lpush"):
+            redis_client.lpush("anomalies_list", anomaly_id)
+        ANOMALIES_TOTAL.inc(severity)
+        
+        # Долгосрочное хранение аномалии
+        bulk_writer.enqueue(monthly_index(ANOMALIES_INDEX_PREFIX, timestamp), anomaly_id, anomaly_data)
+        
+        # Рассылаем подписчикам live-ленты
+        live_feed.publish_anomaly(anomaly_data)
         
         print(f"Anomaly detected: {bert_result['class_name']} (confidence: {confidence:.3f}, severity: {severity})")
         
-        # Отправляем alert в Telegram если confidence высокий
+        # Alert в Telegram если confidence высокий: один на инцидент — на первую аномалию выше
+        # порога, даже если инцидент открыла аномалия ниже него (и при росте severity);
+        # без корреляции — как раньше, на аномалию. Отправка блокирующая — не в цикле событий
         if confidence >= telegram_notifier.alert_threshold:
-            telegram_notifier.send_alert(anomaly_data)
+            if incident_event is None:
+                with INGEST_STAGE_SECONDS.time("telegram"):
+                    sent = await asyncio.to_thread(telegram_notifier.send_alert, anomaly_data)
+                TELEGRAM_ALERTS_TOTAL.inc("sent" if sent else "failed")
+            else:
+                first_alert = incident_correlator.claim_alert(anomaly_data['incident_id'])
+                if first_alert or incident_event == "escalated":
+                    with INGEST_STAGE_SECONDS.time("telegram"):
+                        sent = await asyncio.to_thread(
+                            telegram_notifier.send_incident_alert, anomaly_data, "opened" if first_alert else incident_event
+                        )
+                    TELEGRAM_ALERTS_TOTAL.inc("sent" if sent else "failed")
         
         return anomaly_data
     
     return None
 
+# При перегрузке BERT классифицирует выборку, остальное — кэш шаблонов и эвристика
+overload_controller = OverloadController(
+    ANOMALY_CLASSES, CRITICAL_ANOMALY_CLASSES,
+    queue_depth=lambda: len(syslog_server.queue),
+    bert_available=lambda: not bert_model.loading
+)
+
+# Первая ступень перед BERT; без обученной модели (cascade_tool.py train) пропускает все в BERT
+cascade_classifier = CascadeClassifier(ANOMALY_CLASSES, CRITICAL_ANOMALY_CLASSES) if CASCADE_ENABLED else None
+
+# Сверка src_ip/dst_ip/username/command со списками threat intel (IOC_DIR)
+ioc_matcher = IOCMatcher(redis_client) if IOC_ENABLED else None
+
+# Повторы одного сообщения (флап интерфейса, BFD) схлопываются в одну запись с repeat_count
+dedup_window = DedupWindow() if DEDUP_ENABLED else None
+
+# Полнотекстовый поиск по горячим логам: постинги живут столько же, сколько логи в Redis
+search_index = SearchIndex(redis_client, HOT_LOGS_HOURS) if SEARCH_INDEX_ENABLED else None
+
+# Общий путь приема для HTTP эндпоинтов и syslog
+ingest_pipeline = IngestPipeline(
+    redis_client, extract_log_text, classify_log_with_bert, store_log_long_term, detect_and_store_anomaly,
+    overload=overload_controller,
+    cascade=cascade_classifier,
+    templates=template_miner,
+    dedup=dedup_window,
+    heavy_hitters=heavy_hitters,
+    ioc=ioc_matcher,
+    search_index=search_index,
+    update_long_term=update_long_term
+)
+syslog_server = SyslogServer(ingest_pipeline)
+
+@app.get("/api/v1/classification/status")
+async def get_classification_status():
+    """Режим классификации (normal/degraded), спрос на BERT, каскад и распределение логов по путям"""
+    return {
+        **overload_controller.status(),
+        "model": bert_model.status(),
+        "cascade": cascade_classifier.status() if cascade_classifier is not None else {"enabled": False}
+    }
+
+@app.get("/api/v1/templates")
+async def get_log_templates(limit: int = 50, offset: int = 0):
+    """Шаблоны логов по убыванию числа логов: текст, счетчик, первое и последнее появление"""
+    limit = max(1, min(limit, 1000))
+    template_ids = redis_client.zrevrange(TEMPLATES_KEY, offset, offset + limit - 1)
+    pipeline = redis_client.pipeline(transaction=False)
+    for template_id in template_ids:
+        pipeline.hgetall(TEMPLATE_KEY_PREFIX + template_id)
+    templates = [
+        decode_template(template_id, data)
+        for template_id, data in zip(template_ids, pipeline.execute() if template_ids else []) if data
+    ]
+    return {
+        "total": redis_client.zcard(TEMPLATES_KEY),
+        "templates": templates,
+        "miner": template_miner.stats()
+    }
+
+@app.get("/api/v1/templates/{template_id}")
+async def get_log_template(template_id: str):
+    data = redis_client.hgetall(TEMPLATE_KEY_PREFIX + template_id)
+    if not data:
+        raise HTTPException(status_code=404, detail="Template not found")
+    return decode_template(template_id, data)
+
 @app.get("/api/v1/telegram/status")
 async def get_telegram_status():
     """Статус Telegram интеграции"""
+    # Результат фоновой проверки getMe, без запроса к Telegram на каждый вызов
+    telegram_health = health_monitor.component("telegram")
     return {
         "enabled": telegram_notifier.enabled,
-        "connected": telegram_notifier.test_connection(),
+        "connected": telegram_health["ok"],
+        "checked_at": telegram_health["checked_at"],
         "alert_threshold": telegram_notifier.alert_threshold,
         "bot_configured": bool(telegram_notifier.bot_token),
         "chat_configured": bool(telegram_notifier.chat_id)
@@ -223,28 +456,28 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    try:
-        redis_ok = redis_client.ping()
-        
-        # Проверяем доступность модели BERT
-        test_text = "test log message"
-        bert_result = classify_log_with_bert(test_text)
-        bert_ok = bert_result["class_id"] != -1
-        
-        return {
-            "status": "healthy",
-            "timestamp": datetime.utcnow().isoformat(),
-            "redis_connected": redis_ok,
-            "bert_model_loaded": bert_ok,
-            "service": "log-api"
-        }
-    except Exception as e:
-        return {
-            "status": "degraded",
-            "timestamp": datetime.utcnow().isoformat(),
-            "error": str(e),
-            "service": "log-api"
-        }
+    """Сводное состояние по результатам фоновых проверок (без обращения к компонентам)"""
+    snapshot = health_monitor.snapshot()
+    return {
+        "status": snapshot["status"],
+        "timestamp": datetime.utcnow().isoformat(),
+        "redis_connected": snapshot["components"]["redis"]["ok"],
+        "bert_model_loaded": bert_model.loaded,
+        "components": snapshot["components"],
+        "service": "log-api"
+    }
+
+@app.get("/health/live")
+async def health_live():
+    """Liveness проба: процесс жив и цикл событий не заблокирован"""
+    live = health_monitor.live()
+    return JSONResponse(live, status_code=200 if live["status"] == "alive" else 503)
+
+@app.get("/health/ready")
+async def health_ready():
+    """Readiness проба: критичные компоненты (Redis, модель) доступны"""
+    ready = health_monitor.ready()
+    return JSONResponse({"ready": ready}, status_code=200 if ready else 503)
 
 # Добавьте этот endpoint в api/main.py (после других endpoints)
 @app.post("/api/v1/chat")
@@ -285,118 +518,102 @@ async def chat_with_ai(request: Dict[str, Any]):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
 
+@app.post("/api/v1/chat/stream")
+async def chat_with_ai_stream(request: Dict[str, Any]):
+    """Потоковый чат с ИИ (Server-Sent Events): токены ответа и прогресс вызова функций по мере готовности"""
+    payload = {
+        "message": request.get('message', ''),
+        "chat_history": request.get('chat_history', [])
+    }
+    # Если агент недоступен — отдаем обычный ответ /api/v1/chat тем же форматом событий
+    fallback = await chat_with_ai(payload)
+    return StreamingResponse(
+        agent_stream_proxy.relay(payload, fallback=fallback),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
 @app.post("/api/v1/logs")
 async def ingest_log(log_data: Dict[str, Any]):
     """Endpoint для приема логов"""
+    started = time.perf_counter()
     try:
-        log_id = str(uuid.uuid4())
-        timestamp = log_data.get('timestamp', datetime.utcnow().isoformat())
-        
-        # Извлекаем текст лога для анализа BERT
-        log_text = ""
-        raw_data = log_data.get('raw_data', {})
-        if isinstance(raw_data, dict):
-            log_text = raw_data.get('msg', '') or str(raw_data)
-        else:
-            log_text = str(raw_data)
-        
-        # Анализируем лог с помощью BERT
-        bert_result = classify_log_with_bert(log_text)
-        
-        # Сохраняем в Redis
-        log_key = f"log:{log_id}"
-        redis_client.hset(log_key, mapping={
-            'id': log_id,
-            'source': log_data.get('source', 'unknown'),
-            'log_type': log_data.get('log_type', 'unknown'),
-            'timestamp': timestamp,
-            'raw_data': json.dumps(log_data.get('raw_data', {})),
-            'bert_class': bert_result['class_name'],
-            'bert_class_id': str(bert_result['class_id']),
-            'bert_confidence': str(bert_result['confidence']),
-            'is_anomaly': str(bert_result['is_anomaly'])
-        })
-        
-        # Сохраняем временную метку для поиска
-        redis_client.zadd("logs:timestamps", {log_key: datetime.utcnow().timestamp()})
-        
-        # Сохраняем в список для быстрого доступа
-        redis_client.lpush("logs_list", json.dumps({
-            **log_data,
-            'bert_analysis': bert_result
-        }))
-        
-        # Если это аномалия - сохраняем отдельно
-        anomaly = None
-        if bert_result["is_anomaly"]:
-            anomaly = await detect_and_store_anomaly(log_data, bert_result)
-        
-        return {
-            "status": "success",
-            "log_id": log_id,
-            "bert_analysis": bert_result,
-            "anomaly_detected": bert_result["is_anomaly"],
-            "anomaly_id": anomaly["id"] if anomaly else None
-        }
+        result = (await ingest_pipeline.process([log_data], keep_ids=False))[0]
+        return {"status": "success", **result}
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        INGEST_REQUEST_SECONDS.observe(time.perf_counter() - started, "ingest_log")
 
 @router.post("/api/v1/logs/create")
 async def create_log(log: Dict[Any, Any]):
-    """Альтернативный endpoint для создания логов"""
+    """Альтернативный endpoint для создания логов (event_id берется из тела)"""
+    started = time.perf_counter()
     try:
-        # Анализируем лог с помощью BERT
-        log_text = ""
-        raw_data = log.get('raw_data', {})
-        if isinstance(raw_data, dict):
-            log_text = raw_data.get('msg', '') or str(raw_data)
-        else:
-            log_text = str(raw_data)
-        
-        bert_result = classify_log_with_bert(log_text)
-        
-        # Save log as JSON string in Redis list
-        log_with_bert = {
-            **log,
-            'bert_analysis': bert_result
-        }
-        redis_client.lpush("logs_list", json.dumps(log_with_bert))
-        
-        # Также сохраняем как hash для consistency
-        log_id = log.get('event_id', str(uuid.uuid4()))
-        log_key = f"log:{log_id}"
-        redis_client.hset(log_key, mapping={
-            'id': log_id,
-            'source': log.get('source', 'unknown'),
-            'log_type': log.get('log_type', 'unknown'),
-            'timestamp': log.get('timestamp', datetime.utcnow().isoformat()),
-            'raw_data': json.dumps(log.get('raw_data', {})),
-            'bert_class': bert_result['class_name'],
-            'bert_class_id': str(bert_result['class_id']),
-            'bert_confidence': str(bert_result['confidence']),
-            'is_anomaly': str(bert_result['is_anomaly'])
-        })
-        
-        # Если это аномалия - сохраняем отдельно
-        anomaly = None
-        if bert_result["is_anomaly"]:
-            anomaly = await detect_and_store_anomaly(log, bert_result)
+        result = (await ingest_pipeline.process([log]))[0]
+        return {"status": "success", **result}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        INGEST_REQUEST_SECONDS.observe(time.perf_counter() - started, "create_log")
+
+@router.post("/api/v1/logs/bulk")
+async def ingest_logs_bulk(payload: Union[Dict[str, Any], List[Dict[str, Any]]]):
+    """Пакетный прием логов: нормализация пачкой, запись в Redis одним pipeline"""
+    started = time.perf_counter()
+    try:
+        # Vector (http sink, codec json) присылает пачку голым массивом
+        logs = payload if isinstance(payload, list) else payload.get('logs') or []
+        if len(logs) > BULK_MAX_LOGS:
+            raise HTTPException(status_code=413, detail=f"Too many logs in batch (max {BULK_MAX_LOGS})")
         
+        results = await ingest_pipeline.process(logs)
+        # У повтора anomaly_id — аномалия его первой записи, новой аномалии нет
+        anomaly_ids = [result["anomaly_id"] for result in results if result["anomaly_id"] and not result.get("suppressed")]
+        anomaly_ids += [result["ioc_anomaly_id"] for result in results if result.get("ioc_anomaly_id")]
         return {
             "status": "success",
-            "log_id": log_id,
-            "bert_analysis": bert_result,
-            "anomaly_detected": bert_result["is_anomaly"],
-            "anomaly_id": anomaly["id"] if anomaly else None
+            "accepted": len(results),
+            "suppressed": sum(1 for result in results if result.get("suppressed")),
+            "log_ids": [result["log_id"] for result in results],
+            "anomalies_detected": len(anomaly_ids),
+            "anomaly_ids": anomaly_ids
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        INGEST_REQUEST_SECONDS.observe(time.perf_counter() - started, "ingest_bulk")
+
+@app.get("/api/v1/syslog/status")
+async def syslog_status():
+    """Состояние syslog приемника (UDP/TCP)"""
+    return {**syslog_server.status(), "enabled": SYSLOG_ENABLED}
 
 @router.get("/api/v1/logs/stats")
-async def get_logs_stats():
+async def get_logs_stats(
+    time_range: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    dataset: str = "security",
+    group_by: str = "bert_class,source,log_type"
+):
     """Статистика по логам"""
     try:
+        # Период задан — считаем агрегацией в долгосрочном хранилище, без выгрузки документов
+        if time_range or start or end:
+            start_dt, end_dt = _history_window(time_range or "24h", start, end)
+            result = await aggregations.stats(dataset, start_dt, end_dt, [g for g in group_by.split(",") if g])
+            return {
+                **result,
+                "dataset": dataset,
+                "start": start_dt.isoformat(),
+                "end": end_dt.isoformat(),
+                "timestamp": datetime.utcnow().isoformat()
+            }
+
         logs = redis_client.lrange("logs_list", 0, -1)
         log_dicts: List[Dict[str, Any]] = []
         
@@ -433,19 +650,121 @@ async def get_logs_stats():
             "by_bert_class": dict(by_bert_class),
             "timestamp": datetime.utcnow().isoformat()
         }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/api/v1/logs/timeseries")
+async def get_logs_timeseries(
+    time_range: str = "24h",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    interval: str = "1h",
+    group_by: Optional[str] = None,
+    dataset: str = "security"
+):
+    """Количество логов по интервалам времени за любой период"""
+    try:
+        start_dt, end_dt = _history_window(time_range, start, end)
+        result = await aggregations.timeseries(dataset, start_dt, end_dt, interval, group_by)
+        return {**result, "dataset": dataset, "start": start_dt.isoformat(), "end": end_dt.isoformat()}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/api/v1/logs/summary")
+async def get_logs_summary(
+    time_range: str = "1h",
+    limit: int = 2000,
+    top_templates: int = 20,
+    samples_per_class: int = 3
+):
+    """Компактная сводка по свежим логам (для LLM агента вместо сырых логов)"""
+    try:
+        min_score = (datetime.utcnow() - parse_time_range(time_range)).timestamp()
+        log_keys = redis_client.zrevrangebyscore("logs:timestamps", "+inf", min_score, start=0, num=min(limit, 10000))
+        
+        # Все hash одним round trip
+        pipeline = redis_client.pipeline()
+        for key in log_keys:
+            pipeline.hgetall(key)
+        
+        logs = []
+        for data in pipeline.execute():
+            if data:
+                log = decode_redis_log(data)
+                log['message'] = extract_log_text(log['raw_data'])
+                logs.append(log)
+        
+        return {
+            **summarize_logs(logs, top_templates=top_templates, samples_per_class=samples_per_class),
+            "time_range": time_range,
+            "timestamp": datetime.utcnow().isoformat()
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _full_text_search(
+    query: str,
+    time_range: str,
+    limit: int,
+    severity: Optional[str] = None,
+    log_type: Optional[str] = None,
+    anomaly: Optional[bool] = None
+) -> Dict[str, Any]:
+    """Логи горячего слоя по запросу (слова — AND, OR, "фраза", префикс*) через инвертированный индекс"""
+    if search_index is None:
+        raise HTTPException(status_code=503, detail="Full-text search index is disabled")
+    period = parse_time_range(time_range)
+    max_score = datetime.utcnow().timestamp()
+    min_score = max_score - min(period.total_seconds(), HOT_LOGS_HOURS * 3600)
+
+    def accept(data: Dict[str, str]) -> bool:
+        if severity and data.get('severity') != severity:
+            return False
+        if log_type and data.get('log_type') != log_type:
+            return False
+        if anomaly is not None and (data.get('is_anomaly') == 'True') != anomaly:
+            return False
+        return True
+
+    started = time.perf_counter()
+    filtered = severity or log_type or anomaly is not None
+    hashes, stats = search_index.search(query, min_score, max_score, limit=max(1, min(limit, 1000)), accept=accept if filtered else None)
+    elapsed = time.perf_counter() - started
+    REDIS_OPERATION_SECONDS.observe(elapsed, "full_text_search")
+
+    results = []
+    for data in hashes:
+        log = decode_redis_log(data)
+        log['message'] = extract_log_text(log['raw_data'])
+        results.append(log)
+    return {
+        "results": results,
+        "count": len(results),
+        "query": query,
+        "time_range": time_range,
+        # Индекс покрывает только горячий слой: более ранние логи — в /api/v1/logs/history
+        "indexed_hours": HOT_LOGS_HOURS,
+        "search": {**stats, "took_ms": round(elapsed * 1000, 2)}
+    }
+
 @router.get("/api/v1/logs/search")
 async def search_logs(
     time_range: str = "24h",
     severity: Optional[str] = None,
     type: Optional[str] = None,
     anomaly: Optional[bool] = None,
-    limit: int = 100
+    limit: int = 100,
+    q: Optional[str] = None
 ):
-    """Поиск логов с фильтрацией"""
+    """Поиск логов с фильтрацией; q — полнотекстовый запрос (xe-0/0/1, "link down", ssh*)"""
     try:
+        if q and q.strip():
+            return _full_text_search(q, time_range, limit, severity, type, anomaly)
+
         logs = redis_client.lrange("logs_list", 0, -1)
         log_dicts: List[Dict[str, Any]] = []
         
@@ -498,6 +817,10 @@ async def search_logs(
             "count": len(filtered_logs),
             "time_range": time_range
         }
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -599,12 +922,135 @@ async def search_anomalies(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/v1/ioc/status")
+async def get_ioc_status():
+    """Загруженные списки IOC: версии, число записей, размер фильтров, попадания"""
+    if ioc_matcher is None:
+        return {"enabled": False}
+    return {"enabled": True, **ioc_matcher.status()}
+
+@router.get("/api/v1/top")
+async def get_top(dimension: str = "source", time_range: str = "24h", limit: int = 10):
+    """
+    Топ значений измерения за период по скетчам приема (без сканирования логов):
+    source, src_ip, username, dst_port, bert_class, anomaly_source (источники аномалий)
+    """
+    if dimension not in TOP_DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown dimension, expected one of: {', '.join(TOP_DIMENSIONS)}")
+    try:
+        seconds = parse_time_range(time_range).total_seconds()
+        with REDIS_OPERATION_SECONDS.time("top_query"):
+            result = heavy_hitters.top(redis_client, dimension, seconds, limit=max(1, min(limit, 100)))
+        return {**result, "time_range": time_range}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/api/v1/incidents")
+async def search_incidents(
+    time_range: str = "24h",
+    status: Optional[str] = None,
+    limit: int = 50,
+    offset: int = 0
+):
+    """Инциденты (сгруппированные аномалии), новые первыми; status: open, closed, resolved"""
+    try:
+        hours = parse_time_range(time_range).total_seconds() / 3600
+        incidents = incident_correlator.search(status=status, hours=hours, limit=max(1, min(limit, 500)), offset=offset)
+        return {
+            "incidents": incidents,
+            "count": len(incidents),
+            "time_range": time_range,
+            "filters": {"status": status},
+            "correlator": incident_correlator.stats()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/api/v1/incidents/{incident_id}")
+async def get_incident(incident_id: str, anomalies: int = 50):
+    """Инцидент с источниками, классами и последними аномалиями"""
+    incident = incident_correlator.get(incident_id, anomalies_limit=max(0, min(anomalies, 500)))
+    if incident is None:
+        raise HTTPException(status_code=404, detail="Incident not found")
+    pipeline = redis_client.pipeline(transaction=False)
+    for anomaly_id in incident["anomaly_ids"]:
+        pipeline.hgetall(f"anomaly:{anomaly_id}")
+    incident["anomalies"] = [
+        decode_redis_anomaly(data) for data in (pipeline.execute() if incident["anomaly_ids"] else []) if data
+    ]
+    return incident
+
+@router.post("/api/v1/incidents/{incident_id}/resolve")
+async def resolve_incident(incident_id: str):
+    """Закрыть инцидент вручную: следующие аномалии той же группы откроют новый"""
+    if not incident_correlator.resolve(incident_id):
+        raise HTTPException(status_code=404, detail="Incident not found")
+    return {"status": "resolved", "incident_id": incident_id}
+
+@router.get("/api/v1/logs/history")
+async def search_logs_history(
+    time_range: str = "7d",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    source: Optional[str] = None,
+    type: Optional[str] = None,
+    bert_class: Optional[str] = None,
+    anomaly: Optional[bool] = None,
+    limit: int = 100,
+    cursor: Optional[str] = None
+):
+    """Поиск логов за любой период: Redis + Elasticsearch одним запросом"""
+    try:
+        start_dt, end_dt = _history_window(time_range, start, end)
+        result = await logs_history.search(
+            start_dt, end_dt,
+            {"source": source, "log_type": type, "bert_class": bert_class, "is_anomaly": anomaly},
+            limit=min(limit, 1000),
+            cursor=cursor
+        )
+        return {**result, "start": start_dt.isoformat(), "end": end_dt.isoformat()}
+    except ValueError as e:
+        # Неверный time_range, start/end или cursor — ошибка запроса, а не сервера
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/api/v1/anomalies/history")
+async def search_anomalies_history(
+    time_range: str = "30d",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    severity: Optional[str] = None,
+    bert_class: Optional[str] = None,
+    status: Optional[str] = None,
+    source: Optional[str] = None,
+    limit: int = 50,
+    cursor: Optional[str] = None
+):
+    """Поиск аномалий за любой период: Redis + Elasticsearch одним запросом"""
+    try:
+        start_dt, end_dt = _history_window(time_range, start, end)
+        result = await anomalies_history.search(
+            start_dt, end_dt,
+            {"severity": severity, "bert_class": bert_class, "status": status, "source": source},
+            limit=min(limit, 1000),
+            cursor=cursor
+        )
+        return {**result, "start": start_dt.isoformat(), "end": end_dt.isoformat()}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/api/v1/query")
 async def query_logs(request: Dict[str, Any]):
-    """Query endpoint для запроса логов"""
+    """Query endpoint для запроса логов; query — полнотекстовый запрос, как q в /api/v1/logs/search"""
     try:
         time_range = request.get('time_range', '1h')
         limit = min(request.get('limit', 100), 1000)
+        query = str(request.get('query') or '').strip()
+        if query:
+            return _full_text_search(query, time_range, limit)
         
         # Получаем все ключи логов
         log_keys = redis_client.keys("log:*")
@@ -631,9 +1077,61 @@ async def query_logs(request: Dict[str, Any]):
             "time_range": time_range
         }
         
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/v1/storage/status")
+async def get_storage_status():
+    """Состояние записи в долгосрочное хранилище: глубина очереди, латентность flush"""
+    return {
+        "elasticsearch_bulk": bulk_writer.stats(),
+        "dedup": dedup_window.stats() if dedup_window is not None else {"enabled": False},
+        "search_index": search_index.stats() if search_index is not None else {"enabled": False},
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Метрики в текстовом формате Prometheus"""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/v1/admin/profiling")
+async def get_profiling_status():
+    """Настройки и счетчики профилировщика запросов"""
+    return request_profiler.status()
+
+@app.post("/api/v1/admin/profiling")
+async def configure_profiling(config: Dict[str, Any]):
+    """Включение/настройка профилирования на лету: enabled, sample_rate, slow_ms, mode"""
+    try:
+        return request_profiler.configure(
+            enabled=config.get("enabled"),
+            sample_rate=config.get("sample_rate"),
+            slow_ms=config.get("slow_ms"),
+            mode=config.get("mode")
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/v1/admin/slow-requests")
+async def get_slow_requests(limit: int = 50):
+    """Последние медленные и сэмплированные запросы с разбивкой по стадиям"""
+    return {"requests": request_profiler.recent(limit), "status": request_profiler.status()}
+
+@app.get("/api/v1/live")
+async def live_stream():
+    """Push-лента (SSE): новые аномалии сразу и изменения статистики раз в несколько секунд"""
+    return StreamingResponse(live_feed.stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.get("/api/v1/live/status")
+async def live_status():
+    """Число подписчиков live-ленты и потерянных медленными клиентами событий"""
+    return live_feed.stats()
+
 @app.get("/api/v1/stats")
 async def get_stats():
     """Общая статистика системы"""
@@ -0,0 +1,394 @@
+import bisect
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Как часто воркер serve.py пишет свой срез метрик для общего /metrics
+METRICS_SHARD_SECONDS = float(os.getenv("METRICS_SHARD_SECONDS", 5))
+
+# Границы бакетов латентности по умолчанию, секунды (от 0.5мс до 10с)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _PerThread:
+    """
+    Хранилище значений метрики по потокам.
+
+    Каждый поток пишет только в свой словарь, поэтому на горячем пути нет блокировок;
+    блокировка берется один раз при первой записи потока и при сборе (/metrics).
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: List[dict] = []
+        self._lock = threading.Lock()
+
+    def shard(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = {}
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+            return shard
+
+    def shards(self) -> List[dict]:
+        with self._lock:
+            return list(self._shards)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = _PerThread()
+
+    def inc(self, *labels: str, amount: float = 1):
+        shard = self._values.shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def values(self) -> Dict[tuple, float]:
+        totals: Dict[tuple, float] = {}
+        for shard in self._values.shards():
+            for labels, value in list(shard.items()):
+                totals[labels] = totals.get(labels, 0) + value
+        return totals
+
+    @staticmethod
+    def merge(target: Dict[tuple, float], values: Dict[tuple, float]):
+        for labels, value in values.items():
+            target[labels] = target.get(labels, 0) + value
+
+    def format(self, totals: Dict[tuple, float]) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(totals.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+    def collect(self) -> List[str]:
+        return self.format(self.values())
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._values = _PerThread()
+        # Подписчики на каждое наблюдение (например, профилировщик запросов); пусто — без накладных
+        self.observers: List[Callable[[float, tuple], None]] = []
+
+    def observe(self, value: float, *labels: str):
+        shard = self._values.shard()
+        series = shard.get(labels)
+        if series is None:
+            # [счетчики по бакетам (+Inf последним), сумма]
+            series = shard[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        if self.observers:
+            for observer in self.observers:
+                observer(value, labels)
+
+    def time(self, *labels: str) -> "Timer":
+        return Timer(self, labels)
+
+    def values(self) -> Dict[tuple, list]:
+        totals: Dict[tuple, list] = {}
+        for shard in self._values.shards():
+            self.merge(totals, dict(shard))
+        return totals
+
+    def merge(self, target: Dict[tuple, list], values: Dict[tuple, list]):
+        for labels, (counts, total) in values.items():
+            merged = target.setdefault(labels, [[0] * (len(self.buckets) + 1), 0.0])
+            for i, count in enumerate(counts):
+                merged[0][i] += count
+            merged[1] += total
+
+    def collect(self) -> List[str]:
+        return self.format(self.values())
+
+    def format(self, totals: Dict[tuple, list]) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(totals.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames + ('le',), labels + (le,))} {cumulative}"
+                )
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+class Timer:
+    """with histogram.time("stage"): ... — замер блока кода"""
+
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels: tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+
+class GaugeCallback:
+    """Значение считается в момент сбора: глубина очередей, hit rate кэшей и т.п."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], Dict[tuple, float]],
+        labelnames: Tuple[str, ...] = ()
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.labelnames = labelnames
+
+    def values(self) -> Dict[tuple, float]:
+        try:
+            return dict(self.callback())
+        except Exception as e:
+            print(f"Metrics: не удалось получить {self.name}: {e}")
+            return {}
+
+    @staticmethod
+    def merge(target: Dict[tuple, float], values: Dict[tuple, float], worker: Optional[str] = None):
+        # Значения процессов не складываются (hit rate, глубина очереди): у каждого — метка worker
+        for labels, value in values.items():
+            target[labels + (worker,) if worker is not None else labels] = value
+
+    def format(self, values: Dict[tuple, float], labelnames: Optional[Tuple[str, ...]] = None) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(labelnames or self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+    def collect(self) -> List[str]:
+        return self.format(self.values())
+
+
+class MetricsRegistry:
+    """
+    Метрики процесса. Под serve.py с несколькими воркерами каждый воркер раз в
+    METRICS_SHARD_SECONDS (и на каждом /metrics) пишет свой срез в shard_dir/{pid}.json,
+    а /metrics любого воркера отдает сумму срезов: счетчики и гистограммы не скачут между
+    опросами в зависимости от того, какой воркер принял соединение. Срезы завершившихся
+    воркеров (serve.py переименовывает их в exited-*.json) остаются в сумме, иначе
+    счетчики уменьшались бы; их gauge не выводятся.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.shard_dir: Optional[str] = None
+        self._shard_thread: Optional[threading.Thread] = None
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Optional[Tuple[float, ...]] = None
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets or DEFAULT_BUCKETS))
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], Dict[tuple, float]],
+        labelnames: Tuple[str, ...] = ()
+    ) -> GaugeCallback:
+        return self.register(GaugeCallback(name, documentation, callback, labelnames))
+
+    def share(self, shard_dir: str, interval: float = METRICS_SHARD_SECONDS):
+        """Включается в воркере после fork: фоновая запись среза процесса"""
+        self.shard_dir = shard_dir
+        self._shard_thread = threading.Thread(target=self._write_loop, args=(interval,), name="metrics-shard", daemon=True)
+        self._shard_thread.start()
+
+    def _write_loop(self, interval: float):
+        while True:
+            try:
+                self.write_shard()
+            except Exception as e:
+                print(f"Metrics: не удалось записать срез: {e}")
+            time.sleep(interval)
+
+    def write_shard(self):
+        snapshot = {
+            metric.name: [[list(labels), value] for labels, value in metric.values().items()]
+            for metric in self.metrics
+        }
+        path = os.path.join(self.shard_dir, f"{os.getpid()}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(snapshot, f)
+        os.replace(path + ".tmp", path)
+
+    def _read_shards(self) -> List[Tuple[str, bool, Dict[str, Any]]]:
+        """(pid, жив ли процесс, срез) по всем файлам shard_dir"""
+        shards = []
+        for name in os.listdir(self.shard_dir):
+            if not name.endswith(".json"):
+                continue
+            pid = name[:-5]
+            try:
+                with open(os.path.join(self.shard_dir, name)) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            shards.append((pid, pid.isdigit() and _alive(int(pid)), snapshot))
+        return shards
+
+    def render(self) -> str:
+        """Текстовый формат Prometheus (exposition format 0.0.4)"""
+        lines = []
+        if self.shard_dir is None:
+            for metric in self.metrics:
+                lines.extend(metric.collect())
+            return "\n".join(lines) + "\n"
+
+        self.write_shard()
+        shards = self._read_shards()
+        for metric in self.metrics:
+            merged: Dict[tuple, Any] = {}
+            for pid, alive, snapshot in shards:
+                values = {tuple(labels): value for labels, value in snapshot.get(metric.name, [])}
+                if isinstance(metric, GaugeCallback):
+                    if alive:
+                        metric.merge(merged, values, pid)
+                else:
+                    metric.merge(merged, values)
+            if isinstance(metric, GaugeCallback):
+                lines.extend(metric.format(merged, metric.labelnames + ("worker",)))
+            else:
+                lines.extend(metric.format(merged))
+        return "\n".join(lines) + "\n"
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _format_labels(names: Tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+# Глобальный реестр и метрики приема логов
+metrics_registry = MetricsRegistry()
+
+INGEST_STAGE_SECONDS = metrics_registry.histogram(
+    "wqe_ingest_stage_seconds",
+    "Latency of each ingest stage",
+    ("stage",)
+)
+INGEST_REQUEST_SECONDS = metrics_registry.histogram(
+    "wqe_ingest_request_seconds",
+    "Total ingest request latency",
+    ("endpoint",)
+)
+REDIS_OPERATION_SECONDS = metrics_registry.histogram(
+    "wqe_redis_operation_seconds",
+    "Latency of Redis operations on the ingest path",
+    ("operation",)
+)
+CLASSIFICATIONS_TOTAL = metrics_registry.counter(
+    "wqe_classifications_total",
+    "Logs classified per BERT class",
+    ("bert_class",)
+)
+ANOMALIES_TOTAL = metrics_registry.counter(
+    "wqe_anomalies_total",
+    "Anomalies stored per severity",
+    ("severity",)
+)
+TELEGRAM_ALERTS_TOTAL = metrics_registry.counter(
+    "wqe_telegram_alerts_total",
+    "Telegram alert attempts by result",
+    ("result",)
+)
+SYSLOG_MESSAGES_TOTAL = metrics_registry.counter(
+    "wqe_syslog_messages_total",
+    "Syslog messages received by transport",
+    ("transport",)
+)
+SYSLOG_DROPPED_TOTAL = metrics_registry.counter(
+    "wqe_syslog_dropped_total",
+    "Syslog messages dropped because the queue was full",
+    ("transport",)
+)
+CLASSIFICATION_PATH_TOTAL = metrics_registry.counter(
+    "wqe_classification_path_total",
+    "Logs classified by path: bert, template cache or heuristic",
+    ("path",)
+)
+OVERLOAD_MODE_SWITCHES_TOTAL = metrics_registry.counter(
+    "wqe_overload_mode_switches_total",
+    "Classification mode switches",
+    ("mode", "reason")
+)
+CASCADE_AUDIT_TOTAL = metrics_registry.counter(
+    "wqe_cascade_audit_total",
+    "Accepted first-stage results re-checked by BERT, by agreement",
+    ("result",)
+)
+INGEST_EVENTS_TOTAL = metrics_registry.counter(
+    "wqe_ingest_events_total",
+    "Events received by the ingest pipeline: stored or suppressed as a repeat",
+    ("outcome",)
+)
+INCIDENT_EVENTS_TOTAL = metrics_registry.counter(
+    "wqe_incident_events_total",
+    "Anomalies correlated into incidents: opened, joined or escalated",
+    ("event",)
+)
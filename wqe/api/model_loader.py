@@ -0,0 +1,167 @@
+"""
+Ленивая загрузка BERT классификатора.
+
+Раньше модель скачивалась и собиралась при импорте main.py: каждый запуск, воркер и тест
+платил десятки секунд еще до того, как API начинал слушать порт. Теперь:
+  - import torch/transformers и загрузка весов откладываются до первой классификации
+    или прогрева на старте (MODEL_LOAD_MODE=eager — грузить сразу при импорте);
+  - веса берутся из локального снапшота в safetensors (MODEL_SNAPSHOT_DIR), который
+    читается через mmap без распаковки pickle — страницы весов лежат в page cache
+    и общие для всех процессов на машине (см. serve.py);
+  - без снапшота модель, как и раньше, берется с Hugging Face по MODEL_NAME.
+
+Снапшот готовится один раз (в Dockerfile при сборке образа):
+    python model_loader.py convert /models/log-classifier-bert
+"""
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+MODEL_NAME = os.getenv("MODEL_NAME", "rahulm-selector/log-classifier-BERT-v1")
+MODEL_SNAPSHOT_DIR = os.getenv("MODEL_SNAPSHOT_DIR", "/models/log-classifier-bert")
+MODEL_LOAD_MODE = os.getenv("MODEL_LOAD_MODE", "lazy").lower()
+# Прогон одного предсказания на старте: readiness ждет его, первый запрос не платит за загрузку
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "true").lower() == "true"
+# 0 — оставить torch значение по умолчанию (все ядра); при нескольких воркерах serve.py делит ядра
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", 0))
+
+SNAPSHOT_WEIGHTS = "model.safetensors"
+
+
+class BertModelHolder:
+    """Модель и токенизатор, загружаемые один раз по первому требованию (потокобезопасно)"""
+
+    def __init__(self, name: str = MODEL_NAME, snapshot_dir: str = MODEL_SNAPSHOT_DIR):
+        self.name = name
+        self.snapshot_dir = snapshot_dir
+        self.model = None
+        self.tokenizer = None
+        self.source: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.warmed_up = False
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._warm_up_thread: Optional[threading.Thread] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.model is not None
+
+    @property
+    def loading(self) -> bool:
+        """Модель сейчас грузится: классификация через нее заблокировалась бы до конца загрузки"""
+        return self.model is None and self._lock.locked()
+
+    def has_snapshot(self) -> bool:
+        return os.path.isfile(os.path.join(self.snapshot_dir, SNAPSHOT_WEIGHTS)) and \
+            os.path.isfile(os.path.join(self.snapshot_dir, "config.json"))
+
+    def get(self) -> Tuple[Any, Any]:
+        """(model, tokenizer); первый вызов загружает модель, остальные ждут его на блокировке"""
+        if self.model is None:
+            self.load()
+        return self.model, self.tokenizer
+
+    def load(self):
+        with self._lock:
+            if self.model is not None:
+                return
+            started = time.perf_counter()
+            from transformers import BertForSequenceClassification, BertTokenizer
+
+            if TORCH_NUM_THREADS:
+                import torch
+                torch.set_num_threads(TORCH_NUM_THREADS)
+
+            try:
+                if self.has_snapshot():
+                    # low_cpu_mem_usage: модель создается без случайной инициализации, параметры
+                    # ссылаются на mmap-страницы safetensors файла, а не копируются в новую память
+                    source = self.snapshot_dir
+                    tokenizer = BertTokenizer.from_pretrained(source, local_files_only=True)
+                    model = BertForSequenceClassification.from_pretrained(
+                        source, local_files_only=True, use_safetensors=True, low_cpu_mem_usage=True
+                    )
+                else:
+                    source = self.name
+                    tokenizer = BertTokenizer.from_pretrained(source)
+                    model = BertForSequenceClassification.from_pretrained(source)
+            except Exception as e:
+                self.error = str(e)
+                raise
+            model.eval()
+            model.requires_grad_(False)
+
+            self.tokenizer = tokenizer
+            self.model = model
+            self.source = source
+            self.error = None
+            self.load_seconds = time.perf_counter() - started
+            print(f"BERT model loaded from {source} in {self.load_seconds:.1f}s")
+
+    def warm_up(self):
+        """Загрузка и один прогон: первый реальный запрос не ждет ни весов, ни инициализации потоков torch"""
+        import torch
+
+        try:
+            model, tokenizer = self.get()
+            inputs = tokenizer("warm up", return_tensors="pt", truncation=True, max_length=512)
+            with torch.no_grad():
+                model(**inputs)
+            self.warmed_up = True
+        except Exception as e:
+            # Следующая классификация попробует загрузить модель снова
+            self.error = str(e)
+            self._warm_up_thread = None
+            print(f"BERT warm-up failed: {e}")
+
+    def start_warm_up(self):
+        """Прогрев в фоновом потоке: приложение начинает отвечать сразу, readiness — после прогрева"""
+        if self.warmed_up or self._warm_up_thread is not None:
+            return
+        self._warm_up_thread = threading.Thread(target=self.warm_up, name="bert-warm-up", daemon=True)
+        self._warm_up_thread.start()
+
+    def status(self) -> Dict[str, Any]:
+        """Для health check: без прогрева модель считается готовой, пока не было ошибки загрузки"""
+        if self.error is not None:
+            state = "error"
+        elif self.warmed_up:
+            state = "ready"
+        elif self._warm_up_thread is not None:
+            state = "warming_up"
+        else:
+            state = "loaded" if self.loaded else "lazy"
+        return {
+            "ok": state in ("ready", "loaded", "lazy"),
+            "status": state,
+            "source": self.source or (self.snapshot_dir if self.has_snapshot() else self.name),
+            "load_seconds": round(self.load_seconds, 2) if self.load_seconds is not None else None,
+            "num_labels": self.model.config.num_labels if self.model is not None else 0,
+            **({"error": self.error} if self.error else {})
+        }
+
+    def convert(self, output_dir: str):
+        """Скачивает модель с Hugging Face и сохраняет локальный снапшот в safetensors"""
+        from transformers import BertForSequenceClassification, BertTokenizer
+
+        os.makedirs(output_dir, exist_ok=True)
+        BertTokenizer.from_pretrained(self.name).save_pretrained(output_dir)
+        model = BertForSequenceClassification.from_pretrained(self.name)
+        model.save_pretrained(output_dir, safe_serialization=True)
+        print(f"Saved {self.name} snapshot to {output_dir}")
+
+
+bert_model = BertModelHolder()
+
+if MODEL_LOAD_MODE == "eager":
+    bert_model.load()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "convert":
+        print("usage: python model_loader.py convert [output_dir]")
+        sys.exit(1)
+    bert_model.convert(sys.argv[2] if len(sys.argv) > 2 else MODEL_SNAPSHOT_DIR)
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Union
 from enum import Enum
 
 class LogType(str, Enum):
@@ -10,11 +10,13 @@ class LogType(str, Enum):
     GENERIC_SYSLOG = "generic_syslog"
     DIONAEA_MALWARE = "dionaea_malware"
     T_POT = "t_pot"
+    CEF = "cef"
+    LEEF = "leef"
 
 class LogEntry(BaseModel):
     source: str = Field(..., description="Откуда пришёл лог — IP или имя хоста")
     log_type: LogType = Field(..., description="Тип лога, чтобы понимать, как его разбирать")
-    raw_data: Dict[str, Any] = Field(..., description="Сырые данные — пригодятся для расследования")
+    raw_data: Union[Dict[str, Any], str] = Field(..., description="Сырые данные (словарь или строка CEF/LEEF/syslog) — пригодятся для расследования")
     timestamp: Optional[datetime] = Field(None, description="Когда произошло событие (если известно)")
 
 class QueryRequest(BaseModel):
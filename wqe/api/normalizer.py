@@ -1,86 +1,340 @@
 from datetime import datetime
-from typing import Dict, Any
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
 import uuid
 
+from raw_parsers import parse_line
+
+# Общие поля, которые normalize добавляет поверх полей конкретного типа
+COMMON_FIELDS = ("event_id", "received_at", "source", "log_type", "timestamp", "raw_data")
+
+FieldSource = Union[str, Tuple[str, ...]]
+
+
+def compile_mapper(
+    name: str,
+    fields: Dict[str, FieldSource],
+    constants: Optional[Dict[str, Any]] = None,
+    defaults: Optional[Dict[str, Any]] = None,
+    finalize: Optional[Callable[[Dict[str, Any], Dict[str, Any]], None]] = None
+) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Собирает функцию извлечения полей одного типа лога — один раз при старте.
+
+    fields: выходное поле -> ключ в raw_data (или кортеж альтернатив, в том числе вложенных
+    "connection.remote.address"; берется первое не-None). Из спецификации генерируется функция
+    с одним литералом словаря: на событие — только data.get по нужным ключам, без циклов по
+    спецификации и промежуточных словарей (так же собирают классы dataclasses/namedtuple).
+    """
+    constants = constants or {}
+    defaults = defaults or {}
+    namespace: Dict[str, Any] = {"_EMPTY": {}, "_finalize": finalize}
+    lines = ["    get = data.get"]
+    parents: Dict[Tuple[str, ...], str] = {}
+
+    def parent_var(path: Tuple[str, ...]) -> str:
+        # Вложенный словарь достаем один раз на событие, даже если из него берем несколько полей
+        # Имена переменных — по счетчику: ключи JSON не обязаны быть идентификаторами
+        # ("dest-port"), а склейка через "_" путает a_b.c и a.b_c. Ключи — только в repr()
+        if path not in parents:
+            source = "get" if len(path) == 1 else f"{parent_var(path[:-1])}.get"
+            var = f"_p{len(parents)}"
+            lines.append(f"    {var} = {source}({path[-1]!r})")
+            lines.append(f"    {var} = {var} if {var}.__class__ is dict else _EMPTY")
+            parents[path] = var
+        return parents[path]
+
+    def access(path: str) -> str:
+        *prefix, key = path.split(".")
+        return f"{parent_var(tuple(prefix))}.get({key!r})" if prefix else f"get({key!r})"
+
+    items = []
+    for index, (out_key, source) in enumerate(fields.items()):
+        alternatives = source if isinstance(source, tuple) else (source,)
+        expression = access(alternatives[-1])
+        if out_key in defaults:
+            namespace[f"_default{index}"] = defaults[out_key]
+            expression = f"_v if (_v := {expression}) is not None else _default{index}"
+        for alternative in reversed(alternatives[:-1]):
+            expression = f"_v if (_v := {access(alternative)}) is not None else ({expression})"
+        items.append(f"        {out_key!r}: {expression},")
+    for index, (out_key, value) in enumerate(constants.items()):
+        namespace[f"_const{index}"] = value
+        items.append(f"        {out_key!r}: _const{index},")
+
+    body = "\n".join(lines)
+    result = "{\n" + "\n".join(items) + "\n    }"
+    if finalize is None:
+        source_code = f"def {name}(data):\n{body}\n    return {result}\n"
+    else:
+        source_code = f"def {name}(data):\n{body}\n    result = {result}\n    _finalize(result, data)\n    return result\n"
+    exec(compile(source_code, f"<normalizer {name}>", "exec"), namespace)
+    mapper = namespace[name]
+    mapper.source = source_code
+    return mapper
+
+
+def _dionaea_finalize(result: Dict[str, Any], data: Dict[str, Any]):
+    # Dionaea кладет скачанные образцы списком downloads — берем первый
+    downloads = data.get("downloads")
+    if isinstance(downloads, list) and downloads and isinstance(downloads[0], dict):
+        result["md5"] = result["md5"] or downloads[0].get("md5_hash")
+        result["url"] = result["url"] or downloads[0].get("url")
+    if result["event_type"] is None:
+        result["event_type"] = "malware_download" if result["md5"] else "dionaea_connection"
+
+
+def _mappable(raw_data: Any) -> Dict[str, Any]:
+    """Мапперы читают словарь: список или число в raw_data передаем как сообщение"""
+    return raw_data if isinstance(raw_data, dict) else {"message": str(raw_data)}
+
+
+def _generic_mapper(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "event_type": "generic_event",
+        "raw_message": str(data)
+    }
+
+
+COWRIE_FIELDS = {
+    "event_type": "eventid",
+    "src_ip": "src_ip",
+    "src_port": "src_port",
+    "dst_ip": "dst_ip",
+    "dst_port": "dst_port",
+    "username": "username",
+    "password": "password",
+    "success": "success",
+    "command": "input",
+    "session": "session"
+}
+
+# Родной log_json Dionaea кладет адреса в connection.{local,remote}; плоские варианты —
+# после logstash/экспорта из SQLite
+DIONAEA_FIELDS = {
+    "event_type": "eventid",
+    "src_ip": ("connection.remote.address", "src_ip", "remote_host"),
+    "src_port": ("connection.remote.port", "src_port", "remote_port"),
+    "dst_ip": ("connection.local.address", "dst_ip", "local_host"),
+    "dst_port": ("connection.local.port", "dst_port", "local_port"),
+    "protocol": ("connection.protocol", "connection_protocol"),
+    "transport": ("connection.transport", "connection_transport"),
+    "md5": ("md5", "md5_hash", "download_md5_hash"),
+    "sha512": ("sha512", "sha512_hash"),
+    "url": ("url", "download_url"),
+    "filename": ("filename", "file")
+}
+
+
 class LogNormalizer:
     def __init__(self):
-        self.schema_mapping = {
-            "cowrie_ssh": self.normalize_cowrie_ssh,
-            "palo_alto_firewall": self.normalize_palo_alto,
-            "fortinet_firewall": self.normalize_fortinet,
-            "generic_syslog": self.normalize_syslog
+        # Мапперы собираются один раз; на событие — выбор по типу и один вызов сгенерированной функции
+        self.schema_mapping: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+            "cowrie_ssh": compile_mapper(
+                "map_cowrie_ssh",
+                COWRIE_FIELDS,
+                constants={"protocol": "ssh"},
+                defaults={"event_type": "unknown", "success": False}
+            ),
+            "palo_alto_firewall": compile_mapper(
+                "map_palo_alto",
+                {
+                    "src_ip": "src",
+                    "dst_ip": "dst",
+                    "src_port": "spt",
+                    "dst_port": "dpt",
+                    "action": "act",
+                    "rule": "rule",
+                    "bytes_sent": "bytes",
+                    "threat_id": "threatid",
+                    "severity": "severity"
+                },
+                constants={"event_type": "firewall_traffic"}
+            ),
+            "fortinet_firewall": compile_mapper(
+                "map_fortinet",
+                {
+                    "src_ip": "srcip",
+                    "dst_ip": "dstip",
+                    "src_port": "srcport",
+                    "dst_port": "dstport",
+                    "action": "action",
+                    "service": "service",
+                    "bytes": "sentbyte"
+                },
+                constants={"event_type": "firewall_traffic"}
+            ),
+            "generic_syslog": compile_mapper(
+                "map_syslog",
+                {
+                    "message": "message",
+                    "facility": "facility",
+                    "severity": "severity",
+                    "hostname": "hostname",
+                    "app_name": "app_name",
+                    "procid": "procid"
+                },
+                constants={"event_type": "syslog_message"}
+            ),
+            "cef": compile_mapper(
+                "map_cef",
+                {
+                    "event_type": "cat",
+                    "src_ip": "src",
+                    "dst_ip": "dst",
+                    "src_port": "spt",
+                    "dst_port": "dpt",
+                    "action": "act",
+                    "protocol": "proto",
+                    "username": ("suser", "duser"),
+                    "bytes": "bytes",
+                    "severity": "severity",
+                    "signature_id": "signature_id",
+                    "name": "name",
+                    "device_vendor": "device_vendor",
+                    "device_product": "device_product",
+                    "hostname": "dvchost"
+                },
+                defaults={"event_type": "cef_event"}
+            ),
+            "leef": compile_mapper(
+                "map_leef",
+                {
+                    "event_type": "event_id",
+                    "src_ip": "src",
+                    "dst_ip": "dst",
+                    "src_port": "srcPort",
+                    "dst_port": "dstPort",
+                    "action": ("action", "cat"),
+                    "protocol": "proto",
+                    "username": "usrName",
+                    "severity": "sev",
+                    "device_vendor": "device_vendor",
+                    "device_product": "device_product"
+                },
+                defaults={"event_type": "leef_event"}
+            ),
+            "dionaea_malware": compile_mapper("map_dionaea", DIONAEA_FIELDS, finalize=_dionaea_finalize),
+            "t_pot": self.normalize_t_pot
         }
-    
-    def normalize(self, source: str, log_type: str, raw_data: Dict[str, Any], timestamp: datetime) -> Dict[str, Any]:
+
+        # T-Pot присылает события всех своих ханипотов в одном формате (dest_*, type),
+        # поэтому разбираем по полю type, а неизвестные ханипоты — общим маппером
+        tpot_common = {"src_ip": "src_ip", "src_port": "src_port", "dst_ip": "dest_ip", "dst_port": "dest_port", "honeypot": "type"}
+        self.t_pot_mappers = {
+            "Cowrie": compile_mapper(
+                "map_t_pot_cowrie",
+                {**COWRIE_FIELDS, **tpot_common},
+                constants={"protocol": "ssh"},
+                defaults={"event_type": "unknown", "success": False}
+            ),
+            "Dionaea": compile_mapper(
+                "map_t_pot_dionaea",
+                {**DIONAEA_FIELDS, **tpot_common, "src_ip": ("src_ip", "connection.remote.address")},
+                finalize=_dionaea_finalize
+            ),
+            "Suricata": compile_mapper(
+                "map_t_pot_suricata",
+                {
+                    **tpot_common,
+                    "event_type": "event_type",
+                    "protocol": ("proto", "app_proto"),
+                    "signature": "alert.signature",
+                    "signature_id": "alert.signature_id",
+                    "alert_severity": "alert.severity",
+                    "country": "geoip.country_name"
+                },
+                defaults={"event_type": "suricata_event"}
+            )
+        }
+        self.t_pot_default = compile_mapper(
+            "map_t_pot",
+            {
+                **tpot_common,
+                "event_type": ("eventid", "event_type"),
+                "protocol": ("protocol", "proto"),
+                "username": "username",
+                "password": "password",
+                "command": "input",
+                "country": "geoip.country_name"
+            },
+            defaults={"event_type": "tpot_event"}
+        )
+
+    def normalize(
+        self,
+        source: str,
+        log_type: str,
+        raw_data: Dict[str, Any],
+        timestamp: Union[datetime, str],
+        event_id: Optional[str] = None,
+        received_at: Optional[str] = None
+    ) -> Dict[str, Any]:
         """
-        Приводим лог к единому формату, чтобы дальше было проще работать
+        Приводим лог к единому формату, чтобы дальше было проще работать.
+        raw_data строкой (CEF, LEEF, syslog) сначала разбирается raw_parsers
         """
-        normalizer_func = self.schema_mapping.get(log_type, self.normalize_generic)
-        normalized = normalizer_func(raw_data)
+        if raw_data.__class__ is str:
+            log_type, raw_data = self.parse_raw(log_type, raw_data)
+        normalized = self.schema_mapping.get(log_type, _generic_mapper)(_mappable(raw_data))
         # Добавляем общие поля — чтобы не потерять важное
-        normalized.update({
-            "event_id": str(uuid.uuid4()),
-            "received_at": datetime.utcnow().isoformat(),
-            "source": source,
-            "log_type": log_type,
-            "timestamp": timestamp.isoformat(),
-            "raw_data": raw_data  # Оригинальные данные — пригодятся для расследования
-        })
+        normalized["event_id"] = event_id or str(uuid.uuid4())
+        normalized["received_at"] = received_at or datetime.utcnow().isoformat()
+        normalized["source"] = source
+        normalized["log_type"] = log_type
+        normalized["timestamp"] = timestamp if isinstance(timestamp, str) else timestamp.isoformat()
+        normalized["raw_data"] = raw_data  # Оригинальные данные — пригодятся для расследования
         return normalized
-    
-    def normalize_cowrie_ssh(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        return {
-            "event_type": data.get("eventid", "unknown"),
-            "src_ip": data.get("src_ip"),
-            "src_port": data.get("src_port"),
-            "dst_ip": data.get("dst_ip"),
-            "dst_port": data.get("dst_port"),
-            "username": data.get("username"),
-            "password": data.get("password"),
-            "success": data.get("success", False),
-            "command": data.get("input"),
-            "session": data.get("session"),
-            "protocol": "ssh"
-        }
-    
-    def normalize_palo_alto(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        # Разбираем CEF-формат, вытаскиваем полезное
-        return {
-            "event_type": "firewall_traffic",
-            "src_ip": data.get("src"),
-            "dst_ip": data.get("dst"),
-            "src_port": data.get("spt"),
-            "dst_port": data.get("dpt"),
-            "action": data.get("act"),
-            "rule": data.get("rule"),
-            "bytes_sent": data.get("bytes"),
-            "threat_id": data.get("threatid"),
-            "severity": data.get("severity")
-        }
-    
-    def normalize_fortinet(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        return {
-            "event_type": "firewall_traffic",
-            "src_ip": data.get("srcip"),
-            "dst_ip": data.get("dstip"),
-            "src_port": data.get("srcport"),
-            "dst_port": data.get("dstport"),
-            "action": data.get("action"),
-            "service": data.get("service"),
-            "bytes": data.get("sentbyte")
-        }
-    
-    def normalize_syslog(self, data: Dict[str, Any]) -> Dict[str, Any]:
+
+    def normalize_batch(self, logs: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Пачка логов в формате тела POST /api/v1/logs (source, log_type, raw_data, timestamp, event_id).
+        received_at один на пачку, диспетчеризация и общие поля — без лишних вызовов на событие.
+        """
+        received_at = datetime.utcnow().isoformat()
+        mappers = self.schema_mapping
+        uuid4 = uuid.uuid4
+        result = []
+        append = result.append
+        for log in logs:
+            log_type = log.get("log_type", "unknown")
+            raw_data = log.get("raw_data") or {}
+            if raw_data.__class__ is str:
+                log_type, raw_data = self.parse_raw(log_type, raw_data)
+            normalized = mappers.get(log_type, _generic_mapper)(
+                raw_data if raw_data.__class__ is dict else _mappable(raw_data)
+            )
+            timestamp = log.get("timestamp") or received_at
+            normalized["event_id"] = log.get("event_id") or str(uuid4())
+            normalized["received_at"] = received_at
+            normalized["source"] = log.get("source", "unknown")
+            normalized["log_type"] = log_type
+            normalized["timestamp"] = timestamp if isinstance(timestamp, str) else timestamp.isoformat()
+            normalized["raw_data"] = raw_data
+            append(normalized)
+        return result
+
+    def parse_raw(self, log_type: str, line: str) -> Tuple[str, Dict[str, Any]]:
+        """Сырая строка -> (тип, словарь); известный тип от отправителя важнее определенного по строке"""
+        detected_type, data = parse_line(line)
+        return (log_type if log_type in self.schema_mapping else detected_type), data
+
+    def normalize_t_pot(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        return self.t_pot_mappers.get(data.get("type"), self.t_pot_default)(data)
+
+    @staticmethod
+    def typed_fields(normalized: Dict[str, Any]) -> Dict[str, Any]:
+        """Непустые нормализованные поля со своими типами — для документа Elasticsearch"""
         return {
-            "event_type": "syslog_message",
-            "message": data.get("message"),
-            "facility": data.get("facility"),
-            "severity": data.get("severity"),
-            "hostname": data.get("hostname")
+            key: value
+            for key, value in normalized.items()
+            if value is not None and key not in COMMON_FIELDS and not isinstance(value, (dict, list))
         }
-    
-    def normalize_generic(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        return {
-            "event_type": "generic_event",
-            "raw_message": str(data)
-        }
\ No newline at end of file
+
+    @staticmethod
+    def flat_fields(normalized: Dict[str, Any]) -> Dict[str, str]:
+        """Те же поля строками — для Redis hash, где их читают детекторы"""
+        return {key: str(value) for key, value in LogNormalizer.typed_fields(normalized).items()}
+
+
+# Глобальный нормализатор
+log_normalizer = LogNormalizer()
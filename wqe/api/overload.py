@@ -0,0 +1,286 @@
+"""
+Защита классификации от перегрузки.
+
+BERT синхронный и на CPU стоит десятки миллисекунд на лог: при всплеске запросы копятся
+в цикле событий и очереди syslog, пока клиенты не отвалятся по таймауту. OverloadController
+стоит перед классификацией и следит за спросом на модель (сколько секунд BERT нужно в
+секунду) и очередью syslog. Одна большая пачка при свободной модели — не перегрузка: она
+делится на части не дольше бюджета пачки (chunk_size), и между частями цикл событий
+обслуживает других. Когда спрос или очередь держатся выше порога, он переключается
+в degraded режим:
+  - BERT получает только ограниченную долю времени (токены в секундах модели) и не больше
+    бюджета на пачку; сначала приоритетные логи (похожие на критичные классы), остальные —
+    случайной выборкой;
+  - остальным логам класс берется из кэша шаблонов (последний ответ BERT на такой же
+    шаблон сообщения) или из эвристики по ключевым словам;
+  - такие результаты помечаются degraded=True и method=template/heuristic.
+Возврат в нормальный режим — когда спрос и очередь спадают и держатся низкими cooldown секунд.
+"""
+import os
+import random
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from log_summary import message_template
+from metrics import CLASSIFICATION_PATH_TOTAL, OVERLOAD_MODE_SWITCHES_TOTAL
+
+# Доля времени процесса, которую BERT может занимать в degraded режиме
+OVERLOAD_BERT_SHARE = float(os.getenv("OVERLOAD_BERT_SHARE", 0.7))
+# Максимум времени BERT за один заход — пачки больше делятся на части (граница задержки)
+OVERLOAD_BATCH_BUDGET_MS = float(os.getenv("OVERLOAD_BATCH_BUDGET_MS", 1000))
+# Спрос (секунд BERT в секунду): выше ENTER — degraded, ниже EXIT cooldown секунд — обратно
+OVERLOAD_ENTER_DEMAND = float(os.getenv("OVERLOAD_ENTER_DEMAND", 0.9))
+OVERLOAD_EXIT_DEMAND = float(os.getenv("OVERLOAD_EXIT_DEMAND", 0.6))
+OVERLOAD_QUEUE_HIGH = int(os.getenv("OVERLOAD_QUEUE_HIGH", 5000))
+OVERLOAD_QUEUE_LOW = int(os.getenv("OVERLOAD_QUEUE_LOW", 500))
+OVERLOAD_COOLDOWN_SECONDS = float(os.getenv("OVERLOAD_COOLDOWN_SECONDS", 5))
+# Сколько секунд спрос должен держаться выше ENTER, чтобы это считалось перегрузкой, а не всплеском
+OVERLOAD_SUSTAIN_SECONDS = float(os.getenv("OVERLOAD_SUSTAIN_SECONDS", 5))
+TEMPLATE_CACHE_SIZE = int(os.getenv("TEMPLATE_CACHE_SIZE", 50000))
+
+# Оценка времени BERT до первых измерений и вес нового измерения в скользящем среднем
+INITIAL_BERT_SECONDS = 0.03
+EWMA_ALPHA = 0.1
+# Окно, за которое считается спрос на модель
+DEMAND_WINDOW_SECONDS = 1.0
+HEURISTIC_CONFIDENCE = 0.5
+
+# Эвристика: все ключевые слова правила есть в сообщении (в нижнем регистре) -> класс.
+# Порядок важен — более конкретные правила выше
+HEURISTIC_RULES: Tuple[Tuple[Tuple[str, ...], str], ...] = (
+    (("bgp", "down"), "bgp_nbr_down"),
+    (("bgp", "idle"), "bgp_nbr_down"),
+    (("bgp", "reset"), "bgp_nbr_reset"),
+    (("bgp",), "bgp_state_change"),
+    (("ospf", "down"), "OSPF_NBRDOWN"),
+    (("ospf",), "ospf_neigh_state_flap"),
+    (("bfd", "down"), "bfd_down"),
+    (("bfd",), "bfd_state_change"),
+    (("rsvp", "bypass", "down"), "RPD_RSVP_BYPASS_DOWN"),
+    (("rsvp", "down"), "RSVP_NBRDOWN"),
+    (("mpls",), "MPLS_PATH_STATUS"),
+    (("lldp",), "LLDP_NBR_DOWN"),
+    (("vrrp",), "vrrp_vlan"),
+    (("sfp",), "sfp_link_power"),
+    (("asic",), "ASIC_ALARM"),
+    (("flap",), "if_flap"),
+    (("interface", "down"), "if_down"),
+    (("link", "down"), "port_link_updown"),
+    (("snmp", "auth"), "SNMPD_AUTH_FAILURE"),
+    (("failed password",), "ssh"),
+    (("ssh",), "ssh"),
+    (("spanning",), "stp_change"),
+    (("reboot",), "system_reboot"),
+    (("commit",), "ui_commit_progress"),
+    (("cmd",), "cli_cmd_executed"),
+    (("command",), "cli_cmd_executed"),
+    (("deny",), "firewall_medium"),
+    (("drop",), "firewall_medium"),
+    (("critical",), "critical_log_event"),
+)
+# Слова, по которым лог идет к BERT в первую очередь, даже если эвристика класс не нашла
+PRIORITY_WORDS = ("down", "fail", "error", "critical", "alarm", "attack", "malware", "denied")
+
+
+class OverloadController:
+    """Выбирает, какие логи пачки классифицирует BERT, а какие — кэш шаблонов и эвристика"""
+
+    def __init__(
+        self,
+        classes: Dict[str, str],
+        critical_classes: Set[str],
+        queue_depth: Callable[[], int] = lambda: 0,
+        bert_available: Callable[[], bool] = lambda: True,
+        bert_share: float = OVERLOAD_BERT_SHARE,
+        batch_budget_ms: float = OVERLOAD_BATCH_BUDGET_MS,
+        cache_size: int = TEMPLATE_CACHE_SIZE
+    ):
+        self.critical_classes = critical_classes
+        self.queue_depth = queue_depth
+        self.bert_available = bert_available
+        self.bert_share = bert_share
+        self.batch_budget = batch_budget_ms / 1000
+        self.cache_size = cache_size
+
+        ids = {name: class_id for class_id, name in classes.items()}
+        self.rules = [(keywords, int(ids[name]), name, ids[name] in critical_classes) for keywords, name in HEURISTIC_RULES]
+
+        self.degraded = False
+        self.reason: Optional[str] = None
+        self.switched_at = time.monotonic()
+        self.template_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.bert_seconds = INITIAL_BERT_SECONDS
+        self.demand = 0.0
+        self._tokens = 0.0
+        self._refilled_at = time.monotonic()
+        self._window_started = time.monotonic()
+        self._window_demand = 0.0
+        self._calm_since: Optional[float] = None
+        self._hot_since: Optional[float] = None
+        self.counters = {"bert": 0, "template": 0, "heuristic": 0, "switches": 0}
+
+    def classify_batch(self, texts: List[str], classify: Callable[[str], Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Результаты классификации в порядке texts; classify — полный путь через BERT"""
+        if not texts:
+            return []
+        templates = [message_template(text) for text in texts]
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(texts)
+        if not self.degraded:
+            bert_indexes = range(len(texts))
+        else:
+            bert_indexes = self._select_for_bert(texts)
+
+        spent = 0.0
+        for index in bert_indexes:
+            started = time.perf_counter()
+            result = classify(texts[index])
+            elapsed = time.perf_counter() - started
+            spent += elapsed
+            self.bert_seconds += EWMA_ALPHA * (elapsed - self.bert_seconds)
+            result["degraded"] = False
+            results[index] = result
+            if result["class_id"] >= 0:
+                self._remember(templates[index], result)
+        if self.degraded:
+            self._tokens -= spent
+        self.counters["bert"] += len(bert_indexes)
+        CLASSIFICATION_PATH_TOTAL.inc("bert", amount=len(bert_indexes))
+
+        for index, result in enumerate(results):
+            if result is None:
+                results[index] = self._fallback(texts[index], templates[index])
+        return results
+
+    def chunk_size(self) -> int:
+        """Сколько логов классифицировать за один заход, чтобы уложиться в бюджет пачки"""
+        return max(1, int(self.batch_budget / self.bert_seconds))
+
+    def _select_for_bert(self, texts: List[str]) -> List[int]:
+        """Индексы логов для BERT в degraded режиме: приоритетные, затем случайная выборка"""
+        if not self.bert_available():
+            return []
+        now = time.monotonic()
+        self._tokens = min(self.batch_budget, self._tokens + (now - self._refilled_at) * self.bert_share)
+        self._refilled_at = now
+        capacity = int(min(self._tokens, self.batch_budget) / self.bert_seconds)
+        if capacity <= 0:
+            return []
+
+        priority, rest = [], []
+        for index, text in enumerate(texts):
+            (priority if self._is_priority(text.lower()) else rest).append(index)
+        if len(priority) >= capacity:
+            return priority[:capacity]
+        return priority + random.sample(rest, min(len(rest), capacity - len(priority)))
+
+    def _is_priority(self, lowered: str) -> bool:
+        for keywords, _, _, critical in self.rules:
+            if critical and all(keyword in lowered for keyword in keywords):
+                return True
+        return any(word in lowered for word in PRIORITY_WORDS)
+
+    def _remember(self, template: str, result: Dict[str, Any]):
+        cache = self.template_cache
+        cache[template] = result
+        cache.move_to_end(template)
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
+    def _fallback(self, text: str, template: str) -> Dict[str, Any]:
+        cached = self.template_cache.get(template)
+        if cached is not None:
+            self.counters["template"] += 1
+            CLASSIFICATION_PATH_TOTAL.inc("template")
+            return {**cached, "degraded": True, "method": "template"}
+
+        self.counters["heuristic"] += 1
+        CLASSIFICATION_PATH_TOTAL.inc("heuristic")
+        lowered = text.lower()
+        for keywords, class_id, name, critical in self.rules:
+            if all(keyword in lowered for keyword in keywords):
+                return {
+                    "class_id": class_id,
+                    "class_name": name,
+                    "confidence": HEURISTIC_CONFIDENCE,
+                    "is_anomaly": critical,
+                    "degraded": True,
+                    "method": "heuristic"
+                }
+        return {
+            "class_id": -1,
+            "class_name": "UNCLASSIFIED",
+            "confidence": 0.0,
+            "is_anomaly": False,
+            "degraded": True,
+            "method": "heuristic"
+        }
+
+    def admit(self, batch_size: int):
+        """Пачка пришла на классификацию (один раз на пачку, до classify_batch по частям)"""
+        now = time.monotonic()
+        # Спрос — сколько секунд BERT понадобилось бы в секунду, если классифицировать все
+        self._window_demand += batch_size * self.bert_seconds
+        elapsed = now - self._window_started
+        if elapsed >= DEMAND_WINDOW_SECONDS:
+            self.demand = self._window_demand / elapsed
+            if self.demand <= OVERLOAD_ENTER_DEMAND:
+                self._hot_since = None
+            elif self._hot_since is None:
+                # Отсчет — с закрытия первого горячего окна: одно окно после простоя (всплеск) не
+                # считается устойчивым спросом, нужны горячие окна подряд в течение SUSTAIN секунд
+                self._hot_since = now
+            self._window_demand = 0.0
+            self._window_started = now
+        self._update_mode(now)
+
+    def _update_mode(self, now: float):
+        queue_depth = self.queue_depth()
+
+        if not self.degraded:
+            if not self.bert_available():
+                self._switch(True, "model_unavailable")
+            elif self._hot_since is not None and now - self._hot_since >= OVERLOAD_SUSTAIN_SECONDS:
+                self._switch(True, "demand")
+            elif queue_depth > OVERLOAD_QUEUE_HIGH:
+                self._switch(True, "queue_depth")
+            return
+
+        calm = (
+            self.bert_available()
+            and self.demand < OVERLOAD_EXIT_DEMAND
+            and queue_depth < OVERLOAD_QUEUE_LOW
+        )
+        if not calm:
+            self._calm_since = None
+        elif self._calm_since is None:
+            self._calm_since = now
+        elif now - self._calm_since >= OVERLOAD_COOLDOWN_SECONDS:
+            self._switch(False, "recovered")
+
+    def _switch(self, degraded: bool, reason: str):
+        self.degraded = degraded
+        self.reason = reason
+        self.switched_at = time.monotonic()
+        self._calm_since = None
+        # Доля BERT считается только в degraded режиме; пачка, вызвавшая переключение,
+        # получает свой бюджет сразу
+        self._tokens = self.batch_budget
+        self._refilled_at = self.switched_at
+        self.counters["switches"] += 1
+        mode = "degraded" if degraded else "normal"
+        OVERLOAD_MODE_SWITCHES_TOTAL.inc(mode, reason)
+        print(f"Classification switched to {mode} mode ({reason}, demand {self.demand:.2f}, bert {self.bert_seconds * 1000:.1f}ms)")
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "mode": "degraded" if self.degraded else "normal",
+            "reason": self.reason,
+            "mode_seconds": round(time.monotonic() - self.switched_at, 1),
+            "demand": round(self.demand, 3),
+            "bert_ms": round(self.bert_seconds * 1000, 2),
+            "queue_depth": self.queue_depth(),
+            "template_cache_size": len(self.template_cache),
+            **self.counters
+        }
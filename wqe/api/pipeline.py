@@ -0,0 +1,358 @@
+import asyncio
+import contextvars
+import functools
+import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from normalizer import log_normalizer
+from federated_query import event_score
+from search_index import document_texts
+from metrics import (
+    INGEST_STAGE_SECONDS, REDIS_OPERATION_SECONDS, CLASSIFICATION_PATH_TOTAL, CLASSIFICATIONS_TOTAL,
+    INGEST_EVENTS_TOTAL
+)
+
+
+class IngestPipeline:
+    """
+    Общий путь приема логов: нормализация пачкой -> текст -> BERT -> Redis -> ES -> аномалии.
+
+    Через него идут POST /api/v1/logs, /logs/create, /logs/bulk и syslog_server, поэтому лог
+    сохраняется одинаково независимо от того, как пришел. Запись в Redis — один pipeline
+    на пачку (hset + zadd + lpush на каждый лог), а не три сетевых запроса на лог.
+    Зависимости передаются при создании: модель и хранилища живут в main.py.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        extract_text: Callable[[Any], str],
+        classify: Callable[[str], Dict[str, Any]],
+        store_long_term: Callable[..., None],
+        detect_anomaly: Callable[[Dict[str, Any], Dict[str, Any]], Awaitable[Optional[Dict[str, Any]]]],
+        overload=None,
+        cascade=None,
+        templates=None,
+        dedup=None,
+        heavy_hitters=None,
+        ioc=None,
+        search_index=None,
+        update_long_term: Optional[Callable[[str, str, str, Dict[str, Any]], None]] = None
+    ):
+        self.redis_client = redis_client
+        self.extract_text = extract_text
+        self.classify = classify
+        self.store_long_term = store_long_term
+        self.detect_anomaly = detect_anomaly
+        # OverloadController: при перегрузке часть логов классифицируется без BERT
+        self.overload = overload
+        # CascadeClassifier: уверенные некритичные логи классифицирует быстрая модель, без BERT
+        self.cascade = cascade
+        # TemplateMiner: template_id на каждый лог, таблица шаблонов пишется тем же Redis pipeline
+        self.templates = templates
+        # DedupWindow: повторы в окне не сохраняются и не классифицируются, а увеличивают
+        # repeat_count первой записи; update_long_term(kind, id, timestamp, fields) дописывает
+        # итог окна в Elasticsearch (kind — "log" или "anomaly")
+        self.dedup = dedup
+        self.update_long_term = update_long_term
+        # HeavyHitters: скетчи топов по всем логам пачки (вместе с повторами), пишутся тем же pipeline
+        self.heavy_hitters = heavy_hitters
+        # IOCMatcher: поля событий против threat intel; совпадение — отдельная аномалия ioc_match
+        self.ioc = ioc
+        # SearchIndex: токены текста лога -> постинги по часам, пишутся тем же pipeline
+        self.search_index = search_index
+        # Классификация (каскад, BERT) — в отдельном потоке, чтобы цикл событий продолжал читать
+        # сокеты syslog и HTTP; один поток — вызовы модели, каскада и OverloadController идут
+        # по очереди (OverloadController трогается только из этого потока)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="classify")
+
+    async def process(self, logs: List[Dict[str, Any]], keep_ids: bool = True) -> List[Dict[str, Any]]:
+        """
+        Пачка логов в формате тела POST /api/v1/logs. keep_ids=False — всегда новый id
+        (так исторически работает /api/v1/logs), иначе берется event_id из лога.
+        Возвращает по результату на лог в том же порядке
+        """
+        opened = []
+        try:
+            return await self._process(logs, keep_ids, opened)
+        except BaseException:
+            # Первые записи окон, открытых этой пачкой, не сохранились — повторы не должны на них ссылаться
+            for window in opened:
+                self.dedup.discard(window)
+            raise
+
+    async def _process(self, logs: List[Dict[str, Any]], keep_ids: bool, opened: List[Any]) -> List[Dict[str, Any]]:
+        """process; opened — окна повторов, открытые пачкой (их первые записи сохраняет этот вызов)"""
+        if not keep_ids:
+            logs = [{**log, 'event_id': str(uuid.uuid4())} for log in logs]
+
+        with INGEST_STAGE_SECONDS.time("normalize"):
+            normalized_logs = log_normalizer.normalize_batch(logs)
+
+        prepared, texts = [], []
+        for log_data, normalized in zip(logs, normalized_logs):
+            # Сырая строка (CEF/LEEF/syslog) разобрана — дальше храним словарь и определенный тип
+            if isinstance(log_data.get('raw_data'), str):
+                log_data = {**log_data, 'log_type': normalized['log_type'], 'raw_data': normalized['raw_data']}
+            prepared.append(log_data)
+            with INGEST_STAGE_SECONDS.time("extract"):
+                texts.append(self.extract_text(log_data.get('raw_data', {})))
+
+        if self.templates is not None:
+            with INGEST_STAGE_SECONDS.time("template"):
+                template_ids = self.templates.add_batch(texts)
+        else:
+            template_ids = [None] * len(texts)
+
+        # Окно повтора на каждый лог (None — лог не схлопывается); повтор — окно уже было открыто
+        windows, fresh = [None] * len(prepared), list(range(len(prepared)))
+        if self.dedup is not None:
+            with INGEST_STAGE_SECONDS.time("dedup"):
+                windows, fresh = self._dedup(prepared, normalized_logs, opened)
+
+        fresh_results = await self._classify([texts[index] for index in fresh])
+        bert_results: List[Optional[Dict[str, Any]]] = [None] * len(prepared)
+        for index, bert_result in zip(fresh, fresh_results):
+            bert_results[index] = bert_result
+            if windows[index] is not None:
+                windows[index].bert_result = bert_result
+
+        ioc_matches: List[Optional[List[Dict[str, str]]]] = [None] * len(prepared)
+        if self.ioc is not None and fresh:
+            with INGEST_STAGE_SECONDS.time("ioc"):
+                for index, matches in zip(fresh, self.ioc.match_batch([normalized_logs[index] for index in fresh])):
+                    ioc_matches[index] = matches
+
+        entries = []
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for index in fresh:
+            log_data, normalized, log_text = prepared[index], normalized_logs[index], texts[index]
+            bert_result, template_id = bert_results[index], template_ids[index]
+            log_id = normalized['event_id']
+            timestamp = normalized['timestamp']
+            # В Elasticsearch поля идут со своими типами (dst_port число, success bool), в Redis — строками
+            typed_fields = log_normalizer.typed_fields(normalized)
+            if template_id is not None:
+                typed_fields['template_id'] = template_id
+            if ioc_matches[index]:
+                typed_fields['ioc_matches'] = ",".join(f"{match['field']}={match['value']}" for match in ioc_matches[index])
+            normalized_fields = {key: str(value) for key, value in typed_fields.items()}
+
+            log_key = f"log:{log_id}"
+            pipeline.hset(log_key, mapping={
+                **normalized_fields,
+                'id': log_id,
+                'source': normalized['source'],
+                'log_type': normalized['log_type'],
+                'timestamp': timestamp,
+                'raw_data': json.dumps(normalized['raw_data']),
+                'bert_class': bert_result['class_name'],
+                'bert_class_id': str(bert_result['class_id']),
+                'bert_confidence': str(bert_result['confidence']),
+                'is_anomaly': str(bert_result['is_anomaly']),
+                'bert_method': bert_result.get('method', 'bert')
+            })
+            # Время лога — по событию (как в Elasticsearch); индекс поиска — по приему (срок жизни)
+            received = datetime.utcnow().timestamp()
+            pipeline.zadd("logs:timestamps", {log_key: event_score(timestamp, received)})
+            if self.search_index is not None:
+                self.search_index.add(log_key, [log_text] + document_texts(normalized['raw_data']), received)
+            pipeline.lpush("logs_list", json.dumps({**normalized_fields, **log_data, 'bert_analysis': bert_result}))
+            entries.append((index, log_id, log_data, log_text, timestamp, bert_result, typed_fields))
+
+        if self.heavy_hitters is not None and prepared:
+            with INGEST_STAGE_SECONDS.time("heavy_hitters"):
+                self.heavy_hitters.add_batch(self._top_columns(normalized_logs, bert_results, windows))
+                self.heavy_hitters.flush(pipeline)
+
+        if prepared:
+            if self.templates is not None:
+                self.templates.flush(pipeline)
+            if self.search_index is not None:
+                with INGEST_STAGE_SECONDS.time("search_index"):
+                    self.search_index.flush(pipeline)
+            redis_started = time.perf_counter()
+            await asyncio.to_thread(pipeline.execute)
+            elapsed = time.perf_counter() - redis_started
+            INGEST_STAGE_SECONDS.observe(elapsed, "redis")
+            REDIS_OPERATION_SECONDS.observe(elapsed, "log_pipeline")
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(prepared)
+        for index, log_id, log_data, log_text, timestamp, bert_result, typed_fields in entries:
+            with INGEST_STAGE_SECONDS.time("long_term"):
+                self.store_long_term(log_id, log_data, log_text, timestamp, bert_result, typed_fields)
+
+            anomaly = None
+            if bert_result["is_anomaly"]:
+                with INGEST_STAGE_SECONDS.time("anomaly"):
+                    anomaly = await self.detect_anomaly({**log_data, 'event_id': log_id}, bert_result)
+                if anomaly and windows[index] is not None:
+                    windows[index].anomaly_id = anomaly["id"]
+                    windows[index].anomaly_timestamp = anomaly["timestamp"]
+
+            results[index] = {
+                "log_id": log_id,
+                "bert_analysis": bert_result,
+                "anomaly_detected": bert_result["is_anomaly"],
+                "anomaly_id": anomaly["id"] if anomaly else None
+            }
+
+            if ioc_matches[index]:
+                with INGEST_STAGE_SECONDS.time("anomaly"):
+                    ioc_anomaly = await self.detect_anomaly(
+                        {**log_data, 'event_id': log_id}, self.ioc.anomaly_result(ioc_matches[index])
+                    )
+                results[index].update({
+                    "anomaly_detected": True,
+                    "ioc_matches": ioc_matches[index],
+                    "ioc_anomaly_id": ioc_anomaly["id"] if ioc_anomaly else None
+                })
+        INGEST_EVENTS_TOTAL.inc("stored", amount=len(entries))
+
+        # Первые записи в Redis (и их аномалии) есть — окна открыты для повторов других запросов
+        for window in opened:
+            window.owner = None
+        if len(entries) < len(prepared):
+            await self._record_repeats(windows, results)
+        return results
+
+    @staticmethod
+    def _top_columns(normalized_logs: List[Dict[str, Any]], bert_results: List[Optional[Dict[str, Any]]], windows: List[Any]):
+        """Значения измерений топов по каждому логу; у повтора класс — класс его первой записи"""
+        classes = [
+            bert_result if bert_result is not None else (window.bert_result if window is not None else None)
+            for bert_result, window in zip(bert_results, windows)
+        ]
+        return {
+            "source": [normalized['source'] for normalized in normalized_logs],
+            "src_ip": [normalized.get('src_ip') for normalized in normalized_logs],
+            "username": [normalized.get('username') for normalized in normalized_logs],
+            "dst_port": [normalized.get('dst_port') for normalized in normalized_logs],
+            "bert_class": [result['class_name'] if result else None for result in classes],
+            "anomaly_source": [
+                normalized['source'] if result and result['is_anomaly'] else None
+                for normalized, result in zip(normalized_logs, classes)
+            ]
+        }
+
+    def _dedup(self, prepared: List[Dict[str, Any]], normalized_logs: List[Dict[str, Any]], opened: List[Any]):
+        """Окна повторов для пачки и индексы логов, которые сохраняются (не повторы)"""
+        now = time.time()
+        self._close_windows(self.dedup.expire(now))
+        windows, fresh = [], []
+        for index, (log_data, normalized) in enumerate(zip(prepared, normalized_logs)):
+            key = self.dedup.key(normalized['log_type'], normalized['source'], log_data.get('raw_data'))
+            window = None
+            if key is not None:
+                # owner — список opened этой пачки: повторы внутри пачки схлопываются сразу
+                window = self.dedup.observe(key, normalized['event_id'], normalized['timestamp'], now, opened)
+            windows.append(window)
+            if window is None or window.count == 1:
+                fresh.append(index)
+                if window is not None:
+                    opened.append(window)
+        return windows, fresh
+
+    async def _record_repeats(self, windows: List[Any], results: List[Optional[Dict[str, Any]]]):
+        """
+        Ответы для повторов и обновление repeat_count/first_seen/last_seen их первых записей в Redis.
+        Первые записи уже сохранены (окна с чужим owner не схлопываются), повтор считается их классом
+        """
+        touched = {}
+        for index, window in enumerate(windows):
+            if results[index] is not None:
+                continue
+            touched[id(window)] = window
+            INGEST_EVENTS_TOTAL.inc("suppressed")
+            bert_result = window.bert_result
+            CLASSIFICATIONS_TOTAL.inc(bert_result['class_name'])
+            results[index] = {
+                "log_id": window.log_id,
+                "bert_analysis": bert_result,
+                "anomaly_detected": False,
+                "anomaly_id": window.anomaly_id,
+                "suppressed": True,
+                "repeat_count": window.count
+            }
+
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for window in touched.values():
+            fields = window.fields()
+            pipeline.hset(f"log:{window.log_id}", mapping={key: str(value) for key, value in fields.items()})
+            if window.anomaly_id:
+                pipeline.hset(f"anomaly:{window.anomaly_id}", mapping={
+                    'repeat_count': str(window.count), 'last_seen': window.last_seen
+                })
+        with REDIS_OPERATION_SECONDS.time("dedup_update"):
+            await asyncio.to_thread(pipeline.execute)
+
+    def close_dedup_windows(self):
+        """Итог всех открытых окон в Elasticsearch — при остановке, до сброса bulk_writer"""
+        if self.dedup is not None:
+            self._close_windows(self.dedup.close_all())
+
+    def _close_windows(self, windows: List[Any]):
+        if self.update_long_term is None:
+            return
+        for window in windows:
+            self.update_long_term("log", window.log_id, window.timestamp, window.fields())
+            if window.anomaly_id:
+                self.update_long_term("anomaly", window.anomaly_id, window.anomaly_timestamp, {
+                    'repeat_count': window.count, 'last_seen': window.last_seen
+                })
+
+    async def _in_classify_thread(self, func: Callable, *args):
+        """Вызов в потоке классификации с контекстом запроса: стадии (tokenize, forward) попадают в его профиль"""
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(context.run, func, *args))
+
+    def _overload_chunk(self, texts: List[str], start: int):
+        """Очередная часть пачки через OverloadController — все его состояние меняется только в этом потоке"""
+        if start == 0:
+            self.overload.admit(len(texts))
+        end = start + self.overload.chunk_size()
+        return self.overload.classify_batch(texts[start:end], self.classify), end
+
+    def _cascade_batch(self, texts: List[str]):
+        with INGEST_STAGE_SECONDS.time("cascade"):
+            return self.cascade.classify_batch(texts)
+
+    async def _classify(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """
+        Каскад, затем BERT (или degraded путь при перегрузке) для всего, что каскад не принял.
+        Все идет в потоке классификации; большая пачка — частями по chunk_size, и между частями
+        в поток успевают пачки других запросов
+        """
+        if self.cascade is None:
+            results, audit = [None] * len(texts), []
+        else:
+            results, audit = await self._in_classify_thread(self._cascade_batch, texts)
+        pending = [index for index, result in enumerate(results) if result is None] + audit
+
+        pending_texts = [texts[index] for index in pending]
+        if self.overload is not None:
+            slow_results = []
+            start = 0
+            while True:
+                chunk_results, start = await self._in_classify_thread(self._overload_chunk, pending_texts, start)
+                slow_results += chunk_results
+                if start >= len(pending_texts):
+                    break
+        else:
+            slow_results = await self._in_classify_thread(lambda: [self.classify(text) for text in pending_texts])
+
+        for index, result in zip(pending, slow_results):
+            fast = results[index]
+            if fast is None:
+                results[index] = result
+            elif result.get("method", "bert") == "bert":
+                # Аудит: принятый каскадом лог сверяем с BERT и сохраняем ответ BERT
+                self.cascade.record_audit(fast, result)
+                results[index] = result
+        if self.cascade is not None:
+            CLASSIFICATION_PATH_TOTAL.inc("cascade", amount=sum(result.get("method") == "cascade" for result in results))
+        return results
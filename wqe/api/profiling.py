@@ -0,0 +1,303 @@
+import asyncio
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# Профилирование выключено по умолчанию; включается env или на лету через admin эндпоинт
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0.01))
+PROFILE_MODE = os.getenv("PROFILE_MODE", "sampler")  # sampler | cprofile
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", 500))
+SLOW_REQUESTS_BUFFER = int(os.getenv("SLOW_REQUESTS_BUFFER", 200))
+PROFILE_DUMP_DIR = os.getenv("PROFILE_DUMP_DIR")
+SAMPLER_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLER_INTERVAL_MS", 5))
+# Долгоживущие потоки (SSE) всегда «медленные» — не профилируем их
+PROFILE_EXCLUDE_PATHS = set(
+    path for path in os.getenv("PROFILE_EXCLUDE_PATHS", "/api/v1/live,/api/v1/chat/stream,/metrics").split(",") if path
+)
+
+# Разбивка текущего запроса по стадиям (заполняется из гистограмм metrics): стадии не
+# пересекаются и складываются во время запроса, детали — замеры внутри стадий
+_request_stages: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_stages", default=None)
+_request_details: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_details", default=None)
+
+# Рабочие потоки, которые сэмплер снимает вместе с циклом событий (классификация пачек)
+PROFILE_EXTRA_THREADS = tuple(
+    name for name in os.getenv("PROFILE_EXTRA_THREADS", "classify").split(",") if name
+)
+
+MAX_STACK_DEPTH = 40
+TOP_STACKS = 25
+
+
+class StackSampler:
+    """
+    Сэмплирующий профилировщик: фоновый поток раз в interval снимает стек потока event loop
+    и рабочих потоков PROFILE_EXTRA_THREADS (sys._current_frames) и считает свернутые стеки
+    для каждого профилируемого запроса; стеки рабочих потоков — с префиксом имени потока.
+    Поток работает, только пока есть профилируемые запросы.
+
+    Запросы выполняются конкурентно на одном цикле, поэтому в профиль запроса попадают
+    и стеки соседних запросов — это картина того, чем был занят процесс в это время.
+    """
+
+    def __init__(self, interval_ms: float = SAMPLER_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.active: Dict[str, Counter] = {}
+        self.target_thread: Optional[int] = None
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def begin(self, request_id: str) -> Counter:
+        self.target_thread = threading.get_ident()
+        stacks = Counter()
+        self.active[request_id] = stacks
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+            self._thread.start()
+        self._wakeup.set()
+        return stacks
+
+    def end(self, request_id: str) -> Counter:
+        return self.active.pop(request_id, Counter())
+
+    def _run(self):
+        while True:
+            if not self.active:
+                self._wakeup.clear()
+                self._wakeup.wait()
+            frames = sys._current_frames()
+            sampled = []
+            frame = frames.get(self.target_thread)
+            if frame is not None:
+                sampled.append(_fold_stack(frame))
+            for thread in threading.enumerate():
+                frame = frames.get(thread.ident) if thread.name.startswith(PROFILE_EXTRA_THREADS) else None
+                # Простаивающий поток пула (ждет задачу в _worker) — не нагрузка, не считаем
+                if frame is not None and frame.f_code.co_name != "_worker":
+                    sampled.append(f"{thread.name};{_fold_stack(frame)}")
+            for stacks in list(self.active.values()):
+                for stack in sampled:
+                    stacks[stack] += 1
+            time.sleep(self.interval)
+
+
+class RequestProfiler:
+    """
+    Opt-in профилирование запросов FastAPI (чистый ASGI middleware).
+
+    Выключенный — одна проверка флага на запрос. Включенный — для каждого запроса собирает
+    разбивку по стадиям (через наблюдателей гистограмм metrics), запросы медленнее порога
+    кладет в кольцевой буфер (и на диск, если задан PROFILE_DUMP_DIR), а доля sample_rate
+    запросов дополнительно профилируется сэмплером стеков или cProfile.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = PROFILING_ENABLED,
+        sample_rate: float = PROFILE_SAMPLE_RATE,
+        slow_ms: float = SLOW_REQUEST_MS,
+        mode: str = PROFILE_MODE,
+        buffer_size: int = SLOW_REQUESTS_BUFFER,
+        dump_dir: Optional[str] = PROFILE_DUMP_DIR
+    ):
+        self.enabled = False
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.mode = mode
+        self.dump_dir = dump_dir
+        self.slow_requests: deque = deque(maxlen=buffer_size)
+        self.histograms = []
+        self.nested_stages = frozenset()
+        self.sampler = StackSampler()
+        self._cprofile_busy = False
+        self.counters = {"requests": 0, "sampled": 0, "slow": 0}
+        self._wanted = enabled
+
+    def watch(self, *histograms, details=(), nested_stages=()):
+        """
+        Гистограммы стадий, чьи наблюдения попадают в разбивку запроса. Сумма stages_ms не
+        должна считать один интервал дважды, поэтому замеры внутри стадий (details, и стадии
+        из nested_stages — например, telegram внутри anomaly) идут отдельно в details_ms
+        """
+        self.configure(enabled=False)
+        self.histograms.extend((histogram, _record_stage) for histogram in histograms)
+        self.histograms.extend((histogram, _record_detail) for histogram in details)
+        self.nested_stages = self.nested_stages | frozenset(nested_stages)
+        self.configure(enabled=self._wanted)
+
+    def configure(
+        self,
+        enabled: Optional[bool] = None,
+        sample_rate: Optional[float] = None,
+        slow_ms: Optional[float] = None,
+        mode: Optional[str] = None
+    ) -> Dict[str, Any]:
+        if sample_rate is not None:
+            self.sample_rate = max(0.0, min(1.0, sample_rate))
+        if slow_ms is not None:
+            self.slow_ms = slow_ms
+        if mode is not None:
+            if mode not in ("sampler", "cprofile"):
+                raise ValueError(f"Unknown profiling mode: {mode}")
+            self.mode = mode
+        if enabled is not None and enabled != self.enabled:
+            self.enabled = enabled
+            # Наблюдатель висит на гистограммах только пока профилирование включено
+            for histogram, observer in self.histograms:
+                if enabled:
+                    histogram.observers.append(observer)
+                elif observer in histogram.observers:
+                    histogram.observers.remove(observer)
+        return self.status()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "mode": self.mode,
+            "sample_rate": self.sample_rate,
+            "slow_ms": self.slow_ms,
+            "buffered": len(self.slow_requests),
+            "buffer_size": self.slow_requests.maxlen,
+            "dump_dir": self.dump_dir,
+            # Буфер медленных запросов свой у каждого воркера serve.py
+            "worker": os.getpid(),
+            **self.counters
+        }
+
+    def recent(self, limit: int = 50) -> List[Dict[str, Any]]:
+        return list(self.slow_requests)[-limit:][::-1]
+
+    async def profile_request(self, app, scope, receive, send):
+        self.counters["requests"] += 1
+        request_id = uuid.uuid4().hex[:12]
+        status = {"code": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        sampled = random.random() < self.sample_rate
+        profiler = None
+        stacks = None
+        if sampled:
+            self.counters["sampled"] += 1
+            if self.mode == "cprofile" and not self._cprofile_busy:
+                # cProfile — один на поток, поэтому одновременно профилируем только один запрос
+                self._cprofile_busy = True
+                profiler = cProfile.Profile()
+                profiler.enable()
+            else:
+                stacks = self.sampler.begin(request_id)
+
+        stages: Dict[str, float] = {}
+        details: Dict[str, float] = {}
+        token = _request_stages.set(stages)
+        details_token = _request_details.set(details)
+        started = time.perf_counter()
+        try:
+            await app(scope, receive, send_wrapper)
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            _request_stages.reset(token)
+            _request_details.reset(details_token)
+            for name in self.nested_stages.intersection(stages):
+                details[name] = details.get(name, 0.0) + stages.pop(name)
+            if profiler is not None:
+                profiler.disable()
+                self._cprofile_busy = False
+            if stacks is not None:
+                self.sampler.end(request_id)
+
+            if duration_ms >= self.slow_ms or sampled:
+                entry = {
+                    "id": request_id,
+                    "method": scope.get("method"),
+                    "path": scope.get("path"),
+                    "status": status["code"],
+                    "duration_ms": round(duration_ms, 2),
+                    "slow": duration_ms >= self.slow_ms,
+                    "sampled": sampled,
+                    "started_at": datetime.utcnow().isoformat(),
+                    "stages_ms": {name: round(value * 1000, 3) for name, value in stages.items()},
+                    "details_ms": {name: round(value * 1000, 3) for name, value in details.items()},
+                    "unaccounted_ms": round(duration_ms - sum(stages.values()) * 1000, 3)
+                }
+                if profiler is not None:
+                    entry["profile"] = _cprofile_summary(profiler)
+                elif stacks:
+                    entry["profile"] = [
+                        {"stack": stack, "samples": count} for stack, count in stacks.most_common(TOP_STACKS)
+                    ]
+                if entry["slow"]:
+                    self.counters["slow"] += 1
+                self.slow_requests.append(entry)
+                if self.dump_dir:
+                    asyncio.get_running_loop().run_in_executor(None, _dump_entry, self.dump_dir, entry)
+
+
+class ProfilingMiddleware:
+    """Чистый ASGI middleware: app.add_middleware(ProfilingMiddleware, profiler=request_profiler)"""
+
+    def __init__(self, app, profiler: RequestProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if not self.profiler.enabled or scope["type"] != "http" or scope["path"] in PROFILE_EXCLUDE_PATHS:
+            return await self.app(scope, receive, send)
+        return await self.profiler.profile_request(self.app, scope, receive, send)
+
+
+def _record_stage(value: float, labels: tuple):
+    stages = _request_stages.get()
+    if stages is not None and labels:
+        stages[labels[0]] = stages.get(labels[0], 0.0) + value
+
+
+def _record_detail(value: float, labels: tuple):
+    details = _request_details.get()
+    if details is not None and labels:
+        details[labels[0]] = details.get(labels[0], 0.0) + value
+
+
+def _fold_stack(frame) -> str:
+    """Стек в свернутом виде (root;...;leaf), как для flamegraph"""
+    parts = []
+    while frame is not None and len(parts) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+def _cprofile_summary(profiler: cProfile.Profile, limit: int = 30) -> str:
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(limit)
+    return output.getvalue()
+
+
+def _dump_entry(dump_dir: str, entry: Dict[str, Any]):
+    try:
+        os.makedirs(dump_dir, exist_ok=True)
+        path = os.path.join(dump_dir, f"{entry['started_at'].replace(':', '')}_{entry['id']}.json")
+        with open(path, "w") as f:
+            json.dump(entry, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        print(f"Не удалось сохранить профиль запроса: {e}")
+
+
+# Глобальный профилировщик API
+request_profiler = RequestProfiler()
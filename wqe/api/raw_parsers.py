@@ -0,0 +1,286 @@
+"""
+Разбор сырых строк логов (CEF, LEEF, RFC 5424, RFC 3164) в raw_data для LogNormalizer.
+
+Устройства присылают текст строками (через file_logs Vector или напрямую syslog), а мапперы
+нормализатора ждут словари. Частые раскладки разбираются без регулярных выражений
+(split/partition/срезы); регулярки, скомпилированные при импорте, нужны только для строк
+с экранированием (\\=, \\|, \\" в structured data) и нестандартных заголовков.
+"""
+import json
+import re
+from typing import Any, Dict, Optional, Tuple
+
+FACILITIES = (
+    "kern", "user", "mail", "daemon", "auth", "syslog", "lpr", "news", "uucp", "cron", "authpriv",
+    "ftp", "ntp", "security", "console", "solaris-cron",
+    "local0", "local1", "local2", "local3", "local4", "local5", "local6", "local7"
+)
+SEVERITIES = ("emerg", "alert", "crit", "err", "warning", "notice", "info", "debug")
+MONTHS = frozenset(("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"))
+
+# Числовые поля — приводим к int, как в JSON событиях
+CEF_INT_KEYS = ("spt", "dpt", "in", "out", "cnt", "cn1", "cn2", "cn3")
+LEEF_INT_KEYS = ("srcPort", "dstPort", "srcBytes", "dstBytes", "totalBytes")
+# Пользовательские поля CEF: csNLabel=Rule csN=... -> rule=...
+CEF_LABELED_KEYS = tuple(
+    (key, f"{key}Label") for key in ("cs1", "cs2", "cs3", "cs4", "cs5", "cs6", "cn1", "cn2", "cn3")
+)
+
+# Медленные пути: экранирование и нестандартные раскладки
+_CEF_HEADER_FIELD = re.compile(r'((?:\\.|[^|\\])*)\|')
+_CEF_EXTENSION = re.compile(r'([\w.\-\[\]]+)=((?:\\.|[^\\])*?)(?=\s+[\w.\-\[\]]+=|\s*$)')
+_ESCAPE = re.compile(r'\\(.)')
+_SD_ELEMENT = re.compile(r'\[([^\s\]=]+)((?:\s+[^\s=\]"]+="(?:\\.|[^"\\])*")*)\s*\]')
+_SD_PARAM = re.compile(r'([^\s=\]"]+)="((?:\\.|[^"\\])*)"')
+_ISO_TIMESTAMP = re.compile(r'(\d{4}-\d\d-\d\d[T ]\d\d:\d\d:\d\d(?:\.\d+)?(?:Z|[+-]\d\d:?\d\d)?)\s+')
+
+_CEF_ESCAPES = {"n": "\n", "r": "\r"}
+
+
+def _unescape(value: str) -> str:
+    return _ESCAPE.sub(lambda m: _CEF_ESCAPES.get(m.group(1), m.group(1)), value) if "\\" in value else value
+
+
+def _to_int(data: Dict[str, Any], keys: Tuple[str, ...]):
+    get = data.get
+    for key in keys:
+        value = get(key)
+        if value is not None and value.isdigit():
+            data[key] = int(value)
+
+
+def split_pri(line: str) -> Tuple[Optional[int], str]:
+    """"<134>..." -> (134, остаток); строка без PRI (файлы /var/log) -> (None, строка)"""
+    if line[:1] == "<":
+        end = line.find(">", 1, 5)
+        if end > 1 and line[1:end].isdigit():
+            return int(line[1:end]), line[end + 1:]
+    return None, line
+
+
+def _pri_fields(pri: Optional[int], data: Dict[str, Any]):
+    if pri is not None:
+        data["facility"] = FACILITIES[pri >> 3] if pri >> 3 < len(FACILITIES) else str(pri >> 3)
+        data["severity"] = SEVERITIES[pri & 7]
+
+
+def _split_extension(extension: str) -> Dict[str, Any]:
+    """Расширение CEF "k1=v1 k2=v 2": значение — все до последнего пробела перед следующим ключом"""
+    result: Dict[str, Any] = {}
+    parts = extension.split("=")
+    if len(parts) < 2:
+        return result
+    key = parts[0].strip()
+    for part in parts[1:-1]:
+        value, _, next_key = part.rpartition(" ")
+        result[key] = value
+        key = next_key
+    result[key] = parts[-1].rstrip()
+    return result
+
+
+def parse_cef(line: str) -> Optional[Dict[str, Any]]:
+    """CEF:Version|Vendor|Product|Version|SignatureID|Name|Severity|Extension (с syslog заголовком или без)"""
+    start = line.find("CEF:")
+    if start < 0:
+        return None
+    body = line[start + 4:]
+
+    if "\\" not in body:
+        parts = body.split("|", 7)
+        if len(parts) < 8:
+            return None
+        data = _split_extension(parts[7])
+    else:
+        parts = []
+        position = 0
+        for _ in range(7):
+            match = _CEF_HEADER_FIELD.match(body, position)
+            if not match:
+                return None
+            parts.append(_unescape(match.group(1)))
+            position = match.end()
+        data = {key: _unescape(value) for key, value in _CEF_EXTENSION.findall(body, position)}
+
+    if not parts[0].isdigit():
+        return None
+    _to_int(data, CEF_INT_KEYS)
+    # cs1Label=Rule cs1=allow-web -> rule=allow-web (так Palo Alto кладет правило и threat id)
+    for value_key, label_key in CEF_LABELED_KEYS:
+        label = data.get(label_key)
+        if label is not None and value_key in data:
+            data.setdefault(label.replace(" ", "").lower(), data[value_key])
+    if "out" in data:
+        data.setdefault("bytes", data["out"])
+
+    data["cef_version"] = parts[0]
+    data["device_vendor"] = parts[1]
+    data["device_product"] = parts[2]
+    data["device_version"] = parts[3]
+    data["signature_id"] = parts[4]
+    data["name"] = parts[5]
+    data.setdefault("severity", parts[6])
+    if start:
+        # Перед CEF обычно syslog заголовок "<PRI>Mmm dd hh:mm:ss HOST " — последнее слово и есть хост
+        header = line[:start].split()
+        if len(header) > 1 and header[-1][-1:] != ":":
+            data.setdefault("dvchost", header[-1])
+    data["raw_line"] = line
+    return data
+
+
+def parse_leef(line: str) -> Optional[Dict[str, Any]]:
+    """LEEF:1.0|Vendor|Product|Version|EventID|k=v<TAB>k=v; LEEF:2.0 — с полем разделителя"""
+    start = line.find("LEEF:")
+    if start < 0:
+        return None
+    parts = line[start + 5:].split("|", 5)
+    if len(parts) < 6:
+        return None
+    version, vendor, product, device_version, event_id, attributes = parts
+    delimiter = "\t"
+    if version.startswith("2"):
+        # Разделитель — символ или его hex код (x5E / 0x5E / ^)
+        candidate, separator, rest = attributes.partition("|")
+        if separator and len(candidate) <= 4 and "=" not in candidate:
+            attributes = rest
+            if len(candidate) == 1:
+                delimiter = candidate
+            elif candidate:
+                try:
+                    delimiter = chr(int(candidate.lower().lstrip("0").lstrip("x"), 16))
+                except ValueError:
+                    pass
+
+    data: Dict[str, Any] = {}
+    for attribute in attributes.split(delimiter):
+        key, separator, value = attribute.partition("=")
+        if separator:
+            data[key.strip()] = value
+    _to_int(data, LEEF_INT_KEYS)
+    data["leef_version"] = version
+    data["device_vendor"] = vendor
+    data["device_product"] = product
+    data["device_version"] = device_version
+    data["event_id"] = event_id
+    data["raw_line"] = line
+    return data
+
+
+def parse_rfc5424(line: str) -> Optional[Dict[str, Any]]:
+    """<PRI>1 TIMESTAMP HOST APP PROCID MSGID [SD] MSG"""
+    pri, rest = split_pri(line)
+    if pri is None or rest[:2] != "1 ":
+        return None
+    fields = rest.split(" ", 6)
+    if len(fields) < 6:
+        return None
+    remainder = fields[6] if len(fields) == 7 else "-"
+
+    structured_data = None
+    if remainder[:1] == "-":
+        message = remainder[2:]
+    elif remainder[:1] == "[":
+        structured_data = {}
+        position = 0
+        while True:
+            match = _SD_ELEMENT.match(remainder, position)
+            if not match:
+                break
+            structured_data[match.group(1)] = {
+                key: _unescape(value) for key, value in _SD_PARAM.findall(match.group(2))
+            }
+            position = match.end()
+        message = remainder[position:].lstrip(" ")
+    else:
+        message = remainder
+    if message[:1] == "\ufeff":
+        message = message[1:]
+
+    data: Dict[str, Any] = {
+        "message": message,
+        "hostname": None if fields[2] == "-" else fields[2],
+        "app_name": None if fields[3] == "-" else fields[3],
+        "procid": None if fields[4] == "-" else fields[4],
+        "msgid": None if fields[5] == "-" else fields[5],
+        "syslog_timestamp": None if fields[1] == "-" else fields[1],
+    }
+    if structured_data:
+        data["structured_data"] = structured_data
+    _pri_fields(pri, data)
+    data["raw_line"] = line
+    return data
+
+
+def parse_rfc3164(line: str) -> Dict[str, Any]:
+    """
+    <PRI>Mmm dd hh:mm:ss HOST TAG[PID]: MSG — и строки файлов /var/log без PRI.
+    Нестандартные варианты (ISO время, нет хоста, нет тега) разбираются по мере сил, строка не теряется.
+    """
+    pri, rest = split_pri(line)
+    timestamp = None
+    if len(rest) > 16 and rest[3] == " " and rest[6] == " " and rest[9] == ":" and rest[12] == ":" and rest[:3] in MONTHS:
+        timestamp = rest[:15]
+        rest = rest[16:]
+    elif rest[:1].isdigit():
+        match = _ISO_TIMESTAMP.match(rest)
+        if match:
+            timestamp = match.group(1)
+            rest = rest[match.end():]
+
+    # HOSTNAME идет только после TIMESTAMP; без времени вся строка — сообщение
+    hostname = None
+    body = rest
+    if timestamp is not None:
+        candidate, _, tail = rest.partition(" ")
+        if candidate and not candidate.endswith(":") and "[" not in candidate:
+            # Иначе хоста нет и сразу идет тег (так пишут часть сетевых устройств)
+            hostname = candidate
+            body = tail
+
+    app_name = procid = None
+    colon = body.find(": ")
+    if 0 < colon <= 64 and " " not in body[:colon]:
+        tag = body[:colon]
+        if tag[-1:] == "]" and "[" in tag:
+            app_name, _, procid = tag[:-1].partition("[")
+        else:
+            app_name = tag
+
+    data: Dict[str, Any] = {
+        "message": body,
+        "hostname": hostname,
+        "app_name": app_name,
+        "procid": procid,
+        "syslog_timestamp": timestamp,
+    }
+    _pri_fields(pri, data)
+    data["raw_line"] = line
+    return data
+
+
+def parse_line(line: str) -> Tuple[str, Dict[str, Any]]:
+    """Сырая строка -> (тип лога, raw_data): формат определяется по содержимому"""
+    line = line.rstrip("\r\n")
+    if line[:1] == "{":
+        # JSON строка (cowrie пишет json лог в файл)
+        try:
+            data = json.loads(line)
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            eventid = data.get("eventid")
+            return ("cowrie_ssh" if isinstance(eventid, str) and eventid.startswith("cowrie.") else "generic"), data
+    if "CEF:" in line:
+        data = parse_cef(line)
+        if data is not None:
+            vendor = data["device_vendor"].lower()
+            return ("palo_alto_firewall" if vendor.startswith("palo alto") else "cef"), data
+    if "LEEF:" in line:
+        data = parse_leef(line)
+        if data is not None:
+            return "leef", data
+    data = parse_rfc5424(line)
+    if data is not None:
+        return "generic_syslog", data
+    return "generic_syslog", parse_rfc3164(line)
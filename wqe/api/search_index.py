@@ -0,0 +1,335 @@
+"""
+Полнотекстовый поиск по горячим логам: инвертированный индекс в Redis.
+
+На приеме текст лога (msg / исходная строка и строковые поля raw_data) режется на токены:
+слова в нижнем регистре вместе с символами идентификаторов, так что xe-0/0/1, 10.0.0.1 и
+user@host остаются одним токеном; у токенов с : = @ дополнительно индексируются части.
+Чистые числа и время (pid, счетчики, 10:00:00) не индексируются — они раздували бы словарь.
+
+Постинги разбиты по часам: idx:{час}:{токен} — sorted set log:{id} -> время приема (по нему
+лог живет в Redis, поэтому и срок постингов), idx:{час}:terms — словарь токенов часа для префиксов. Ключи
+получают EXPIREAT на конец часа + HOT_LOGS_HOURS и уходят вместе с горячим слоем логов.
+
+Запрос: слова через пробел — AND, OR между группами, "фраза в кавычках", слово* — префикс
+(в том числе последнее слово фразы). Слова запроса нормализуются так же, как текст; числа
+и время ищутся только вместе с индексируемым словом (проверкой по тексту найденных логов). Поиск идет по часам от новых к старым: в каждом часе
+ZUNIONSTORE/ZINTERSTORE во временные ключи и ZREVRANGEBYSCORE по границам периода — все
+одним pipeline на час, пока не набрано limit логов; часы без постингов отсеиваются заранее. Фразы проверяются по тексту найденных логов.
+"""
+import json
+import os
+import re
+import uuid
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+SEARCH_INDEX_ENABLED = os.getenv("SEARCH_INDEX_ENABLED", "true").lower() == "true"
+INDEX_BUCKET_SECONDS = 3600
+# Сколько токенов словаря подставлять вместо одного префикса
+INDEX_PREFIX_EXPANSION = int(os.getenv("INDEX_PREFIX_EXPANSION", 100))
+INDEX_KEY_PREFIX = "idx:"
+
+_TOKEN = re.compile(r"[\w][\w./:@=-]*")
+_PARTS = re.compile(r"[:=@]+")
+# Числа, время и ISO даты — не ищутся по смыслу и дают по ключу на значение
+_SKIP = re.compile(r"^(?:[\d:]+|\d{4}-\d\d-\d\d\S*)$")
+_QUERY = re.compile(r'"([^"]*)"|(\S+)')
+MIN_TOKEN, MAX_TOKEN = 2, 64
+
+
+def _indexable(token: str) -> bool:
+    return MIN_TOKEN <= len(token) <= MAX_TOKEN and not _SKIP.match(token)
+
+
+def _words(text: str) -> List[str]:
+    """Слова текста по тем же правилам, что и при индексации (без разбиения на части)"""
+    return [word for word in (token.rstrip(".:-=@/") for token in _TOKEN.findall(text.lower())) if word]
+
+
+def tokenize(text: str) -> Set[str]:
+    tokens = set()
+    for token in _words(text):
+        if _indexable(token):
+            tokens.add(token)
+            if _PARTS.search(token):
+                for part in _PARTS.split(token):
+                    if _indexable(part):
+                        tokens.add(part)
+    return tokens
+
+
+def document_texts(raw_data: Any) -> List[str]:
+    """Строковые значения raw_data, которые индексируются вместе с текстом лога"""
+    if isinstance(raw_data, dict):
+        return [str(value) for value in raw_data.values() if isinstance(value, (str, int, float)) and value != ""]
+    return [str(raw_data)] if raw_data not in (None, "") else []
+
+
+def parse_query(query: str) -> List[List[Tuple[str, str]]]:
+    """
+    Запрос -> OR-группы из AND-условий; условие — (вид, значение): term, prefix, phrase или
+    verify (слово, которого нет в индексе — число, время: проверяется только по тексту лога).
+    Слова нормализуются как при индексации: 'down,' -> down, 'ssh:' -> ssh.
+    'bgp down OR "link xe-0/0/1" ssh*' -> [[term bgp, term down], [phrase link xe-0/0/1, prefix ssh]]
+    """
+    groups: List[List[Tuple[str, str]]] = [[]]
+    for phrase, word in _QUERY.findall(query):
+        if word == "OR":
+            if groups[-1]:
+                groups.append([])
+            continue
+        if word == "AND":
+            continue
+        if phrase:
+            if phrase.strip():
+                groups[-1].append(("phrase", phrase.strip().lower()))
+            continue
+        prefix = word.endswith("*")
+        words = _words(word.rstrip("*"))
+        for index, value in enumerate(words):
+            if prefix and index == len(words) - 1:
+                groups[-1].append(("prefix", value))
+            else:
+                groups[-1].append(("term" if _indexable(value) else "verify", value))
+    return [group for group in groups if group]
+
+
+def _searchable(group: List[Tuple[str, str]]) -> bool:
+    """Есть ли в группе условие, по которому индекс дает кандидатов"""
+    for kind, value in group:
+        if kind in ("term", "prefix"):
+            return True
+        if kind == "phrase":
+            tokens, last_prefix = _phrase_tokens(value)
+            if tokens or last_prefix:
+                return True
+    return False
+
+
+def _phrase_tokens(phrase: str) -> Tuple[List[str], Optional[str]]:
+    """Токены фразы для пересечения и префикс ее последнего слова (фраза на * )"""
+    prefix = None
+    if phrase.endswith("*"):
+        phrase, _, last = phrase[:-1].rpartition(" ")
+        words = _words(last)
+        prefix = words[-1] if words else None
+    return sorted(tokenize(phrase)), prefix
+
+
+def _phrase_pattern(phrase: str) -> "re.Pattern":
+    """Слова фразы подряд (через любые пробелы) целиком; у фразы на * последнее слово — префикс"""
+    body = r"\s+".join(re.escape(word) for word in phrase.rstrip("*").split())
+    return re.compile(rf"(?<!\w){body}" if phrase.endswith("*") else rf"(?<!\w){body}(?!\w)")
+
+
+class SearchIndex:
+    """Постинги пачки копятся в памяти и пишутся тем же Redis pipeline, что и логи"""
+
+    def __init__(self, redis_client, retention_hours: float, bucket_seconds: int = INDEX_BUCKET_SECONDS):
+        self.redis_client = redis_client
+        self.retention_seconds = int(retention_hours * 3600)
+        self.bucket_seconds = bucket_seconds
+        self._pending: Dict[str, Dict[str, float]] = {}
+        # Ключи, которым уже выставлен EXPIREAT (срок фиксирован часом, повторять не нужно)
+        self._expiring: Set[str] = set()
+        self._expiring_bucket = 0
+        self.counters = {"indexed_logs": 0, "postings": 0, "queries": 0}
+
+    def _bucket(self, score: float) -> int:
+        return int(score // self.bucket_seconds) * self.bucket_seconds
+
+    def add(self, log_key: str, texts: List[str], score: float):
+        bucket = self._bucket(score)
+        prefix = f"{INDEX_KEY_PREFIX}{bucket}:"
+        tokens: Set[str] = set()
+        for text in texts:
+            tokens |= tokenize(text)
+        pending = self._pending
+        for token in tokens:
+            key = prefix + token
+            postings = pending.get(key)
+            if postings is None:
+                postings = pending[key] = {}
+            postings[log_key] = score
+        self.counters["indexed_logs"] += 1
+        self.counters["postings"] += len(tokens)
+
+    def flush(self, pipeline):
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        terms: Dict[str, Dict[str, int]] = {}
+        for key, postings in pending.items():
+            pipeline.zadd(key, postings)
+            _, bucket, token = key.split(":", 2)
+            terms.setdefault(bucket, {})[token] = 0
+            self._expire(pipeline, key, int(bucket))
+        for bucket, tokens in terms.items():
+            terms_key = f"{INDEX_KEY_PREFIX}{bucket}:terms"
+            pipeline.zadd(terms_key, tokens)
+            self._expire(pipeline, terms_key, int(bucket))
+
+    def _expire(self, pipeline, key: str, bucket: int):
+        if bucket > self._expiring_bucket:
+            self._expiring_bucket = bucket
+            self._expiring.clear()
+        if key in self._expiring:
+            return
+        self._expiring.add(key)
+        pipeline.expireat(key, bucket + self.bucket_seconds + self.retention_seconds)
+
+    def search(
+        self,
+        query: str,
+        min_score: float,
+        max_score: float,
+        limit: int = 100,
+        accept=None
+    ) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+        """
+        Логи (hash из Redis), подходящие под запрос, от новых к старым.
+        accept(hash) -> bool — дополнительные фильтры; возвращает также статистику выполнения
+        """
+        self.counters["queries"] += 1
+        groups = parse_query(query)
+        for group in groups:
+            if not _searchable(group):
+                words = " ".join(value for _, value in group)
+                raise ValueError(
+                    f"'{words}': numbers, times and one-letter words are not indexed - "
+                    f"add a word to search by, e.g. \"port 22\""
+                )
+        # Фразы и неиндексируемые слова индекс не проверяет — такие результаты сверяются с текстом
+        verify = any(kind in ("phrase", "verify") for group in groups for kind, _ in group)
+        fetch = min(limit * (10 if verify or accept is not None else 1), 10000)
+        results: List[Dict[str, str]] = []
+        seen: Set[str] = set()
+        buckets_scanned = candidates_total = 0
+        buckets = self._indexed_buckets(min_score, max_score) if groups else []
+        for bucket in buckets:
+            if len(results) >= limit:
+                break
+            buckets_scanned += 1
+            candidates = self._bucket_candidates(groups, bucket, min_score, max_score, fetch)
+            candidates = [key for key in candidates if key not in seen]
+            if not candidates:
+                continue
+            candidates_total += len(candidates)
+            pipeline = self.redis_client.pipeline(transaction=False)
+            for key in candidates:
+                pipeline.hgetall(key)
+            for key, data in zip(candidates, pipeline.execute()):
+                seen.add(key)
+                if not data:
+                    continue
+                if verify and not self._verify(data, groups):
+                    continue
+                if accept is not None and not accept(data):
+                    continue
+                results.append(data)
+                if len(results) >= limit:
+                    break
+        return results, {"buckets_scanned": buckets_scanned, "candidates": candidates_total}
+
+    def _indexed_buckets(self, min_score: float, max_score: float) -> List[int]:
+        """Часы периода, в которых есть постинги (от новых к старым) — пустые не сканируются"""
+        buckets = list(range(self._bucket(max_score), self._bucket(min_score) - 1, -self.bucket_seconds))
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for bucket in buckets:
+            pipeline.exists(f"{INDEX_KEY_PREFIX}{bucket}:terms")
+        return [bucket for bucket, exists in zip(buckets, pipeline.execute()) if exists]
+
+    def _bucket_candidates(self, groups, bucket: int, min_score: float, max_score: float, limit: int) -> List[str]:
+        """Ключи логов одного часа: OR групп, в группе — AND условий (во временных ключах Redis)"""
+        prefix = f"{INDEX_KEY_PREFIX}{bucket}:"
+        expansions = self._expand_prefixes(groups, prefix)
+        temporary = f"{INDEX_KEY_PREFIX}tmp:{uuid.uuid4().hex}"
+        pipeline = self.redis_client.pipeline(transaction=False)
+        group_keys = []
+        for group_index, group in enumerate(groups):
+            keys, empty = [], False
+            for clause_index, (kind, value) in enumerate(group):
+                if kind == "term":
+                    keys.append(prefix + value)
+                elif kind == "phrase":
+                    tokens, last_prefix = _phrase_tokens(value)
+                    keys.extend(prefix + token for token in tokens)
+                    if last_prefix:
+                        expanded = expansions.get(last_prefix, [])
+                        if not expanded:
+                            empty = True
+                            break
+                        union_key = f"{temporary}:{group_index}:{clause_index}"
+                        pipeline.zunionstore(union_key, [prefix + token for token in expanded], aggregate="MAX")
+                        keys.append(union_key)
+                elif kind == "prefix":
+                    expanded = expansions.get(value, [])
+                    if not expanded:
+                        empty = True
+                        break
+                    union_key = f"{temporary}:{group_index}:{clause_index}"
+                    pipeline.zunionstore(union_key, [prefix + token for token in expanded], aggregate="MAX")
+                    keys.append(union_key)
+            if empty or not keys:
+                continue
+            group_key = f"{temporary}:{group_index}"
+            pipeline.zinterstore(group_key, keys, aggregate="MAX")
+            group_keys.append(group_key)
+        if not group_keys:
+            return []
+        pipeline.zunionstore(temporary, group_keys, aggregate="MAX")
+        pipeline.zrevrangebyscore(temporary, max_score, min_score, start=0, num=limit)
+        temporary_keys = [temporary] + group_keys + [
+            f"{temporary}:{group_index}:{clause_index}"
+            for group_index, group in enumerate(groups) for clause_index in range(len(group))
+        ]
+        pipeline.delete(*temporary_keys)
+        return pipeline.execute()[-2]
+
+    def _expand_prefixes(self, groups, prefix: str) -> Dict[str, List[str]]:
+        """Префикс -> токены словаря часа (ZRANGEBYLEX), одним pipeline на все префиксы запроса"""
+        prefixes = []
+        for group in groups:
+            for kind, value in group:
+                if kind == "prefix":
+                    prefixes.append(value)
+                elif kind == "phrase":
+                    last_prefix = _phrase_tokens(value)[1]
+                    if last_prefix:
+                        prefixes.append(last_prefix)
+        if not prefixes:
+            return {}
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for value in prefixes:
+            pipeline.zrangebylex(prefix + "terms", f"[{value}", f"[{value}\xff", start=0, num=INDEX_PREFIX_EXPANSION)
+        return dict(zip(prefixes, pipeline.execute()))
+
+    @staticmethod
+    def _verify(data: Dict[str, str], groups: List[List[Tuple[str, str]]]) -> bool:
+        """Хотя бы одна группа запроса выполняется по тексту лога (raw_data из hash)"""
+        try:
+            raw_data = json.loads(data.get('raw_data') or '""')
+        except ValueError:
+            raw_data = data.get('raw_data')
+        text = "\n".join(document_texts(raw_data)).lower()
+        tokens = tokenize(text)
+        for group in groups:
+            for kind, value in group:
+                if kind == "term" and value not in tokens:
+                    break
+                if kind == "prefix" and not any(token.startswith(value) for token in tokens):
+                    break
+                if kind == "phrase" and not _phrase_pattern(value).search(text):
+                    break
+                if kind == "verify" and not re.search(rf"(?<!\w){re.escape(value)}(?!\w)", text):
+                    break
+            else:
+                return True
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "bucket_seconds": self.bucket_seconds,
+            "retention_hours": self.retention_seconds / 3600,
+            "pending_keys": len(self._pending),
+            **self.counters
+        }
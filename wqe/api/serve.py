@@ -0,0 +1,136 @@
+"""
+Запуск API в несколько процессов с общей памятью модели.
+
+uvicorn --workers запускает воркеров через spawn: каждый заново импортирует main.py
+и держит свою копию весов BERT. Здесь мастер один раз импортирует приложение и загружает
+веса (из safetensors снапшота — это mmap страницы файла), затем fork-ает воркеров:
+страницы весов и импортированных модулей общие (copy-on-write), воркер готов сразу.
+
+    python serve.py --workers 4 --port 8000
+
+В мастере нет прогона инференса и цикла событий: пул потоков OpenMP/torch и asyncio
+создаются уже в воркерах после fork. Упавший воркер мастер перезапускает.
+
+Метрики у каждого воркера свои; при нескольких воркерах они пишут срезы в общий
+каталог, и /metrics любого воркера отдает сумму по всем (см. MetricsRegistry).
+"""
+import argparse
+import gc
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", 8000))
+API_WORKERS = int(os.getenv("API_WORKERS", 1))
+
+
+def _bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(app, sock: socket.socket, threads: int, metrics_registry, shard_dir):
+    import uvicorn
+
+    if shard_dir:
+        metrics_registry.share(shard_dir)
+
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    config = uvicorn.Config(app, log_level="info")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Security Log API: preload + fork workers")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    parser.add_argument("--workers", type=int, default=API_WORKERS)
+    parser.add_argument(
+        "--threads", type=int, default=int(os.getenv("TORCH_NUM_THREADS", 0)),
+        help="потоков torch на воркер (по умолчанию ядра делятся поровну между воркерами)"
+    )
+    args = parser.parse_args()
+    threads = args.threads or max(1, (os.cpu_count() or 1) // args.workers)
+
+    # Прогрев (прогон инференса) делает каждый воркер на старте приложения, после fork
+    started = time.perf_counter()
+    import main as api
+    api.bert_model.load()
+    # Объекты, созданные до fork, больше не трогает сборщик мусора — иначе он пишет
+    # в их заголовки и страницы копируются в каждый воркер
+    gc.collect()
+    gc.freeze()
+    print(f"Preloaded app in {time.perf_counter() - started:.1f}s, starting {args.workers} workers")
+
+    sock = _bind(args.host, args.port)
+    shard_dir = tempfile.mkdtemp(prefix="wqe-metrics-") if args.workers > 1 else None
+    workers = {}
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _run_worker(api.app, sock, threads, api.metrics_registry, shard_dir)
+            finally:
+                os._exit(0)
+        workers[pid] = time.monotonic()
+        print(f"Worker {pid} started")
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(args.workers):
+        spawn()
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        started_at = workers.pop(pid, None)
+        if shard_dir:
+            # Срез завершившегося воркера остается в сумме счетчиков, но под другим
+            # именем: новый воркер может получить тот же pid
+            try:
+                os.replace(os.path.join(shard_dir, f"{pid}.json"), os.path.join(shard_dir, f"exited-{pid}-{time.time_ns()}.json"))
+            except FileNotFoundError:
+                pass
+        if started_at is None or stopping:
+            continue
+        print(f"Worker {pid} exited with status {status}, restarting")
+        # Воркер падает сразу после старта — не перезапускаем его в цикле без паузы
+        if time.monotonic() - started_at < 1:
+            time.sleep(1)
+        spawn()
+    sock.close()
+    if shard_dir:
+        shutil.rmtree(shard_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
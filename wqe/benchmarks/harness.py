@@ -0,0 +1,138 @@
+"""
+Запуск API в процессе бенчмарка без внешних сервисов.
+
+BERT заменяется stub-моделью с настраиваемой задержкой forward (без скачивания весов),
+Redis — fakeredis с общим сервером на все клиенты, Elasticsearch — заглушкой, которая
+принимает bulk. Это делает прогоны воспроизводимыми на любой машине; для цифр
+«как в проде» используйте load_test --url против поднятого docker-compose.
+"""
+import os
+import socket
+import sys
+import threading
+import time
+import zlib
+from typing import Any, Dict
+
+API_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api")
+NUM_LABELS = 59
+
+
+class NullBulkClient:
+    """Принимает bulk и ничего не пишет — долгосрочное хранилище вне замера"""
+
+    async def bulk(self, operations: str = None, **kwargs) -> Dict[str, Any]:
+        return {"errors": False, "items": []}
+
+    async def ping(self) -> bool:
+        return True
+
+
+def install_stub_bert(forward_ms: float = 0.0):
+    """Подменяет from_pretrained у BERT на stub: детерминированные logits по токенам, без весов"""
+    import torch
+    import transformers
+
+    class StubTokenizer:
+        def __call__(self, text, return_tensors="pt", truncation=True, padding=True, max_length=512):
+            ids = [zlib.crc32(token.encode()) % 30000 for token in str(text).split()][:max_length] or [0]
+            return {"input_ids": torch.tensor([ids])}
+
+    class StubOutput:
+        def __init__(self, logits):
+            self.logits = logits
+
+    class StubModel:
+        config = type("Config", (), {"num_labels": NUM_LABELS})()
+
+        def __call__(self, input_ids=None, **kwargs):
+            if forward_ms:
+                time.sleep(forward_ms / 1000)
+            logits = torch.zeros((1, NUM_LABELS))
+            logits[0, int(input_ids.sum()) % NUM_LABELS] = 5.0
+            return StubOutput(logits)
+
+        def eval(self):
+            return self
+
+        def requires_grad_(self, requires_grad=True):
+            return self
+
+    transformers.BertTokenizer.from_pretrained = classmethod(lambda cls, *a, **kw: StubTokenizer())
+    transformers.BertForSequenceClassification.from_pretrained = classmethod(lambda cls, *a, **kw: StubModel())
+
+
+def install_fakeredis():
+    """Все redis.Redis / redis.asyncio.Redis процесса смотрят в один fakeredis сервер"""
+    import fakeredis
+    import redis
+    import redis.asyncio
+
+    server = fakeredis.FakeServer()
+
+    def sync_client(*args, **kwargs):
+        kwargs.pop("host", None)
+        kwargs.pop("port", None)
+        return fakeredis.FakeRedis(server=server, **kwargs)
+
+    def async_client(*args, **kwargs):
+        kwargs.pop("host", None)
+        kwargs.pop("port", None)
+        return fakeredis.aioredis.FakeRedis(server=server, **kwargs)
+
+    redis.Redis = sync_client
+    redis.asyncio.Redis = async_client
+    return server
+
+
+def load_api(forward_ms: float = 0.0, use_fakeredis: bool = True):
+    """Импорт api/main.py со stub-моделью (и fakeredis); возвращает модуль"""
+    install_stub_bert(forward_ms)
+    if use_fakeredis:
+        install_fakeredis()
+    if API_DIR not in sys.path:
+        sys.path.insert(0, API_DIR)
+
+    import main
+
+    async def no_templates():
+        return None
+
+    main.ensure_index_templates = no_templates
+    main.bulk_writer.client = NullBulkClient()
+    return main
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class InProcessServer:
+    """uvicorn с приложением API в фоновом потоке (свой event loop)"""
+
+    def __init__(self, app, port: int = None):
+        import uvicorn
+
+        self.port = port or free_port()
+        config = uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning", lifespan="on")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        self.thread.start()
+        deadline = time.monotonic() + 30
+        while not self.server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("API не запустился за 30 секунд")
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
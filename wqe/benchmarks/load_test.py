@@ -0,0 +1,235 @@
+"""
+Нагрузочный тест API: ingest, stats, search, anomalies.
+
+Против поднятого стенда:
+    python -m benchmarks.load_test --url http://localhost:8000 --rate 200 --duration 30
+В процессе (stub BERT + fakeredis, без docker):
+    python -m benchmarks.load_test --in-process --forward-ms 15 --requests 2000
+
+--rate > 0 — открытая модель нагрузки: запросы уходят по расписанию, латентность считается
+от запланированного момента отправки (без coordinated omission). --rate 0 — закрытая модель,
+concurrency воркеров шлют запросы подряд. Результат — JSON в benchmarks/results/.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import subprocess
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from .generators import EventGenerator
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+STAGE_METRIC = "wqe_ingest_stage_seconds"
+_METRIC_LINE = re.compile(r'^(\w+)\{([^}]*)\} ([0-9.eE+-]+|NaN)$')
+
+
+def build_scenarios(generator: EventGenerator) -> Dict[str, Callable[[], Tuple[str, str, Optional[Dict]]]]:
+    """Сценарий -> функция, возвращающая (метод, путь, тело)"""
+    return {
+        "ingest": lambda: ("POST", "/api/v1/logs", generator.event()),
+        "stats": lambda: ("GET", "/api/v1/stats", None),
+        "search": lambda: ("GET", "/api/v1/logs/search?time_range=1h&limit=100", None),
+        "anomalies": lambda: ("GET", "/api/v1/anomalies/search?time_range=24h&limit=50", None),
+    }
+
+
+def percentiles(latencies: List[float]) -> Dict[str, float]:
+    if not latencies:
+        return {}
+    ordered = sorted(latencies)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+    return {
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": round(ordered[-1] * 1000, 3),
+        "mean": round(sum(ordered) / len(ordered) * 1000, 3)
+    }
+
+
+async def run_scenario(
+    session: aiohttp.ClientSession,
+    url: str,
+    request_factory: Callable,
+    requests: int,
+    duration: float,
+    rate: float,
+    concurrency: int
+) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    sent = 0
+    started = time.perf_counter()
+    deadline = started + duration if duration else None
+
+    async def worker():
+        nonlocal sent
+        while True:
+            if requests and sent >= requests:
+                return
+            if deadline and time.perf_counter() >= deadline:
+                return
+            index = sent
+            sent += 1
+
+            scheduled = time.perf_counter()
+            if rate:
+                scheduled = started + index / rate
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            method, path, body = request_factory()
+            try:
+                async with session.request(method, url + path, json=body) as response:
+                    await response.read()
+                    if response.status >= 400:
+                        errors[str(response.status)] = errors.get(str(response.status), 0) + 1
+                        continue
+            except Exception as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                continue
+            latencies.append(time.perf_counter() - scheduled)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": sent,
+        "ok": len(latencies),
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": percentiles(latencies)
+    }
+
+
+async def scrape_stage_metrics(session: aiohttp.ClientSession, url: str) -> Dict[str, Dict[str, float]]:
+    """Сумма и число наблюдений по стадиям ingest из /metrics"""
+    try:
+        async with session.get(f"{url}/metrics") as response:
+            text = await response.text()
+    except Exception:
+        return {}
+
+    stages: Dict[str, Dict[str, float]] = {}
+    for line in text.splitlines():
+        match = _METRIC_LINE.match(line)
+        if not match:
+            continue
+        name, labels, value = match.groups()
+        if name not in (f"{STAGE_METRIC}_sum", f"{STAGE_METRIC}_count"):
+            continue
+        stage = dict(re.findall(r'(\w+)="([^"]*)"', labels)).get("stage")
+        field = "sum" if name.endswith("_sum") else "count"
+        stages.setdefault(stage, {"sum": 0.0, "count": 0.0})[field] = float(value)
+    return stages
+
+
+def stage_breakdown(before: Dict, after: Dict) -> Dict[str, Dict[str, float]]:
+    """Средняя длительность стадии за прогон (разница снимков /metrics)"""
+    breakdown = {}
+    for stage, values in after.items():
+        count = values["count"] - before.get(stage, {}).get("count", 0)
+        total = values["sum"] - before.get(stage, {}).get("sum", 0)
+        if count > 0:
+            breakdown[stage] = {"count": int(count), "mean_ms": round(total / count * 1000, 3)}
+    return breakdown
+
+
+async def run(args, url: str) -> Dict[str, Any]:
+    generator = EventGenerator(seed=args.seed)
+    scenarios = build_scenarios(generator)
+    results = {}
+
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        # Прогрев: наполняем хранилище, чтобы stats/search работали не по пустой базе
+        if args.warmup:
+            await run_scenario(session, url, scenarios["ingest"], args.warmup, 0, 0, args.concurrency)
+
+        for name in args.scenarios:
+            before = await scrape_stage_metrics(session, url)
+            result = await run_scenario(
+                session, url, scenarios[name], args.requests, args.duration, args.rate, args.concurrency
+            )
+            if name == "ingest":
+                result["stages"] = stage_breakdown(before, await scrape_stage_metrics(session, url))
+            results[name] = result
+            print(f"{name:10s} {result['throughput_rps']:>9.1f} req/s  "
+                  f"p50={result['latency_ms'].get('p50')}ms p99={result['latency_ms'].get('p99')}ms  "
+                  f"errors={sum(result['errors'].values())}")
+    return results
+
+
+def run_metadata(args) -> Dict[str, Any]:
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        commit = None
+    return {
+        "timestamp": datetime.utcnow().isoformat(),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "args": vars(args)
+    }
+
+
+def write_results(report: Dict[str, Any], output: Optional[str], prefix: str = "load") -> str:
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{prefix}_{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест Security Log API")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", default="http://localhost:8000", help="Адрес API")
+    target.add_argument("--in-process", action="store_true", help="Поднять API в процессе (stub BERT + fakeredis)")
+    parser.add_argument("--forward-ms", type=float, default=0.0, help="Задержка forward у stub модели (--in-process)")
+    parser.add_argument("--scenarios", default="ingest,stats,search,anomalies")
+    parser.add_argument("--requests", type=int, default=1000, help="Запросов на сценарий (0 — ограничение только по времени)")
+    parser.add_argument("--duration", type=float, default=0.0, help="Длительность сценария, сек (0 — без ограничения)")
+    parser.add_argument("--rate", type=float, default=0.0, help="Целевая частота, запросов/сек (0 — закрытая модель)")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--warmup", type=int, default=500, help="Сколько логов загрузить перед замером")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Файл для JSON с результатами")
+    args = parser.parse_args()
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    if not args.requests and not args.duration:
+        parser.error("нужен --requests или --duration")
+
+    if args.in_process:
+        from .harness import load_api, InProcessServer
+
+        api = load_api(forward_ms=args.forward_ms)
+        with InProcessServer(api.app) as server:
+            results = asyncio.run(run(args, server.url))
+    else:
+        results = asyncio.run(run(args, args.url.rstrip("/")))
+
+    path = write_results({"meta": run_metadata(args), "scenarios": results}, args.output)
+    print(f"Результаты: {path}")
+
+
+if __name__ == "__main__":
+    main()
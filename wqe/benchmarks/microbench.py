@@ -0,0 +1,265 @@
+"""
+Офлайн микробенчмарки горячих функций без сети и внешних сервисов.
+
+    python -m benchmarks.microbench                     # все
+    python -m benchmarks.microbench --only normalizer,detectors --iterations 20000
+
+classify_log_with_bert запускается со stub-моделью (см. harness.py): меряется обвязка
+вокруг модели (токенизация, softmax, argmax, метрики), а --forward-ms добавляет
+фиксированную задержку «модели». Детекторы работают поверх fakeredis, наполненного
+синтетическими логами. Результат — JSON в benchmarks/results/.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+from .generators import EventGenerator
+from .harness import API_DIR
+from .load_test import percentiles, run_metadata, write_results
+
+
+def measure(func: Callable, inputs: List[Any], repeat: int = 1) -> Dict[str, Any]:
+    """Латентность одного вызова и пропускная способность на готовых входных данных"""
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for item in inputs:
+            call_started = time.perf_counter()
+            func(item)
+            latencies.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+    return {
+        "calls": len(latencies),
+        "ops_per_second": round(len(latencies) / elapsed, 1),
+        "latency_ms": percentiles(latencies)
+    }
+
+
+async def measure_async(func: Callable, inputs: List[Any]) -> Dict[str, Any]:
+    latencies = []
+    started = time.perf_counter()
+    for item in inputs:
+        call_started = time.perf_counter()
+        await func(item)
+        latencies.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+    return {
+        "calls": len(latencies),
+        "ops_per_second": round(len(latencies) / elapsed, 1),
+        "latency_ms": percentiles(latencies)
+    }
+
+
+# Нормализация не должна быть узким местом ingest: цель — от 200k событий/с на ядро
+NORMALIZER_TARGET_EPS = 200000
+
+
+def bench_normalizer(events: List[Dict[str, Any]], batch_size: int = 500, repeat: int = 5) -> Dict[str, Any]:
+    if API_DIR not in sys.path:
+        sys.path.insert(0, API_DIR)
+    from normalizer import LogNormalizer
+
+    normalizer = LogNormalizer()
+    now = datetime.utcnow()
+    single = measure(lambda e: normalizer.normalize(e["source"], e["log_type"], e["raw_data"], now), events)
+
+    # Пакетный путь, как в /api/v1/logs/bulk: event_id приходит в теле запроса
+    batches = [events[i:i + batch_size] for i in range(0, len(events), batch_size)]
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for batch in batches:
+            normalizer.normalize_batch(batch)
+        best = min(best, time.perf_counter() - started)
+    events_per_second = round(len(events) / best, 1)
+    return {
+        "single": single,
+        "batch": {
+            "batch_size": batch_size,
+            "events_per_second": events_per_second,
+            "target_events_per_second": NORMALIZER_TARGET_EPS,
+            "meets_target": events_per_second >= NORMALIZER_TARGET_EPS
+        },
+        "log_types": sorted(set(e["log_type"] for e in events))
+    }
+
+
+def bench_raw_parsers(generator: EventGenerator, count: int, batch_size: int = 500) -> Dict[str, Any]:
+    """Разбор сырых строк по форматам и сквозной путь строка -> нормализованный словарь"""
+    if API_DIR not in sys.path:
+        sys.path.insert(0, API_DIR)
+    from normalizer import LogNormalizer
+    from raw_parsers import parse_line
+    from .generators import RAW_FORMATS
+
+    results: Dict[str, Any] = {}
+    for fmt in RAW_FORMATS:
+        lines = [generator.raw_line(fmt) for _ in range(count)]
+        started = time.perf_counter()
+        for line in lines:
+            parse_line(line)
+        elapsed = time.perf_counter() - started
+        size = sum(len(line) for line in lines)
+        results[fmt] = {
+            "lines_per_second": round(count / elapsed, 1),
+            "mb_per_second": round(size / elapsed / 1e6, 2),
+            "mean_line_bytes": round(size / count, 1)
+        }
+
+    # Как приходит из Vector file_logs: тип неизвестен, raw_data — строка
+    normalizer = LogNormalizer()
+    logs = [
+        {"event_id": str(i), "source": "file", "log_type": "raw", "raw_data": generator.raw_line()}
+        for i in range(count)
+    ]
+    started = time.perf_counter()
+    for i in range(0, len(logs), batch_size):
+        normalizer.normalize_batch(logs[i:i + batch_size])
+    results["normalize_batch_mixed"] = {"events_per_second": round(count / (time.perf_counter() - started), 1)}
+    return results
+
+
+# Шаблоны считаются на каждый лог — цель от 100k строк/с на ядро
+TEMPLATES_TARGET_LPS = 100000
+
+
+def bench_templates(generator: EventGenerator, count: int, repeat: int = 3) -> Dict[str, Any]:
+    """TemplateMiner на смеси сырых строк и текстов JSON событий: холодный проход и повторный"""
+    if API_DIR not in sys.path:
+        sys.path.insert(0, API_DIR)
+    from template_miner import TemplateMiner
+
+    texts = [generator.raw_line() for _ in range(count // 2)]
+    texts += [str(generator.event()["raw_data"]) for _ in range(count - len(texts))]
+    generator.random.shuffle(texts)
+
+    miner = TemplateMiner()
+    started = time.perf_counter()
+    miner.add_batch(texts)
+    cold = time.perf_counter() - started
+
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        miner.add_batch(texts)
+        best = min(best, time.perf_counter() - started)
+    lines_per_second = round(len(texts) / best, 1)
+    return {
+        "cold_lines_per_second": round(len(texts) / cold, 1),
+        "lines_per_second": lines_per_second,
+        "target_lines_per_second": TEMPLATES_TARGET_LPS,
+        "meets_target": lines_per_second >= TEMPLATES_TARGET_LPS,
+        **miner.stats()
+    }
+
+
+def bench_classify(events: List[Dict[str, Any]], forward_ms: float) -> Dict[str, Any]:
+    from .harness import load_api
+
+    api = load_api(forward_ms=forward_ms)
+    texts = [api.extract_log_text(e["raw_data"]) for e in events]
+    return {
+        "extract_log_text": measure(api.extract_log_text, [e["raw_data"] for e in events]),
+        "classify_log_with_bert": measure(api.classify_log_with_bert, texts),
+        "forward_ms": forward_ms
+    }
+
+
+def bench_detectors(events: List[Dict[str, Any]], history: int, sample: int) -> Dict[str, Any]:
+    import fakeredis
+
+    if API_DIR not in sys.path:
+        sys.path.insert(0, API_DIR)
+    from normalizer import LogNormalizer
+    from storage.short_term.redis_client import redis_client
+    from detectors.rules.ssh_bruteforce import SSHBruteforceDetector
+    from detectors.rules.traffic_anomalies import TrafficAnomalyDetector
+    from detectors.ml_models.isolation_forest import IsolationForestModel, StreamingFit
+
+    redis_client.client = fakeredis.FakeRedis(decode_responses=True)
+    normalizer = LogNormalizer()
+    now = datetime.utcnow()
+    normalized = [normalizer.normalize(e["source"], e["log_type"], e["raw_data"], now) for e in events]
+
+    # История, по которой правила считают окна (детекторы читают ее из Redis)
+    async def fill_history():
+        for log in normalized[:history]:
+            await redis_client.store_log_short_term({
+                key: json.dumps(value) if isinstance(value, dict) else str(value)
+                for key, value in log.items() if value is not None
+            })
+
+    asyncio.run(fill_history())
+
+    ml_model = IsolationForestModel()
+    fit = StreamingFit(ml_model)
+    fit.partial_fit(normalized)
+    model, scaler, _ = fit.finish()
+    ml_model.active = ("bench", model, scaler)
+
+    checked = normalized[:sample]
+    ssh_logs = [log for log in checked if log["log_type"] == "cowrie_ssh"]
+    traffic_logs = [log for log in checked if log["log_type"] in ("palo_alto_firewall", "fortinet_firewall")]
+    ssh_detector = SSHBruteforceDetector()
+    traffic_detector = TrafficAnomalyDetector()
+
+    async def run_all():
+        return {
+            "ssh_bruteforce": await measure_async(ssh_detector.check_bruteforce, ssh_logs),
+            "traffic_anomalies": await measure_async(traffic_detector.check_traffic, traffic_logs),
+            "isolation_forest": await measure_async(ml_model.detect_anomaly, checked)
+        }
+
+    results = asyncio.run(run_all())
+    results["redis_history_logs"] = min(history, len(normalized))
+    return results
+
+
+BENCHES = ("normalizer", "raw_parsers", "templates", "classify", "detectors")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарки горячих функций")
+    parser.add_argument("--only", default=",".join(BENCHES), help="Какие бенчмарки запускать")
+    parser.add_argument("--iterations", type=int, default=5000, help="Число событий на бенчмарк")
+    parser.add_argument("--history", type=int, default=2000, help="Логов в fakeredis для детекторов")
+    parser.add_argument("--forward-ms", type=float, default=0.0, help="Задержка forward у stub модели")
+    parser.add_argument("--batch-size", type=int, default=500, help="Размер пачки для normalize_batch")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Файл для JSON с результатами")
+    args = parser.parse_args()
+
+    events = list(EventGenerator(seed=args.seed).stream(args.iterations))
+    selected = [name.strip() for name in args.only.split(",") if name.strip()]
+    results: Dict[str, Any] = {}
+
+    for name in selected:
+        try:
+            if name == "normalizer":
+                results[name] = bench_normalizer(events, args.batch_size)
+            elif name == "raw_parsers":
+                results[name] = bench_raw_parsers(EventGenerator(seed=args.seed), args.iterations, args.batch_size)
+            elif name == "templates":
+                results[name] = bench_templates(EventGenerator(seed=args.seed), args.iterations)
+            elif name == "classify":
+                results[name] = bench_classify(events, args.forward_ms)
+            elif name == "detectors":
+                # Детекторы медленные (читают окно из Redis на каждый лог) — хватит меньшей выборки
+                results[name] = bench_detectors(events, args.history, max(200, args.iterations // 10))
+            else:
+                parser.error(f"неизвестный бенчмарк: {name}")
+        except ImportError as e:
+            # Например, нет torch для classify — остальные бенчмарки все равно полезны
+            results[name] = {"skipped": str(e)}
+        print(f"{name}: {json.dumps(results[name], ensure_ascii=False)}")
+
+    path = write_results({"meta": run_metadata(args), "microbenchmarks": results}, args.output, prefix="micro")
+    print(f"Результаты: {path}")
+
+
+if __name__ == "__main__":
+    main()
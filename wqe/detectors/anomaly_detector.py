@@ -1,5 +1,6 @@
 import asyncio
 import uuid
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from typing import Dict, Any, List
 import numpy as np
@@ -7,6 +8,7 @@ from .ml_models.isolation_forest import IsolationForestModel
 from .rules.ssh_bruteforce import SSHBruteforceDetector
 from .rules.traffic_anomalies import TrafficAnomalyDetector
 from storage.short_term.redis_client import redis_client
+from . import training_job
 
 class AnomalyDetector:
     def __init__(self):
@@ -14,8 +16,11 @@ class AnomalyDetector:
         self.ssh_detector = SSHBruteforceDetector()
         self.traffic_detector = TrafficAnomalyDetector()
         
-        # Загрузка ML модели при инициализации
-        asyncio.create_task(self.ml_model.load_model())
+        # Обучение идет в отдельном процессе, чтобы не блокировать scoring
+        self.training_executor = ProcessPoolExecutor(max_workers=1)
+        
+        # Загрузка ML модели при инициализации и hot-swap новых версий из реестра
+        asyncio.create_task(self.ml_model.watch_registry())
     
     async def check_anomalies(self, log_data: Dict[str, Any]) -> Dict[str, Any]:
         """Проверка лога на аномалии с помощью всех детекторов"""
@@ -85,11 +90,12 @@ class AnomalyDetector:
     
     async def train_models(self):
         """Переобучение ML моделей на исторических данных"""
-        # Получаем исторические данные для обучения
-        historical_data = await redis_client.query_logs(time_range="7d", limit=10000)
+        # Обучаем в отдельном процессе, новая версия публикуется в реестр атомарно
+        loop = asyncio.get_running_loop()
+        version = await loop.run_in_executor(self.training_executor, training_job.run_once, "7d", 10000)
         
-        if len(historical_data) > 1000:
-            await self.ml_model.train(historical_data)
+        if version:
+            await self.ml_model.refresh()
             return True
         return False
 
@@ -3,65 +3,124 @@ import pandas as pd
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
+import asyncio
 import joblib
 import os
+from .model_registry import ModelRegistry
+
+# Порядок признаков, на которых обучена модель — сохраняется вместе с версией
+FEATURE_SCHEMA = ["src_ip_len", "dst_ip_len", "dst_port", "success"]
 
 class IsolationForestModel:
-    def __init__(self):
-        self.model = None
-        self.scaler = StandardScaler()
+    def __init__(self, registry: Optional[ModelRegistry] = None):
+        self.registry = registry or ModelRegistry()
+        # Активная версия: (version, model, scaler). Меняется целиком одной ссылкой,
+        # поэтому scoring всегда видит согласованную пару модель + scaler
+        self.active: Optional[Tuple[str, IsolationForest, StandardScaler]] = None
+        # Старые пути (до реестра версий) — читаем, если реестр пуст
         self.model_path = "/app/models/isolation_forest.joblib"
         self.scaler_path = "/app/models/scaler.joblib"
-    
+        self.poll_interval = int(os.getenv("MODEL_REGISTRY_POLL_SECONDS", 30))
+
+    @property
+    def model(self) -> Optional[IsolationForest]:
+        return self.active[1] if self.active else None
+
+    @property
+    def scaler(self) -> Optional[StandardScaler]:
+        return self.active[2] if self.active else None
+
+    @property
+    def version(self) -> Optional[str]:
+        return self.active[0] if self.active else None
+
     async def load_model(self):
         """Загрузка предобученной модели"""
         try:
-            if os.path.exists(self.model_path):
-                self.model = joblib.load(self.model_path)
-                self.scaler = joblib.load(self.scaler_path)
+            if self.registry.current_version():
+                await self.refresh()
+            elif os.path.exists(self.model_path):
+                model = joblib.load(self.model_path, mmap_mode="r")
+                scaler = joblib.load(self.scaler_path, mmap_mode="r")
+                self.active = ("legacy", model, scaler)
                 print("ML model loaded successfully")
         except Exception as e:
             print(f"Error loading model: {e}")
-            self.model = IsolationForest(contamination=0.1, random_state=42)
-    
+
+    async def refresh(self) -> bool:
+        """Hot-swap на новую версию из реестра, если она появилась"""
+        version = self.registry.current_version()
+        if not version or version == self.version:
+            return False
+
+        # Загрузка с диска — в отдельном потоке, чтобы не блокировать scoring
+        loaded = await asyncio.to_thread(self.registry.load, version)
+        if not loaded:
+            return False
+
+        schema = loaded["manifest"].get("feature_schema")
+        if schema != FEATURE_SCHEMA:
+            print(f"ML model {version} skipped: feature schema mismatch {schema}")
+            return False
+
+        self.active = (version, loaded["model"], loaded["scaler"])
+        print(f"ML model switched to version {version}")
+        return True
+
+    async def watch_registry(self):
+        """Периодически опрашиваем реестр и подхватываем новые версии без рестарта"""
+        await self.load_model()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Error refreshing model: {e}")
+
+    def fit(self, training_data: List[Dict[str, Any]]) -> Tuple[IsolationForest, StandardScaler, Dict[str, Any]]:
+        """Обучение новой пары модель + scaler (текущая активная модель не трогается)"""
+        stream = StreamingFit(self)
+        stream.partial_fit(training_data)
+        return stream.finish()
+
+    def publish(self, model: IsolationForest, scaler: StandardScaler, metrics: Dict[str, Any]) -> str:
+        """Атомарно сохраняем новую версию в реестр"""
+        return self.registry.publish(
+            {"model": model, "scaler": scaler},
+            schema=FEATURE_SCHEMA,
+            metrics=metrics
+        )
+
     async def train(self, training_data: List[Dict[str, Any]]):
         """Обучение модели на исторических данных"""
         try:
-            # Преобразуем в DataFrame и выбираем признаки
-            df = pd.DataFrame(training_data)
-            features = self._extract_features(df)
-            
-            # Масштабируем признаки
-            scaled_features = self.scaler.fit_transform(features)
-            
-            # Обучаем модель
-            self.model.fit(scaled_features)
-            
-            # Сохраняем модель
-            os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
-            joblib.dump(self.model, self.model_path)
-            joblib.dump(self.scaler, self.scaler_path)
-            
-            print("ML model trained and saved successfully")
-            
+            # Обучаем вне event loop, затем публикуем версию и переключаемся на нее
+            model, scaler, metrics = await asyncio.to_thread(self.fit, training_data)
+            version = await asyncio.to_thread(self.publish, model, scaler, metrics)
+            await self.refresh()
+
+            print(f"ML model trained and saved successfully (version {version})")
+
         except Exception as e:
             print(f"Error training model: {e}")
-    
+
     async def detect_anomaly(self, log_data: Dict[str, Any]) -> Dict[str, Any]:
         """Обнаружение аномалии с помощью ML модели"""
-        if self.model is None:
+        active = self.active
+        if active is None:
             return {
                 "is_anomaly": False,
                 "confidence": 0.0,
                 "description": "ML model not ready",
                 "severity": "low"
             }
-        
+
+        _, model, scaler = active
         try:
             # Извлекаем признаки из лога
             features = self._extract_features_single(log_data)
-            
+
             if features is None:
                 return {
                     "is_anomaly": False,
@@ -69,15 +128,15 @@ class IsolationForestModel:
                     "description": "Insufficient features for ML analysis",
                     "severity": "low"
                 }
-            
+
             # Масштабируем и предсказываем
-            scaled_features = self.scaler.transform([features])
-            prediction = self.model.predict(scaled_features)
-            scores = self.model.decision_function(scaled_features)
-            
+            scaled_features = scaler.transform([features])
+            prediction = model.predict(scaled_features)
+            scores = model.decision_function(scaled_features)
+
             is_anomaly = prediction[0] == -1
             confidence = abs(scores[0])  # Чем больше score по модулю, тем увереннее
-            
+
             if is_anomaly:
                 return {
                     "is_anomaly": True,
@@ -86,14 +145,14 @@ class IsolationForestModel:
                     "description": "Anomaly detected by machine learning model",
                     "severity": "medium" if confidence < 0.5 else "high"
                 }
-            
+
             return {
                 "is_anomaly": False,
                 "confidence": 0.0,
                 "description": "No ML anomaly detected",
                 "severity": "low"
             }
-            
+
         except Exception as e:
             print(f"ML detection error: {e}")
             return {
@@ -102,7 +161,15 @@ class IsolationForestModel:
                 "description": f"ML detection error: {str(e)}",
                 "severity": "low"
             }
-    
+
+    def _extract_features_batch(self, logs: List[Dict[str, Any]]) -> np.ndarray:
+        """Извлечение признаков из чанка логов (без DataFrame)"""
+        features = [self._extract_features_single(log) for log in logs]
+        features = [feat for feat in features if feat is not None]
+        if not features:
+            return np.empty((0, len(FEATURE_SCHEMA)), dtype=np.float32)
+        return np.asarray(features, dtype=np.float32)
+
     def _extract_features(self, df: pd.DataFrame) -> np.ndarray:
         """Извлечение признаков из DataFrame"""
         # Здесь должна быть сложная логика извлечения признаков
@@ -112,13 +179,13 @@ class IsolationForestModel:
             feat = self._extract_features_single(row.to_dict())
             if feat is not None:
                 features.append(feat)
-        
+
         return np.array(features)
-    
+
     def _extract_features_single(self, log_data: Dict[str, Any]) -> Optional[np.ndarray]:
         """Извлечение признаков из одиночного лога"""
         try:
-            # Простые числовые признаки (пример)
+            # Простые числовые признаки (пример), порядок — как в FEATURE_SCHEMA
             features = [
                 len(str(log_data.get("src_ip", ""))),
                 len(str(log_data.get("dst_ip", ""))),
@@ -128,4 +195,63 @@ class IsolationForestModel:
             ]
             return np.array(features)
         except:
-            return None
\ No newline at end of file
+            return None
+
+
+class StreamingFit:
+    """
+    Обучение по чанкам с ограниченной памятью: scaler обучается через partial_fit,
+    а для IsolationForest держим равномерную выборку (reservoir sampling) фиксированного размера
+    """
+
+    def __init__(self, ml_model: IsolationForestModel, max_samples: int = 200000, random_state: int = 42):
+        self.ml_model = ml_model
+        self.max_samples = max_samples
+        self.rng = np.random.default_rng(random_state)
+        self.scaler = StandardScaler()
+        self.reservoir = np.empty((max_samples, len(FEATURE_SCHEMA)), dtype=np.float32)
+        self.filled = 0
+        self.seen = 0
+        self.started = datetime.utcnow()
+
+    def partial_fit(self, logs: List[Dict[str, Any]]):
+        """Добавляем очередной чанк логов"""
+        features = self.ml_model._extract_features_batch(logs)
+        if not len(features):
+            return
+
+        self.scaler.partial_fit(features)
+
+        # Сначала просто заполняем выборку
+        free = min(self.max_samples - self.filled, len(features))
+        if free:
+            self.reservoir[self.filled:self.filled + free] = features[:free]
+            self.filled += free
+            self.seen += free
+            features = features[free:]
+
+        # Дальше — Algorithm R: строка i заменяет случайный слот с вероятностью k / (i + 1)
+        if len(features):
+            positions = np.arange(self.seen, self.seen + len(features))
+            slots = self.rng.integers(0, positions + 1)
+            keep = slots < self.max_samples
+            self.reservoir[slots[keep]] = features[keep]
+            self.seen += len(features)
+
+    def finish(self) -> Tuple[IsolationForest, StandardScaler, Dict[str, Any]]:
+        """Обучаем IsolationForest на выборке и возвращаем артефакты + метрики"""
+        if not self.filled:
+            raise ValueError("No features extracted for training")
+
+        sample = self.scaler.transform(self.reservoir[:self.filled])
+        model = IsolationForest(contamination=0.1, random_state=42)
+        model.fit(sample)
+
+        predictions = model.predict(sample)
+        metrics = {
+            "samples": int(self.seen),
+            "sample_size": int(self.filled),
+            "anomaly_ratio": float((predictions == -1).mean()),
+            "train_seconds": (datetime.utcnow() - self.started).total_seconds()
+        }
+        return model, self.scaler, metrics
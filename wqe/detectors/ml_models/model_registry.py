@@ -0,0 +1,119 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+import joblib
+
+
+class ModelRegistry:
+    """
+    Версионированное хранилище ML моделей.
+
+    Каждая версия лежит в отдельной папке (модель, scaler, схема признаков, метрики).
+    Версия сначала целиком пишется во временную папку и только потом переименовывается,
+    а указатель CURRENT меняется через os.replace — читатель никогда не увидит
+    недописанную модель.
+    """
+
+    def __init__(self, root: Optional[str] = None, name: str = "isolation_forest", keep_versions: int = 5):
+        self.root = root or os.getenv("MODEL_REGISTRY_PATH", "/app/models")
+        self.base_path = os.path.join(self.root, name)
+        self.pointer_path = os.path.join(self.base_path, "CURRENT")
+        self.keep_versions = keep_versions
+
+    def publish(self, artifacts: Dict[str, Any], schema: List[str], metrics: Dict[str, Any]) -> str:
+        """Атомарная публикация новой версии модели"""
+        os.makedirs(self.base_path, exist_ok=True)
+        version = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        tmp_dir = tempfile.mkdtemp(prefix=f".tmp-{version}-", dir=self.base_path)
+
+        try:
+            for name, obj in artifacts.items():
+                # Без сжатия — иначе numpy массивы нельзя будет отобразить в память (mmap)
+                joblib.dump(obj, os.path.join(tmp_dir, f"{name}.joblib"))
+
+            manifest = {
+                "version": version,
+                "created_at": datetime.utcnow().isoformat(),
+                "artifacts": sorted(artifacts),
+                "feature_schema": schema,
+                "metrics": metrics
+            }
+            self._write_json(os.path.join(tmp_dir, "manifest.json"), manifest)
+            self._fsync_dir(tmp_dir)
+
+            os.rename(tmp_dir, os.path.join(self.base_path, version))
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        # Переключаем указатель только после того, как версия полностью на диске
+        self._write_pointer(version)
+        self._prune()
+        return version
+
+    def current_version(self) -> Optional[str]:
+        """Текущая опубликованная версия (дешево — читаем маленький файл)"""
+        try:
+            with open(self.pointer_path) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def load(self, version: Optional[str] = None, mmap_mode: Optional[str] = "r") -> Optional[Dict[str, Any]]:
+        """
+        Загрузка версии модели. С mmap_mode='r' массивы numpy отображаются в память,
+        и несколько воркеров делят одни и те же страницы
+        """
+        version = version or self.current_version()
+        if not version:
+            return None
+
+        version_path = os.path.join(self.base_path, version)
+        with open(os.path.join(version_path, "manifest.json")) as f:
+            manifest = json.load(f)
+
+        loaded = {"version": version, "manifest": manifest}
+        for name in manifest["artifacts"]:
+            loaded[name] = joblib.load(os.path.join(version_path, f"{name}.joblib"), mmap_mode=mmap_mode)
+        return loaded
+
+    def list_versions(self) -> List[str]:
+        """Все опубликованные версии, от старых к новым"""
+        if not os.path.isdir(self.base_path):
+            return []
+        return sorted(
+            name for name in os.listdir(self.base_path)
+            if not name.startswith(".") and os.path.isdir(os.path.join(self.base_path, name))
+        )
+
+    def _write_pointer(self, version: str):
+        fd, tmp_path = tempfile.mkstemp(prefix=".CURRENT-", dir=self.base_path)
+        with os.fdopen(fd, "w") as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.pointer_path)
+
+    def _prune(self):
+        """Удаляем старые версии, текущую не трогаем никогда"""
+        current = self.current_version()
+        versions = self.list_versions()
+        for version in versions[:-self.keep_versions]:
+            if version != current:
+                shutil.rmtree(os.path.join(self.base_path, version), ignore_errors=True)
+
+    @staticmethod
+    def _write_json(path: str, data: Dict[str, Any]):
+        with open(path, "w") as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def _fsync_dir(path: str):
+        for name in os.listdir(path):
+            with open(os.path.join(path, name), "rb") as f:
+                os.fsync(f.fileno())
@@ -0,0 +1,93 @@
+"""
+Фоновое переобучение ML модели в отдельном процессе.
+
+Запуск по расписанию:  python -m detectors.training_job --interval 3600
+Однократный запуск:     python -m detectors.training_job --once
+
+Процесс обучает новую версию и атомарно публикует ее в ModelRegistry,
+а сервисы со scoring подхватывают ее сами (IsolationForestModel.watch_registry).
+"""
+import argparse
+import asyncio
+import time
+from typing import Optional
+from .ml_models.isolation_forest import IsolationForestModel, StreamingFit
+from storage.short_term.redis_client import redis_client
+
+MIN_TRAINING_SAMPLES = 1000
+
+# Поля, которые нужны для извлечения признаков — остальное из ES не тянем
+TRAINING_FIELDS = ["src_ip", "dst_ip", "dst_port", "success"]
+
+TIME_RANGE_ES = {"1h": "now-1h", "6h": "now-6h", "24h": "now-24h", "3d": "now-3d", "7d": "now-7d", "30d": "now-30d"}
+
+
+async def _fit_from_elasticsearch(ml_model: IsolationForestModel, time_range: str, page_size: int) -> StreamingFit:
+    """Обучение чанками прямо из потока страниц Elasticsearch"""
+    from storage.long_term.elastic_client import ElasticsearchClient
+
+    es = ElasticsearchClient()
+    stream = StreamingFit(ml_model)
+    query = {"range": {"timestamp": {"gte": TIME_RANGE_ES.get(time_range, "now-7d")}}}
+    try:
+        async for page in es.iter_historical_data(query, page_size=page_size, fields=TRAINING_FIELDS):
+            stream.partial_fit(page)
+    finally:
+        await es.client.close()
+    return stream
+
+
+async def _fit_from_redis(ml_model: IsolationForestModel, time_range: str, limit: int) -> StreamingFit:
+    stream = StreamingFit(ml_model)
+    stream.partial_fit(await redis_client.query_logs(time_range=time_range, limit=limit))
+    return stream
+
+
+def run_once(time_range: str = "7d", limit: int = 10000, source: str = "elasticsearch", page_size: int = 5000) -> Optional[str]:
+    """Один цикл обучения. Возвращает опубликованную версию или None"""
+    ml_model = IsolationForestModel()
+
+    if source == "elasticsearch":
+        try:
+            stream = asyncio.run(_fit_from_elasticsearch(ml_model, time_range, page_size))
+        except Exception as e:
+            # Долгосрочное хранилище недоступно — учимся хотя бы на горячих данных
+            print(f"Elasticsearch unavailable for training, falling back to Redis: {e}")
+            stream = asyncio.run(_fit_from_redis(ml_model, time_range, limit))
+    else:
+        stream = asyncio.run(_fit_from_redis(ml_model, time_range, limit))
+
+    if stream.seen <= MIN_TRAINING_SAMPLES:
+        print(f"Not enough data for training: {stream.seen} logs")
+        return None
+
+    model, scaler, metrics = stream.finish()
+    version = ml_model.publish(model, scaler, metrics)
+
+    print(f"Published ML model version {version}: {metrics}")
+    return version
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Background ML model training job")
+    parser.add_argument("--interval", type=int, default=3600, help="Интервал между обучениями, сек")
+    parser.add_argument("--time-range", default="7d", help="Период исторических данных")
+    parser.add_argument("--limit", type=int, default=10000, help="Максимум логов из Redis")
+    parser.add_argument("--source", choices=["elasticsearch", "redis"], default="elasticsearch", help="Откуда брать данные")
+    parser.add_argument("--page-size", type=int, default=5000, help="Размер страницы при чтении из Elasticsearch")
+    parser.add_argument("--once", action="store_true", help="Обучить один раз и выйти")
+    args = parser.parse_args()
+
+    while True:
+        try:
+            run_once(time_range=args.time_range, limit=args.limit, source=args.source, page_size=args.page_size)
+        except Exception as e:
+            print(f"Training job error: {e}")
+
+        if args.once:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
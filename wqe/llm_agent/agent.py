@@ -3,13 +3,37 @@ import openai
 import aiohttp
 import json
 from datetime import datetime, timedelta
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, AsyncIterator
 import asyncio
+import os
+from cache import TTLCache, normalize_args, cache_key, time_bucket
+
+# Сколько секунд считаем данные API неизменными для кэша результатов функций и ответов
+TOOL_CACHE_TTL = float(os.getenv("AGENT_TOOL_CACHE_TTL", 30))
+COMPLETION_CACHE_TTL = float(os.getenv("AGENT_COMPLETION_CACHE_TTL", 120))
 
 class LLMLogAgent:
-    def __init__(self, api_url: str, openai_api_key: str):
+    def __init__(
+        self,
+        api_url: str,
+        openai_api_key: str,
+        max_connections: int = 20,
+        openai_base_url: Optional[str] = None
+    ):
         self.api_url = api_url
-        self.openai_client = openai.AsyncOpenAI(api_key=openai_api_key)
+        # base_url позволяет направить запросы на локальный stub-сервер LLM
+        self.openai_client = openai.AsyncOpenAI(
+            api_key=openai_api_key,
+            base_url=openai_base_url or os.getenv("OPENAI_BASE_URL")
+        )
+        self.chat_model = "gpt-3.5-turbo"
+        # Кэш результатов функций (имя + нормализованные аргументы + окно данных)
+        # и готовых ответов на одинаковые (история, вопрос)
+        self.tool_cache = TTLCache(max_entries=256, ttl_seconds=TOOL_CACHE_TTL)
+        self.completion_cache = TTLCache(max_entries=512, ttl_seconds=COMPLETION_CACHE_TTL)
+        # Одна долгоживущая сессия с пулом keep-alive соединений на все вызовы API
+        self.max_connections = max_connections
+        self._session: Optional[aiohttp.ClientSession] = None
         self.system_prompt = """Ты - AI ассистент по кибербезопасности. Ты помогаешь анализировать логи, 
         обнаруживать аномалии и предоставлять рекомендации по безопасности. Ты можешь:
         
@@ -22,19 +46,40 @@ class LLMLogAgent:
         Всегда будь точным, профессиональным и предоставляй конкретные рекомендации.
         Если тебе нужны данные из системы, используй доступные функции."""
 
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Ленивое создание общей сессии"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=30)
+            )
+        return self._session
+
+    async def close(self):
+        """Закрытие пула соединений"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
     async def analyze_recent_logs(self, natural_language_query: str) -> str:
         """Анализ логов за последний час с помощью LLM"""
         try:
-            # Получаем логи за последний час
-            async with aiohttp.ClientSession() as session:
-                response = await session.post(
-                    f"{self.api_url}/api/v1/query",
-                    json={"query": "", "time_range": "1h", "limit": 2000}
-                )
-                logs = await response.json()
+            # Получаем сводку по логам за последний час (считается на сервере по всем 2000 логам)
+            session = await self._get_session()
+            async with session.get(
+                f"{self.api_url}/api/v1/logs/summary",
+                params={"time_range": "1h", "limit": 2000}
+            ) as response:
+                summary = await response.json()
             
             # Формируем промпт для LLM
-            prompt = self._build_analysis_prompt(natural_language_query, logs['results'])
+            prompt = self._build_analysis_prompt(natural_language_query, summary)
             
             # Отправляем в LLM
             completion = await self.openai_client.chat.completions.create(
@@ -48,12 +93,14 @@ class LLMLogAgent:
         except Exception as e:
             return f"Error analyzing logs: {str(e)}"
     
-    def _build_analysis_prompt(self, query: str, logs: list) -> str:
+    def _build_analysis_prompt(self, query: str, summary: Dict) -> str:
+        # Компактный JSON без отступов — сводка уже покрывает все логи, обрезать нечего
         return f"""
         Analyze these security logs and answer the question: {query}
         
-        Logs data (JSON format):
-        {json.dumps(logs, indent=2)[:10000]}  # Ограничиваем размер
+        Logs summary (JSON: counts by class/source/type, top message templates with counts,
+        sample messages per anomaly class):
+        {json.dumps(summary, ensure_ascii=False, separators=(",", ":"))}
         
         Provide a structured response with:
         1. Summary of findings
@@ -83,10 +130,14 @@ class LLMLogAgent:
             },
             {
                 "name": "search_logs",
-                "description": "Поиск логов с фильтрацией",
+                "description": "Поиск логов с фильтрацией и полнотекстовым запросом",
                 "parameters": {
                     "type": "object",
                     "properties": {
+                        "q": {
+                            "type": "string",
+                            "description": "Полнотекстовый запрос: слова через пробел — AND, OR, \"фраза\", префикс* (например, xe-0/0/1 down)"
+                        },
                         "time_range": {
                             "type": "string",
                             "description": "Временной диапазон (например, 24h, 7d)"
@@ -126,37 +177,105 @@ class LLMLogAgent:
                         }
                     }
                 }
+            },
+            {
+                "name": "get_top",
+                "description": "Топ значений за период: самые частые источники, IP, пользователи, порты, классы BERT или источники аномалий (ошибок)",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "dimension": {
+                            "type": "string",
+                            "description": "source, src_ip, username, dst_port, bert_class или anomaly_source"
+                        },
+                        "time_range": {
+                            "type": "string",
+                            "description": "Временной диапазон (например, 1h, 24h, 7d)"
+                        },
+                        "limit": {
+                            "type": "integer",
+                            "description": "Сколько значений вернуть"
+                        }
+                    }
+                }
+            },
+            {
+                "name": "search_incidents",
+                "description": "Инциденты — аномалии, сгруппированные по источнику, времени и связанным классам. Начинать анализ лучше с них",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "time_range": {
+                            "type": "string",
+                            "description": "Временной диапазон"
+                        },
+                        "status": {
+                            "type": "string",
+                            "description": "Статус: open, closed, resolved"
+                        }
+                    }
+                }
             }
         ]
 
     async def call_api_function(self, function_name: str, params: Dict) -> Dict:
-        """Вызывает API функцию асинхронно"""
+        """Вызывает API функцию асинхронно (с кэшем)"""
+        # Регистр не меняем: фильтры API (bert_class, severity) регистрозависимы, и
+        # OSPF_NBRDOWN и ospf_nbrdown — разные запросы и разные записи кэша
+        params = normalize_args(params)
+        key = cache_key("tool", function_name, params, time_bucket(TOOL_CACHE_TTL))
+        result, _ = await self.tool_cache.get_or_compute(
+            key,
+            lambda: self._call_api_function(function_name, params),
+            # Ошибки не кэшируем: свои ({"error": ...}) и ответы FastAPI ({"detail": ...})
+            cacheable=lambda value: isinstance(value, dict) and "error" not in value and "detail" not in value
+        )
+        return result
+
+    async def _call_api_function(self, function_name: str, params: Dict) -> Dict:
         try:
-            async with aiohttp.ClientSession() as session:
-                if function_name == "get_logs_stats":
-                    async with session.get(f"{self.api_url}/api/v1/logs/stats") as response:
-                        return await response.json()
-                
-                elif function_name == "get_anomaly_stats":
-                    async with session.get(f"{self.api_url}/api/v1/anomalies/stats") as response:
-                        return await response.json()
-                
-                elif function_name == "search_logs":
-                    async with session.get(f"{self.api_url}/api/v1/logs/search", params=params) as response:
-                        return await response.json()
-                
-                elif function_name == "search_anomalies":
-                    async with session.get(f"{self.api_url}/api/v1/anomalies/search", params=params) as response:
-                        return await response.json()
+            session = await self._get_session()
+            if function_name == "get_logs_stats":
+                async with session.get(f"{self.api_url}/api/v1/logs/stats") as response:
+                    return await response.json()
+            
+            elif function_name == "get_anomaly_stats":
+                async with session.get(f"{self.api_url}/api/v1/anomalies/stats") as response:
+                    return await response.json()
+            
+            elif function_name == "search_logs":
+                async with session.get(f"{self.api_url}/api/v1/logs/search", params=params) as response:
+                    return await response.json()
+            
+            elif function_name == "search_anomalies":
+                async with session.get(f"{self.api_url}/api/v1/anomalies/search", params=params) as response:
+                    return await response.json()
+
+            elif function_name == "get_top":
+                async with session.get(f"{self.api_url}/api/v1/top", params=params) as response:
+                    return await response.json()
+
+            elif function_name == "search_incidents":
+                async with session.get(f"{self.api_url}/api/v1/incidents", params=params) as response:
+                    return await response.json()
+            
+            else:
+                return {"error": f"Unknown function: {function_name}"}
                 
-                else:
-                    return {"error": f"Unknown function: {function_name}"}
-                    
         except Exception as e:
             return {"error": str(e)}
 
     async def chat_with_ai(self, message: str, chat_history: List[Dict] = None) -> Dict:
-        """Общается с ИИ и возвращает ответ с функциями"""
+        """Общается с ИИ и возвращает ответ с функциями (одинаковые вопросы — из кэша)"""
+        key = cache_key("chat", self.chat_model, chat_history or [], message.strip(), time_bucket(COMPLETION_CACHE_TTL))
+        result, cached = await self.completion_cache.get_or_compute(
+            key,
+            lambda: self._chat_with_ai(message, chat_history),
+            cacheable=lambda value: "error" not in value
+        )
+        return {**result, "cached": cached}
+
+    async def _chat_with_ai(self, message: str, chat_history: List[Dict] = None) -> Dict:
         try:
             messages = [
                 {"role": "system", "content": self.system_prompt}
@@ -168,7 +287,7 @@ class LLMLogAgent:
             messages.append({"role": "user", "content": message})
 
             completion = await self.openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
+                model=self.chat_model,
                 messages=messages,
                 functions=self.get_available_functions(),
                 function_call="auto"
@@ -193,7 +312,7 @@ class LLMLogAgent:
                 })
                 
                 final_completion = await self.openai_client.chat.completions.create(
-                    model="gpt-3.5-turbo",
+                    model=self.chat_model,
                     messages=messages
                 )
                 
@@ -217,34 +336,130 @@ class LLMLogAgent:
                 "error": str(e)
             }
 
+    async def chat_with_ai_stream(self, message: str, chat_history: List[Dict] = None) -> AsyncIterator[Dict]:
+        """
+        Потоковый вариант chat_with_ai: события token (кусок ответа), tool_call / tool_result
+        (прогресс вызова функции), done (итог) или error.
+        Если потребитель закрыл генератор (клиент ушел), поток к модели тоже закрывается
+        """
+        key = cache_key("chat", self.chat_model, chat_history or [], message.strip(), time_bucket(COMPLETION_CACHE_TTL))
+        cached = self.completion_cache.lookup(key)
+        if cached is not None:
+            yield {"type": "token", "content": cached["response"]}
+            yield {"type": "done", **cached, "cached": True}
+            return
+
+        messages = [{"role": "system", "content": self.system_prompt}]
+        if chat_history:
+            messages.extend(chat_history)
+        messages.append({"role": "user", "content": message})
+
+        try:
+            function_name = None
+            arguments = []
+            content = []
+
+            async for delta in self._stream_completion(
+                messages,
+                functions=self.get_available_functions(),
+                function_call="auto"
+            ):
+                if delta.function_call:
+                    function_name = delta.function_call.name or function_name
+                    if delta.function_call.arguments:
+                        arguments.append(delta.function_call.arguments)
+                elif delta.content:
+                    content.append(delta.content)
+                    yield {"type": "token", "content": delta.content}
+
+            if function_name:
+                raw_arguments = "".join(arguments) or "{}"
+                function_args = json.loads(raw_arguments)
+                yield {"type": "tool_call", "name": function_name, "args": function_args}
+
+                function_result = await self.call_api_function(function_name, function_args)
+                yield {"type": "tool_result", "name": function_name, "ok": "error" not in function_result}
+
+                messages.append({
+                    "role": "assistant",
+                    "content": None,
+                    "function_call": {"name": function_name, "arguments": raw_arguments}
+                })
+                messages.append({
+                    "role": "function",
+                    "name": function_name,
+                    "content": json.dumps(function_result)
+                })
+
+                content = []
+                async for delta in self._stream_completion(messages):
+                    if delta.content:
+                        content.append(delta.content)
+                        yield {"type": "token", "content": delta.content}
+
+                result = {
+                    "response": "".join(content),
+                    "function_called": function_name,
+                    "function_args": function_args,
+                    "function_result": function_result
+                }
+            else:
+                result = {"response": "".join(content), "function_called": None}
+
+            self.completion_cache.set(key, result)
+            yield {
+                "type": "done",
+                "response": result["response"],
+                "function_called": result["function_called"],
+                "cached": False
+            }
+
+        except Exception as e:
+            yield {"type": "error", "error": str(e)}
+
+    async def _stream_completion(self, messages: List[Dict], **kwargs) -> AsyncIterator[Any]:
+        """Поток delta-сообщений от модели"""
+        stream = await self.openai_client.chat.completions.create(
+            model=self.chat_model,
+            messages=messages,
+            stream=True,
+            **kwargs
+        )
+        try:
+            async for chunk in stream:
+                if chunk.choices:
+                    yield chunk.choices[0].delta
+        finally:
+            # Закрываем HTTP поток к модели — генерация на стороне провайдера прекращается
+            await stream.response.aclose()
+
     async def get_health_status(self) -> Dict:
         """Проверяет статус API"""
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"{self.api_url}/health") as response:
-                    return await response.json()
+            session = await self._get_session()
+            async with session.get(f"{self.api_url}/health") as response:
+                return await response.json()
         except Exception as e:
             return {"status": "error", "message": str(e)}
 
 # Пример использования
 async def main():
-    # Инициализация агента
-    agent = LLMLogAgent(
+    # Инициализация агента (сессия закроется при выходе из блока)
+    async with LLMLogAgent(
         api_url="http://localhost:8000",
         openai_api_key="your-openai-api-key-here"
-    )
-    
-    # Проверка здоровья
-    health = await agent.get_health_status()
-    print("Health status:", health)
-    
-    # Пример чата
-    response = await agent.chat_with_ai("Покажи статистику логов за последние 24 часа")
-    print("AI Response:", response["response"])
-    
-    if response["function_called"]:
-        print("Function called:", response["function_called"])
-        print("Function result:", response["function_result"])
+    ) as agent:
+        # Проверка здоровья
+        health = await agent.get_health_status()
+        print("Health status:", health)
+        
+        # Пример чата
+        response = await agent.chat_with_ai("Покажи статистику логов за последние 24 часа")
+        print("AI Response:", response["response"])
+        
+        if response["function_called"]:
+            print("Function called:", response["function_called"])
+            print("Function result:", response["function_result"])
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,117 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+
+class TTLCache:
+    """LRU кэш с TTL и объединением одновременных одинаковых запросов (single-flight)"""
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 60):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    def lookup(self, key: str) -> Optional[Any]:
+        """get с учетом в hits/misses — для вызывающих без get_or_compute (потоковый ответ)"""
+        value = self.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any):
+        self.entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        cacheable: Callable[[Any], bool] = lambda value: True
+    ) -> Tuple[Any, bool]:
+        """Значение из кэша или вычисленное; второй элемент — было ли попадание в кэш"""
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value, True
+
+        # Такой же запрос уже выполняется — ждем его результат, а не дублируем вызов
+        if key in self._inflight:
+            self.hits += 1
+            return await asyncio.shield(self._inflight[key]), True
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+            if cacheable(value):
+                self.set(key, value)
+            future.set_result(value)
+            return value, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # помечаем исключение как полученное, если никто не ждал
+            raise
+        finally:
+            del self._inflight[key]
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+def normalize_args(args: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """
+    Аргументы функции в каноническом виде: без пустых значений, строки без пробелов по краям
+    (регистр сохраняется) — значения для ключа кэша и query string
+    """
+    normalized = {}
+    for name, value in (args or {}).items():
+        if value is None or value == "":
+            continue
+        if isinstance(value, bool):
+            value = "true" if value else "false"
+        elif isinstance(value, str):
+            value = value.strip()
+        else:
+            value = str(value)
+        normalized[name] = value
+    return dict(sorted(normalized.items()))
+
+
+def cache_key(*parts: Any) -> str:
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def time_bucket(ttl_seconds: float) -> int:
+    """Номер временного окна: данные в пределах окна считаем одной версией"""
+    return int(time.time() // ttl_seconds)
@@ -0,0 +1,83 @@
+# HTTP сервер LLM агента: обычный чат и потоковый (Server-Sent Events).
+# Запуск: python server.py (порт из AGENT_PORT, по умолчанию 8001)
+import contextlib
+import json
+import os
+from aiohttp import web
+from agent import LLMLogAgent
+
+AGENT_PORT = int(os.getenv("AGENT_PORT", 8001))
+
+# Копия формата из api/chat_stream.py (почему не общий модуль — там же): менять вместе
+SSE_HEADERS = {
+    "Content-Type": "text/event-stream",
+    "Cache-Control": "no-cache",
+    # Отключаем буферизацию в nginx/прокси, иначе токены приходят пачкой в конце
+    "X-Accel-Buffering": "no"
+}
+
+
+def sse_event(event: dict) -> bytes:
+    """Событие в формате SSE: тип в поле event, само событие в data"""
+    data = json.dumps(event, ensure_ascii=False, default=str)
+    return f"event: {event['type']}\ndata: {data}\n\n".encode()
+
+
+async def chat(request: web.Request) -> web.Response:
+    body = await request.json()
+    agent: LLMLogAgent = request.app["agent"]
+    result = await agent.chat_with_ai(body.get("message", ""), body.get("chat_history"))
+    return web.json_response(result, dumps=lambda obj: json.dumps(obj, ensure_ascii=False, default=str))
+
+
+async def chat_stream(request: web.Request) -> web.StreamResponse:
+    body = await request.json()
+    agent: LLMLogAgent = request.app["agent"]
+
+    response = web.StreamResponse(headers=SSE_HEADERS)
+    await response.prepare(request)
+
+    events = agent.chat_with_ai_stream(body.get("message", ""), body.get("chat_history"))
+    try:
+        # aclosing закрывает генератор (и поток к модели) при любом выходе из цикла
+        async with contextlib.aclosing(events):
+            async for event in events:
+                await response.write(sse_event(event))
+    except ConnectionResetError:
+        # Клиент отключился — дальше генерировать ответ некому
+        print("Клиент отключился, генерация остановлена")
+        return response
+
+    await response.write_eof()
+    return response
+
+
+async def health(request: web.Request) -> web.Response:
+    agent: LLMLogAgent = request.app["agent"]
+    return web.json_response({
+        "status": "healthy",
+        "tool_cache": agent.tool_cache.stats(),
+        "completion_cache": agent.completion_cache.stats()
+    })
+
+
+async def on_cleanup(app: web.Application):
+    await app["agent"].close()
+
+
+def create_app() -> web.Application:
+    app = web.Application()
+    app["agent"] = LLMLogAgent(
+        api_url=os.getenv("API_URL", "http://log-api:8000"),
+        openai_api_key=os.getenv("OPENAI_API_KEY", "")
+    )
+    app.router.add_post("/chat", chat)
+    app.router.add_post("/chat/stream", chat_stream)
+    app.router.add_get("/health", health)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+if __name__ == "__main__":
+    # handler_cancellation: при обрыве соединения обработчик отменяется сразу, а не на следующей записи
+    web.run_app(create_app(), port=AGENT_PORT, handler_cancellation=True)
@@ -0,0 +1,116 @@
+# Локальный stub OpenAI-совместимого сервера для разработки и проверки кэша без реальной модели.
+# Запуск: python stub_llm_server.py --port 8099
+# Агент:  OPENAI_BASE_URL=http://localhost:8099/v1 (или openai_base_url=...)
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from aiohttp import web
+
+# Простые правила: на вопросы про статистику/аномалии stub просит вызвать функцию
+FUNCTION_RULES = [
+    ("топ источников", "get_top", {"dimension": "anomaly_source", "time_range": "24h"}),
+    ("статистик", "get_logs_stats", {}),
+    ("инцидент", "search_incidents", {"time_range": "24h"}),
+    ("аномал", "search_anomalies", {"time_range": "24h"}),
+]
+
+stats = {"requests": 0}
+
+
+def _choose_reply(messages):
+    last = messages[-1]
+    if last.get("role") == "function":
+        return {"content": f"Результат функции {last.get('name')}: {last.get('content', '')[:200]}"}
+
+    text = (last.get("content") or "").lower()
+    for keyword, function_name, args in FUNCTION_RULES:
+        if keyword in text:
+            return {"function_call": {"name": function_name, "arguments": json.dumps(args)}}
+    return {"content": f"Stub ответ на: {last.get('content')}"}
+
+
+async def chat_completions(request: web.Request) -> web.Response:
+    stats["requests"] += 1
+    body = await request.json()
+    delay = float(request.app["delay"])
+    if delay:
+        await asyncio.sleep(delay)
+
+    reply = _choose_reply(body.get("messages", []))
+    if body.get("stream"):
+        return await _stream_reply(request, body, reply)
+
+    message = {"role": "assistant", "content": reply.get("content")}
+    if "function_call" in reply:
+        message["function_call"] = reply["function_call"]
+
+    return web.json_response({
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "message": message,
+            "finish_reason": "function_call" if "function_call" in reply else "stop"
+        }],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    })
+
+
+async def _stream_reply(request: web.Request, body: dict, reply: dict) -> web.StreamResponse:
+    """Ответ чанками chat.completion.chunk, как при stream=true у OpenAI"""
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+    def chunk(delta, finish_reason=None):
+        data = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        }
+        return f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode()
+
+    token_delay = float(request.app["token_delay"])
+    if "function_call" in reply:
+        await response.write(chunk({"role": "assistant", "function_call": reply["function_call"]}))
+        await response.write(chunk({}, "function_call"))
+    else:
+        await response.write(chunk({"role": "assistant", "content": ""}))
+        for word in reply["content"].split(" "):
+            if token_delay:
+                await asyncio.sleep(token_delay)
+            await response.write(chunk({"content": word + " "}))
+        await response.write(chunk({}, "stop"))
+
+    await response.write(b"data: [DONE]\n\n")
+    await response.write_eof()
+    return response
+
+
+async def get_stats(request: web.Request) -> web.Response:
+    return web.json_response(stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub OpenAI-compatible server")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--delay", type=float, default=0.5, help="Искусственная задержка ответа, сек")
+    parser.add_argument("--token-delay", type=float, default=0.05, help="Задержка между токенами в потоке, сек")
+    args = parser.parse_args()
+
+    app = web.Application()
+    app["delay"] = args.delay
+    app["token_delay"] = args.token_delay
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_get("/stats", get_stats)
+    web.run_app(app, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,115 @@
 from elasticsearch import AsyncElasticsearch
-from typing import Dict
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Dict, List, Optional
 import json
+import os
 
 class ElasticsearchClient:
-    def __init__(self):
-        self.client = AsyncElasticsearch(["http://elasticsearch:9200"])
+    def __init__(self, client: Optional[Any] = None):
+        # client можно подменить (локальный контейнер OpenSearch/ES или in-process fake для тестов)
+        self.client = client or AsyncElasticsearch([os.getenv("ELASTICSEARCH_HOST", "http://elasticsearch:9200")])
         self.index_prefix = "security-logs"
-    
+        # pit — point-in-time + search_after (Elasticsearch), scroll — для OpenSearch и старых кластеров
+        self.pagination = os.getenv("ES_PAGINATION", "pit")
+
     async def store_log_long_term(self, log_data: Dict):
         """Сохранение лога в Elasticsearch для долгосрочного хранения"""
         index_name = f"{self.index_prefix}-{log_data['timestamp'][:7]}"  # monthly indices
-        
+
         await self.client.index(
             index=index_name,
             document=log_data,
             id=log_data['event_id']
         )
-    
+
     async def query_historical_data(self, query: Dict, size: int = 10000):
         """Запрос исторических данных для ML обучения"""
-        response = await self.client.search(
-            index=f"{self.index_prefix}-*",
-            body=query,
-            size=size
-        )
-        return response['hits']['hits']
+        # Постранично, чтобы не упираться в index.max_result_window
+        results = []
+        async with aclosing(self.iter_historical_data(query.get("query"), page_size=min(size, 5000))) as pages:
+            async for page in pages:
+                results.extend(page)
+                if len(results) >= size:
+                    break
+        return results[:size]
+
+    async def iter_historical_data(
+        self,
+        query: Optional[Dict] = None,
+        page_size: int = 5000,
+        fields: Optional[List[str]] = None,
+        keep_alive: str = "2m",
+        sort_field: str = "timestamp"
+    ) -> AsyncIterator[List[Dict]]:
+        """
+        Потоковое чтение security-logs-* страницами (список _source на страницу).
+        Память ограничена размером страницы, поэтому можно пройти десятки миллионов событий
+        """
+        search_kwargs = {
+            "query": query or {"match_all": {}},
+            "size": page_size,
+            "track_total_hits": False
+        }
+        if fields is not None:
+            search_kwargs["source"] = fields  # проекция — тянем только нужные поля
+
+        if self.pagination == "scroll":
+            pages = self._iter_scroll(search_kwargs, keep_alive)
+        else:
+            pages = self._iter_pit(search_kwargs, keep_alive, sort_field)
+
+        # aclosing — чтобы PIT/scroll закрылся сразу, даже если читатель остановился раньше
+        async with aclosing(pages):
+            async for hits in pages:
+                yield [hit["_source"] for hit in hits]
+
+    async def _iter_pit(self, search_kwargs: Dict, keep_alive: str, sort_field: str):
+        """Point-in-time + search_after: согласованный снимок без ограничения на глубину"""
+        pit = await self.client.open_point_in_time(index=f"{self.index_prefix}-*", keep_alive=keep_alive)
+        pit_id = pit["id"]
+        search_after = None
+        try:
+            while True:
+                kwargs = {
+                    **search_kwargs,
+                    "pit": {"id": pit_id, "keep_alive": keep_alive},
+                    "sort": [
+                        {sort_field: {"order": "asc", "unmapped_type": "date"}},
+                        {"_shard_doc": "asc"}
+                    ]
+                }
+                if search_after is not None:
+                    kwargs["search_after"] = search_after
+
+                response = await self.client.search(**kwargs)
+                hits = response["hits"]["hits"]
+                if not hits:
+                    break
+
+                pit_id = response.get("pit_id", pit_id)
+                search_after = hits[-1]["sort"]
+                yield hits
+
+                if len(hits) < search_kwargs["size"]:
+                    break
+        finally:
+            await self.client.close_point_in_time(id=pit_id)
+
+    async def _iter_scroll(self, search_kwargs: Dict, keep_alive: str):
+        """Scroll API — запасной вариант для OpenSearch"""
+        response = await self.client.search(index=f"{self.index_prefix}-*", scroll=keep_alive, **search_kwargs)
+        scroll_id = response.get("_scroll_id")
+        try:
+            while True:
+                hits = response["hits"]["hits"]
+                if not hits:
+                    break
+                yield hits
+
+                response = await self.client.scroll(scroll_id=scroll_id, scroll=keep_alive)
+                scroll_id = response.get("_scroll_id", scroll_id)
+        finally:
+            if scroll_id:
+                await self.client.clear_scroll(scroll_id=scroll_id)
 
-es_client = ElasticsearchClient()
\ No newline at end of file
+es_client = ElasticsearchClient()